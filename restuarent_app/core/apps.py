@@ -3,4 +3,15 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     name = 'core'
 
+    def ready(self):
+        # the license is verified on first use (core.license_check.LICENSE),
+        # not here: every manage.py command runs ready()
+
+        # balances index receivers (PartyBalance)
+        from . import party_balances  # noqa: F401
+        # recipe editor payload invalidation, flattened BOM refreshes
+        from . import recipes, bom  # noqa: F401
+        # kitchen variance and stock month snapshot invalidation, low-stock set
+        from . import variance, movements, reorder  # noqa: F401
+
 
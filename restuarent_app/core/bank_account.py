@@ -2,11 +2,12 @@
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from django.db.models import Sum, F, Case, When, DecimalField
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
+from django.db.models import F
 from django.contrib import messages
+from decimal import Decimal
 
-from core.models import BankAccount, BankMovement, CashFlow
+from core.models import BankAccount, BankMovement
 from core.forms import BankAccountForm, BankMovementForm
 
 # --------- Bank Accounts ---------
@@ -114,3 +115,98 @@ class BankMovementDeleteView(LoginRequiredMixin, DeleteView):
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, "Movement deleted.")
         return super().delete(request, *args, **kwargs)
+
+
+# --------- Cash Book (till + bank positions per business day) ---------
+
+class CashBookView(LoginRequiredMixin, TemplateView):
+    """Opening / in / out / closing per business day, from core.cashbook snapshots."""
+    template_name = 'bank_accounts/cash_book.html'
+
+    def get_context_data(self, **kwargs):
+        from core import cashbook
+        from core.utils import request_day_range
+
+        ctx = super().get_context_data(**kwargs)
+        start, end = request_day_range(self.request)   # 400 beyond 92 days
+
+        raw = self.request.GET.get('account') or 'cash'
+        account = int(raw) if raw.isdigit() else cashbook.CASH
+
+        rows = cashbook.daily(account, start, end)
+        if rows:
+            opening, closing = rows[0]['opening'], rows[-1]['closing']
+        else:
+            # no cash flows on this account up to `end`
+            opening = closing = cashbook.opening_balances(start).get(account, Decimal('0'))
+        ctx.update({
+            'from': start, 'to': end, 'account': raw,
+            'accounts': BankAccount.objects.order_by('-is_active', 'bank_name', 'name'),
+            'positions': cashbook.positions(start, end),
+            'rows': rows,
+            'total_in': sum((r['cash_in'] for r in rows), Decimal('0')),
+            'total_out': sum((r['cash_out'] for r in rows), Decimal('0')),
+            'opening': opening, 'closing': closing,
+        })
+        return ctx
+
+
+class ShiftCloseView(LoginRequiredMixin, TemplateView):
+    """Day-end cash position of one business day, with its individual cash flows."""
+    template_name = 'bank_accounts/shift_close.html'
+
+    def get_context_data(self, **kwargs):
+        from datetime import datetime, time, timedelta
+        from django.utils import timezone
+        from core import cashbook
+        from core.models import POSSettings
+        from core.utils import request_day
+
+        ctx = super().get_context_data(**kwargs)
+        # bounded, so the previous / next day links cannot overflow
+        day = request_day(self.request, 'day')
+        settings_obj = POSSettings.objects.first()
+        cut = settings_obj.start_of_day_time if settings_obj else time(6, 0)
+        tz = timezone.get_current_timezone()
+        ctx.update({
+            'day': day,
+            'window_start': timezone.make_aware(datetime.combine(day, cut), tz),
+            'window_end': timezone.make_aware(datetime.combine(day + timedelta(days=1), cut), tz),
+            'is_open': day > cashbook.last_closed_day(),
+            'positions': cashbook.positions(day, day),
+            'flows': cashbook.day_flows(day),
+            'prev_day': day - timedelta(days=1),
+            'next_day': day + timedelta(days=1),
+        })
+        return ctx
+
+
+class BankMovementImportView(LoginRequiredMixin, TemplateView):
+    """Upload a CSV bank statement; see core.bank_import for the columns."""
+    template_name = 'bank_movements/bankmovement_import.html'
+
+    def post(self, request, *args, **kwargs):
+        import io
+        from django.shortcuts import redirect
+        from core.bank_import import import_movements
+
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, "Choose a CSV file to import.")
+            return self.get(request, *args, **kwargs)
+
+        skip_invalid = bool(request.POST.get('skip_invalid'))
+        try:
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            result = import_movements(lines, request.user, skip_invalid=skip_invalid)
+        except UnicodeDecodeError:
+            messages.error(request, "The file is not UTF-8 encoded CSV.")
+            return self.get(request, *args, **kwargs)
+
+        if result.errors and not skip_invalid:
+            return self.render_to_response(self.get_context_data(errors=result.errors))
+        messages.success(request, f"{result.created} movement(s) imported"
+                                  + (f", {len(result.errors)} line(s) skipped." if result.errors else "."))
+        if result.errors:
+            return self.render_to_response(self.get_context_data(errors=result.errors))
+        return redirect('bankmovement_list')
@@ -0,0 +1,161 @@
+# core/bank_import.py
+"""
+Bulk import of bank movements (statement lines) from CSV.
+
+Every line is validated first -- the same rules as BankMovement.clean() --
+and then all movements and their paired CashFlow rows are written with
+bulk_create inside one transaction. The hooks that BankMovement.save() and
+CashFlow.save() would have run per row are applied once per import: bank
+account flow balances get one F() update per account and the cash book
+snapshots are dropped from the earliest imported day.
+
+CSV columns (header row required, extra columns ignored):
+    date, type, amount, from_bank, to_bank, method, reference_no, notes
+`type` is a movement type code or label (deposit / "Withdraw (Bank → Cash)");
+banks are matched on id, account number or name.
+"""
+import csv
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .cashbook import business_day_of, invalidate_from
+from .models import BankAccount, BankMovement, CashFlow
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+REQUIRED = ("date", "type", "amount")
+
+ImportResult = namedtuple("ImportResult", "created errors")
+
+
+class BankLookup:
+    """Resolve the bank column of a statement line to a BankAccount."""
+
+    def __init__(self):
+        self.by_key = {}
+        for acc in BankAccount.objects.all():
+            self.by_key.setdefault(str(acc.pk), acc)
+            if acc.account_number:
+                self.by_key.setdefault(acc.account_number.strip().lower(), acc)
+            self.by_key.setdefault(acc.name.strip().lower(), acc)
+            self.by_key.setdefault(str(acc).lower(), acc)
+
+    def __call__(self, raw):
+        raw = (raw or "").strip()
+        if not raw:
+            return None
+        acc = self.by_key.get(raw.lower())
+        if acc is None:
+            raise ValidationError(f"Unknown bank account '{raw}'.")
+        return acc
+
+
+def _types():
+    types = {}
+    for code, label in BankMovement.TYPES:
+        types[code] = code
+        types[label.lower()] = code
+    return types
+
+
+def _date(raw):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw.strip(), fmt).date()
+        except ValueError:
+            continue
+    raise ValidationError(f"Bad date '{raw}'.")
+
+
+def _amount(raw):
+    try:
+        value = Decimal(raw.replace(",", "").strip())
+    except InvalidOperation:
+        raise ValidationError(f"Bad amount '{raw}'.")
+    return value.quantize(Decimal("0.01"))
+
+
+def parse_movements(lines, user):
+    """
+    Validate CSV lines (any iterable of text lines). Returns (movements,
+    errors) where errors is [(line_no, message)]; line numbers count the
+    header as line 1.
+    """
+    reader = csv.DictReader(lines)
+    missing = [c for c in REQUIRED if c not in [f.strip() for f in reader.fieldnames or []]]
+    if missing:
+        return [], [(1, f"Missing column(s): {', '.join(missing)}.")]
+
+    bank, types = BankLookup(), _types()
+    movements, errors = [], []
+    for line_no, row in enumerate(reader, start=2):
+        row = {k.strip(): (v or "") for k, v in row.items() if k}
+        if not any(v.strip() for v in row.values()):
+            continue
+        try:
+            mtype = types.get(row["type"].strip().lower())
+            if mtype is None:
+                raise ValidationError(f"Unknown movement type '{row['type']}'.")
+            m = BankMovement(
+                date=_date(row["date"]), movement_type=mtype, amount=_amount(row["amount"]),
+                from_bank=bank(row.get("from_bank")), to_bank=bank(row.get("to_bank")),
+                method=row.get("method", "").strip()[:30],
+                reference_no=row.get("reference_no", "").strip()[:100],
+                notes=row.get("notes", "").strip()[:255],
+                created_by=user,
+            )
+            m.clean()
+        except ValidationError as e:
+            errors.append((line_no, "; ".join(e.messages)))
+            continue
+        movements.append(m)
+    return movements, errors
+
+
+@transaction.atomic
+def save_movements(movements, batch_size=500):
+    """Insert validated movements plus their CashFlow pairs in batches."""
+    now = timezone.now()
+    flows, pairs = [], []
+    for m in movements:
+        sides = []
+        for kwargs in m.flow_sides():
+            cf = None
+            if kwargs:
+                cf = CashFlow(date=m.date, created_by=m.created_by, created_at=now, **kwargs)
+                cf.business_date = business_day_of(cf)
+                flows.append(cf)
+            sides.append(cf)
+        pairs.append(sides)
+    CashFlow.objects.bulk_create(flows, batch_size=batch_size)
+
+    for m, (out_cf, in_cf) in zip(movements, pairs):
+        m.cashflow_out, m.cashflow_in = out_cf, in_cf
+    BankMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+    # what CashFlow.save() would have done row by row
+    deltas, first_day = defaultdict(Decimal), {}
+    for cf in flows:
+        deltas[cf.bank_account_id] += cf.signed_amount()
+        day = first_day.get(cf.bank_account_id)
+        first_day[cf.bank_account_id] = cf.business_date if day is None else min(day, cf.business_date)
+    for account_id, delta in deltas.items():
+        BankAccount.apply_flow(account_id, delta)
+    for account_id, day in first_day.items():
+        invalidate_from(account_id, day)
+    return len(movements)
+
+
+def import_movements(lines, user, skip_invalid=False, dry_run=False, batch_size=500):
+    """
+    Parse and import a statement. Nothing is written when any line fails
+    unless `skip_invalid` is set, or at all with `dry_run`.
+    """
+    movements, errors = parse_movements(lines, user)
+    if dry_run or (errors and not skip_invalid):
+        return ImportResult(0, errors)
+    return ImportResult(save_movements(movements, batch_size=batch_size), errors)
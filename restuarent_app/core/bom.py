@@ -0,0 +1,329 @@
+# core/bom.py
+"""
+Flattened bills of materials (BomLine).
+
+For every MenuItem with a recipe, and every Deal through its DealItems,
+BomLine stores raw material -> base quantity (g / ml / pcs) per unit sold,
+sub-recipes expanded the way costing reads them:
+
+    raw line        quantity x conversion factor of (raw material, unit)
+    sub-recipe line quantity (base units) / total weight of the sub-recipe
+                    x the sub-recipe's own flattened lines
+    deal            sum of DealItem.quantity x the menu item's lines
+
+Consumers -- stock deduction (OrderItem.update_inventory_usage), costing
+(recipe_cost_and_weight, the cost report, debug_costs) -- read a handful of
+rows and multiply instead of walking recipes and sub-recipes.
+
+Rebuilds are incremental: refresh_recipes() rewrites the menu items of the
+given recipes and of every recipe that uses them as a sub-recipe, then the
+deals selling any of those items; refresh_deals() rewrites single deals.
+The receivers below call them for row-by-row writes (once per batched()
+block); bulk writers (core.recipes.save_recipe_lines, generate_dataset)
+call them themselves.
+`manage.py rebuild_bom` rebuilds everything.
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import (
+    BomLine, DealItem, PurchaseOrderItem, RawMaterialUnitConversion,
+    Recipe, RecipeRawMaterial, RecipeSubRecipe,
+)
+
+logger = logging.getLogger("core.inventory")
+
+ZERO = Decimal("0")
+ONE = Decimal("1")
+PLACES = Decimal("0.000001")
+_state = threading.local()
+
+
+# ---------- flattening (pure) ----------
+
+def flatten(raw_rows, sub_rows, factors):
+    """
+    raw_rows [(recipe_id, raw_material_id, quantity, unit_id)], sub_rows
+    [(recipe_id, sub_recipe_id, quantity)], factors {(raw_material_id,
+    unit_id): to_base_factor} -> function recipe_id -> ({raw_material_id:
+    base quantity}, total weight). A sub-recipe that loops back is skipped.
+    """
+    raw, subs = defaultdict(list), defaultdict(list)
+    for recipe_id, rm_id, qty, unit_id in raw_rows:
+        raw[recipe_id].append((rm_id, Decimal(qty) * Decimal(factors.get((rm_id, unit_id), ONE))))
+    for recipe_id, sub_id, qty in sub_rows:
+        subs[recipe_id].append((sub_id, Decimal(qty)))
+
+    memo = {}
+
+    def walk(recipe_id, path=()):
+        if recipe_id in memo:
+            return memo[recipe_id]
+        lines, weight = defaultdict(Decimal), ZERO
+        for rm_id, base in raw[recipe_id]:
+            lines[rm_id] += base
+            weight += base
+        for sub_id, qty in subs[recipe_id]:
+            if sub_id in path or sub_id == recipe_id:
+                logger.warning("Recipe #%s: sub-recipe #%s loops back, left out of the BOM", recipe_id, sub_id)
+                continue
+            sub_lines, sub_weight = walk(sub_id, path + (recipe_id,))
+            weight += qty
+            if sub_weight:
+                for rm_id, base in sub_lines.items():
+                    lines[rm_id] += base * qty / sub_weight
+        memo[recipe_id] = (lines, weight)
+        return memo[recipe_id]
+
+    return walk
+
+
+class Graph:
+    """Every recipe line and conversion factor, loaded in four flat queries."""
+
+    def __init__(self):
+        self.factors = {(rm, unit): f for rm, unit, f in
+                        RawMaterialUnitConversion.objects.values_list('raw_material_id', 'unit_id', 'to_base_factor')}
+        self.raw_rows = list(RecipeRawMaterial.objects.values_list('recipe_id', 'raw_material_id', 'quantity', 'unit_id'))
+        self.sub_rows = list(RecipeSubRecipe.objects.values_list('recipe_id', 'sub_recipe_id', 'quantity'))
+        self.recipe_items = dict(Recipe.objects.values_list('pk', 'menu_item_id'))
+        self.walk = flatten(self.raw_rows, self.sub_rows, self.factors)
+
+    def users_of(self, recipe_ids):
+        """`recipe_ids` plus every recipe that uses one of them, at any depth."""
+        parents = defaultdict(set)
+        for recipe_id, sub_id, _ in self.sub_rows:
+            parents[sub_id].add(recipe_id)
+        seen, stack = set(recipe_ids), list(recipe_ids)
+        while stack:
+            for parent in parents[stack.pop()]:
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    def recipes_using_materials(self, rm_ids):
+        rm_ids = set(rm_ids)
+        return self.users_of({r for r, rm, _, _ in self.raw_rows if rm in rm_ids})
+
+    def item_lines(self, recipe_id):
+        lines, _ = self.walk(recipe_id)
+        return {rm: q.quantize(PLACES) for rm, q in lines.items() if q}
+
+
+# ---------- writes ----------
+
+def _write_items(graph, menu_item_ids):
+    """Replace the BomLines of `menu_item_ids` (items without a recipe end up with none)."""
+    menu_item_ids = set(menu_item_ids)
+    BomLine.objects.filter(menu_item_id__in=menu_item_ids).delete()
+    rows = [
+        BomLine(menu_item_id=mi, raw_material_id=rm, base_quantity=q)
+        for recipe_id, mi in graph.recipe_items.items() if mi in menu_item_ids
+        for rm, q in graph.item_lines(recipe_id).items()
+    ]
+    BomLine.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+@transaction.atomic
+def refresh_deals(deal_ids):
+    """Rebuild deal lines from their menu items' BomLines (two reads, one delete, one insert)."""
+    deal_ids = set(deal_ids)
+    if not deal_ids:
+        return 0
+    parts = list(DealItem.objects.filter(deal_id__in=deal_ids).values_list('deal_id', 'menu_item_id', 'quantity'))
+    item_lines = defaultdict(list)
+    for mi, rm, q in (BomLine.objects.filter(menu_item_id__in={mi for _, mi, _ in parts})
+                      .values_list('menu_item_id', 'raw_material_id', 'base_quantity')):
+        item_lines[mi].append((rm, q))
+    totals = defaultdict(Decimal)
+    for deal_id, mi, qty in parts:
+        for rm, q in item_lines[mi]:
+            totals[(deal_id, rm)] += q * qty
+    BomLine.objects.filter(deal_id__in=deal_ids).delete()
+    BomLine.objects.bulk_create([BomLine(deal_id=d, raw_material_id=rm, base_quantity=q)
+                                 for (d, rm), q in totals.items() if q], batch_size=1000)
+    return len(totals)
+
+
+@transaction.atomic
+def refresh_recipes(recipe_ids=(), menu_item_ids=(), material_ids=()):
+    """
+    Rebuild the menu items of `recipe_ids`, of recipes using `material_ids`
+    and of every recipe above them; `menu_item_ids` are rebuilt too (e.g. an
+    item whose recipe was deleted or moved). Then their deals follow.
+    """
+    if not (recipe_ids or menu_item_ids or material_ids):
+        return 0
+    graph = Graph()
+    recipes = graph.users_of(set(recipe_ids)) | graph.recipes_using_materials(material_ids)
+    items = {graph.recipe_items[r] for r in recipes if r in graph.recipe_items} | set(menu_item_ids)
+    if not items:
+        return 0
+    written = _write_items(graph, items)
+    refresh_deals(DealItem.objects.filter(menu_item_id__in=items).values_list('deal_id', flat=True).distinct())
+    logger.debug("BOM refreshed for %d menu items (%d lines)", len(items), written)
+    return written
+
+
+@transaction.atomic
+def rebuild_bom():
+    """Recompute every BomLine. Returns the number of menu item lines written."""
+    graph = Graph()
+    BomLine.objects.all().delete()
+    written = _write_items(graph, set(graph.recipe_items.values()))
+    refresh_deals(DealItem.objects.values_list('deal_id', flat=True).distinct())
+    logger.info("BOM rebuilt: %d menu item lines", written)
+    return written
+
+
+@contextmanager
+def batched():
+    """
+    Collect the refreshes the receivers below ask for and run them once on
+    the way out (queryset deletes fire post_delete per row).
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield _state.pending
+        return
+    _state.pending = pending = {'recipes': set(), 'items': set(), 'materials': set(), 'deals': set()}
+    try:
+        yield pending
+    finally:
+        _state.pending = None
+    refresh_recipes(pending['recipes'], pending['items'], pending['materials'])
+    refresh_deals(pending['deals'])
+
+
+def _request(recipes=(), items=(), materials=(), deals=()):
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        if recipes or items or materials:
+            refresh_recipes(recipes, items, materials)
+        if deals:
+            refresh_deals(deals)
+        return
+    pending['recipes'].update(recipes)
+    pending['items'].update(items)
+    pending['materials'].update(materials)
+    pending['deals'].update(deals)
+
+
+# ---------- reads ----------
+
+def lines_for(menu_item_id=None, deal_id=None):
+    """{raw_material_id: base quantity per unit sold} for one menu item or deal."""
+    if deal_id:
+        qs = BomLine.objects.filter(deal_id=deal_id)
+    elif menu_item_id:
+        qs = BomLine.objects.filter(menu_item_id=menu_item_id)
+    else:
+        return {}
+    return dict(qs.values_list('raw_material_id', 'base_quantity'))
+
+
+def stock_unit_factors(rm_ids=None):
+    """{raw_material_id: base units in one of its own (stock) unit}, where a conversion exists."""
+    qs = RawMaterialUnitConversion.objects.filter(unit__symbol=F('raw_material__unit'))
+    if rm_ids is not None:
+        qs = qs.filter(raw_material_id__in=rm_ids)
+    return dict(qs.values_list('raw_material_id', 'to_base_factor'))
+
+
+def cost_per_base(rm_ids=None):
+    """
+    {raw_material_id: average purchase cost per base unit}: total spent over
+    total bought, the bought quantity converted from the material's own unit.
+    One grouped query plus the conversion lookup.
+    """
+    qs = PurchaseOrderItem.objects.all()
+    if rm_ids is not None:
+        qs = qs.filter(raw_material_id__in=rm_ids)
+    spent = (qs.values('raw_material_id')
+             .annotate(cost=Sum(F('quantity') * F('unit_price')), qty=Sum('quantity'))
+             .values_list('raw_material_id', 'cost', 'qty'))
+    factors = stock_unit_factors(rm_ids)
+    out = {}
+    for rm, cost, qty in spent:
+        base = Decimal(qty or 0) * Decimal(factors.get(rm, ONE))
+        out[rm] = Decimal(cost or 0) / base if base else ZERO
+    return out
+
+
+def unit_costs():
+    """
+    ({menu_item_id: cost}, {deal_id: cost}) of one unit sold, for every item
+    and deal with a BOM -- one pass over BomLine.
+    """
+    rows = list(BomLine.objects.values_list('menu_item_id', 'deal_id', 'raw_material_id', 'base_quantity'))
+    prices = cost_per_base()
+    items, deals = defaultdict(Decimal), defaultdict(Decimal)
+    for mi, deal, rm, q in rows:
+        if mi:
+            items[mi] += q * prices.get(rm, ZERO)
+        else:
+            deals[deal] += q * prices.get(rm, ZERO)
+    return dict(items), dict(deals)
+
+
+def item_cost_and_weight(menu_item_id):
+    """(cost, base weight) of one unit of a menu item from its BOM."""
+    lines = lines_for(menu_item_id=menu_item_id)
+    prices = cost_per_base(lines.keys())
+    cost = sum((q * prices.get(rm, ZERO) for rm, q in lines.items()), ZERO)
+    return cost.quantize(Decimal('0.01')), sum(lines.values(), ZERO)
+
+
+# ---------- receivers ----------
+
+def _recipe_line_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _request(recipes=[instance.recipe_id])
+
+
+def _recipe_before(sender, instance, raw=False, **kwargs):
+    instance._bom_menu_item = None
+    if not raw and instance.pk:
+        instance._bom_menu_item = (Recipe.objects.filter(pk=instance.pk)
+                                   .values_list('menu_item_id', flat=True).first())
+
+
+def _recipe_saved(sender, instance, raw=False, **kwargs):
+    old = getattr(instance, '_bom_menu_item', None)
+    if not raw and old and old != instance.menu_item_id:
+        _request(recipes=[instance.pk], items=[old])
+
+
+def _recipe_deleted(sender, instance, **kwargs):
+    _request(items=[instance.menu_item_id])
+
+
+def _deal_item_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _request(deals=[instance.deal_id])
+
+
+def _conversion_changed(sender, instance, raw=False, **kwargs):
+    # new raw materials seed their conversions before any recipe uses them
+    if not raw and RecipeRawMaterial.objects.filter(raw_material_id=instance.raw_material_id).exists():
+        _request(materials=[instance.raw_material_id])
+
+
+for _model in (RecipeRawMaterial, RecipeSubRecipe):
+    post_save.connect(_recipe_line_changed, sender=_model, dispatch_uid=f"bom_line_{_model.__name__}")
+    post_delete.connect(_recipe_line_changed, sender=_model, dispatch_uid=f"bom_line_gone_{_model.__name__}")
+pre_save.connect(_recipe_before, sender=Recipe, dispatch_uid="bom_recipe_before")
+post_save.connect(_recipe_saved, sender=Recipe, dispatch_uid="bom_recipe_saved")
+post_delete.connect(_recipe_deleted, sender=Recipe, dispatch_uid="bom_recipe_gone")
+post_save.connect(_deal_item_changed, sender=DealItem, dispatch_uid="bom_deal_item")
+post_delete.connect(_deal_item_changed, sender=DealItem, dispatch_uid="bom_deal_item_gone")
+post_save.connect(_conversion_changed, sender=RawMaterialUnitConversion, dispatch_uid="bom_conversion")
+post_delete.connect(_conversion_changed, sender=RawMaterialUnitConversion, dispatch_uid="bom_conversion_gone")
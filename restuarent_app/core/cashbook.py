@@ -0,0 +1,219 @@
+# core/cashbook.py
+"""
+Cash book service.
+
+Every CashFlow belongs to an account -- a BankAccount, or the till ("cash")
+when bank_account is empty -- and to a business day, CashFlow.business_date,
+cut at POSSettings.start_of_day_time. Closed business days are cached per
+account in CashDaySnapshot (opening / in / out / closing), so the cash
+position on any date is one snapshot lookup instead of a scan from the first
+cash flow ever recorded:
+
+  * build_snapshots() appends the missing days up to the last closed business
+    day (one grouped aggregate for all accounts);
+  * invalidate_from() drops an account's rows from a day onwards; CashFlow
+    save()/delete() and the BankAccount signal handlers in models.py call it.
+
+Bulk writes (bulk_create, queryset.update/delete) skip those hooks: set
+business_date yourself and call invalidate_from() / clear_snapshots().
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Max, Min, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BankAccount, CashDaySnapshot, CashFlow
+from .utils import get_business_date
+
+ZERO = Decimal("0")
+DEC = DecimalField(max_digits=14, decimal_places=2)
+CASH = None  # account key of the till
+
+IN_SUM = Coalesce(Sum(Case(When(flow_type=CashFlow.IN, then=F("amount")), default=ZERO, output_field=DEC)),
+                  ZERO, output_field=DEC)
+OUT_SUM = Coalesce(Sum(Case(When(flow_type=CashFlow.OUT, then=F("amount")), default=ZERO, output_field=DEC)),
+                   ZERO, output_field=DEC)
+
+
+def business_day_of(flow):
+    """
+    Business day of a cash flow. Entries recorded live (dated the calendar
+    day they were entered on) follow the start-of-day cut, so a 01:00 till
+    payout lands on the previous business day; back-dated entries keep the
+    date they were given.
+    """
+    if flow.created_at is not None:
+        local = timezone.localtime(flow.created_at)
+        if local.date() == flow.date:
+            return get_business_date(local)
+    return flow.date
+
+
+def last_closed_day():
+    return get_business_date() - timedelta(days=1)
+
+
+def _account(qs, account_id, field="bank_account"):
+    if account_id is CASH:
+        return qs.filter(**{f"{field}__isnull": True})
+    return qs.filter(**{field: account_id})
+
+
+# ---------- invalidation ----------
+
+def invalidate_from(account_id, day):
+    if day is not None:
+        _account(CashDaySnapshot.objects.filter(day__gte=day), account_id).delete()
+
+
+def clear_snapshots():
+    CashDaySnapshot.objects.all().delete()
+
+
+# ---------- build ----------
+
+def base_balances():
+    """{account: balance before its first cash flow}; banks start at their opening balance."""
+    base = {CASH: ZERO}
+    base.update(BankAccount.objects.values_list("id", "opening_balance"))
+    return base
+
+
+def build_snapshots(through=None):
+    """
+    Close every business day up to `through` (default and maximum: the last
+    closed business day) for the till and each bank account. Accounts get
+    one row per day from their first cash flow on. Returns rows created.
+    """
+    through = min(through or last_closed_day(), last_closed_day())
+    last = dict(CashDaySnapshot.objects.values("bank_account").annotate(d=Max("day"))
+                .values_list("bank_account", "d"))
+    pending = {acc: d for acc, d in last.items() if d < through}
+    first = (CashFlow.objects.filter(business_date__lte=through)
+             .exclude(bank_account__in=[a for a in last if a is not CASH]))
+    if CASH in last:
+        first = first.filter(bank_account__isnull=False)
+    for acc, d in first.values("bank_account").annotate(d=Min("business_date")).values_list("bank_account", "d"):
+        pending[acc] = d - timedelta(days=1)
+    if not pending:
+        return 0
+
+    base = base_balances()
+    closing = {acc: base.get(acc, ZERO) for acc in pending}
+    for acc, day, amount in (CashDaySnapshot.objects.filter(day__in=set(last.values()))
+                             .values_list("bank_account", "day", "closing")):
+        if acc in pending and last[acc] == day:
+            closing[acc] = amount
+
+    flows = {}
+    for acc, day, cin, cout in (
+        CashFlow.objects
+        .filter(business_date__gt=min(pending.values()), business_date__lte=through)
+        .values("bank_account", "business_date")
+        .annotate(cin=IN_SUM, cout=OUT_SUM)
+        .values_list("bank_account", "business_date", "cin", "cout")
+    ):
+        flows[(acc, day)] = (cin, cout)
+
+    rows = []
+    for acc, after in pending.items():
+        running = closing[acc]
+        day = after + timedelta(days=1)
+        while day <= through:
+            cin, cout = flows.get((acc, day), (ZERO, ZERO))
+            rows.append(CashDaySnapshot(bank_account_id=acc, day=day, opening=running,
+                                        cash_in=cin, cash_out=cout, closing=running + cin - cout))
+            running += cin - cout
+            day += timedelta(days=1)
+    CashDaySnapshot.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# ---------- reads ----------
+
+def opening_balances(day):
+    """{account: balance at the start of business day `day`} for the till and every bank account."""
+    closed = last_closed_day()
+    build_snapshots(through=min(day - timedelta(days=1), closed))
+    balances = base_balances()
+    for acc, amount in (
+        CashDaySnapshot.objects
+        .filter(day=min(day - timedelta(days=1), closed))
+        .values_list("bank_account", "closing")
+    ):
+        balances[acc] = amount
+    # days past the last closed one have no snapshot yet
+    if day > closed + timedelta(days=1):
+        for acc, cin, cout in (
+            CashFlow.objects.filter(business_date__gt=closed, business_date__lt=day)
+            .values("bank_account").annotate(cin=IN_SUM, cout=OUT_SUM)
+            .values_list("bank_account", "cin", "cout")
+        ):
+            balances[acc] = balances.get(acc, ZERO) + cin - cout
+    return balances
+
+
+def positions(start, end):
+    """
+    Cash position of every account over business days start..end:
+    [{account, name, opening, cash_in, cash_out, closing}], till first.
+    """
+    opening = opening_balances(start)
+    moved = {
+        acc: (cin, cout)
+        for acc, cin, cout in (
+            CashFlow.objects.filter(business_date__gte=start, business_date__lte=end)
+            .values("bank_account").annotate(cin=IN_SUM, cout=OUT_SUM)
+            .values_list("bank_account", "cin", "cout")
+        )
+    }
+    names = {CASH: "Cash in hand"}
+    names.update((a.pk, str(a)) for a in BankAccount.objects.order_by("-is_active", "bank_name", "name"))
+    out = []
+    for acc, name in names.items():
+        cin, cout = moved.get(acc, (ZERO, ZERO))
+        out.append({"account": acc, "name": name, "opening": opening.get(acc, ZERO),
+                    "cash_in": cin, "cash_out": cout, "closing": opening.get(acc, ZERO) + cin - cout})
+    return out
+
+
+def daily(account_id, start, end):
+    """
+    One row per business day start..end (no later than today) for one
+    account: closed days come from the snapshots, the open day(s) from a
+    live aggregate.
+    """
+    closed = last_closed_day()
+    build_snapshots(through=min(end, closed))
+    rows = [
+        {"day": s.day, "opening": s.opening, "cash_in": s.cash_in, "cash_out": s.cash_out, "closing": s.closing}
+        for s in _account(CashDaySnapshot.objects.filter(day__gte=start, day__lte=end), account_id).order_by("day")
+    ]
+    # open days run up to today at most: later days have no flows yet
+    end = min(end, get_business_date())
+    if end > closed:
+        first_open = max(start, closed + timedelta(days=1))
+        running = opening_balances(first_open).get(account_id, ZERO)
+        live = dict(
+            (day, (cin, cout))
+            for day, cin, cout in _account(
+                CashFlow.objects.filter(business_date__gte=first_open, business_date__lte=end), account_id)
+            .values("business_date").annotate(cin=IN_SUM, cout=OUT_SUM)
+            .values_list("business_date", "cin", "cout")
+        )
+        day = first_open
+        while day <= end:
+            cin, cout = live.get(day, (ZERO, ZERO))
+            rows.append({"day": day, "opening": running, "cash_in": cin, "cash_out": cout,
+                         "closing": running + cin - cout})
+            running += cin - cout
+            day += timedelta(days=1)
+    return rows
+
+
+def day_flows(day):
+    """The individual cash flows of business day `day` (shift-close listing)."""
+    return (CashFlow.objects.filter(business_date=day)
+            .select_related("bank_account", "created_by").order_by("bank_account_id", "created_at", "id"))
@@ -0,0 +1,124 @@
+# core/consumption.py
+"""
+Theoretical raw material consumption.
+
+"How much of each raw material should we have used?" is a matrix product:
+
+    sold   products x days        one grouped query over OrderItem
+    bom    products x materials   the flattened BomLines (core.bom)
+    usage  materials x days  =  bom.T @ sold
+
+Products are menu items and deals (a deal's BOM already includes its
+items). Days are business days, cut at POSSettings.start_of_day_time, so
+a 01:00 sale counts towards the evening before. Quantities are base units
+(g / ml / pcs), the same units the stock deduction posts.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import DateTimeField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BomLine, OrderItem, RawMaterial
+from .utils import business_day_bounds, start_of_day_time
+
+Consumption = namedtuple("Consumption", "days materials usage")
+Consumption.__doc__ = """
+days      [date] business days, in order
+materials [(id, name, unit)] raw materials used by anything sold
+usage     ndarray (materials x days) of base quantities
+"""
+
+ITEM, DEAL = "item", "deal"
+
+
+def day_range(start_day, end_day):
+    return [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+
+
+def _business_day(field):
+    """SQL expression: the business day of datetime `field`."""
+    cut = start_of_day_time()
+    shift = timedelta(hours=cut.hour, minutes=cut.minute)
+    return TruncDate(ExpressionWrapper(F(field) - Value(shift), output_field=DateTimeField()),
+                     tzinfo=timezone.get_current_timezone())
+
+
+def sold_matrix(start_day, end_day):
+    """
+    (products, days, sold) with products [(ITEM|DEAL, id)] and sold a
+    products x days float matrix -- one grouped query.
+    """
+    days = day_range(start_day, end_day)
+    column = {d: i for i, d in enumerate(days)}
+    start, end = business_day_bounds(start_day, end_day)
+    rows = list(
+        OrderItem.objects
+        .filter(order__created_at__gte=start, order__created_at__lt=end)
+        .annotate(day=_business_day("order__created_at"))
+        .values("menu_item_id", "deal_id", "day")
+        .annotate(qty=Sum("quantity"))
+        .values_list("menu_item_id", "deal_id", "day", "qty")
+    )
+    products, row_of = [], {}
+    for mi, deal, _, _ in rows:
+        key = (DEAL, deal) if deal else (ITEM, mi)
+        if key[1] and key not in row_of:
+            row_of[key] = len(products)
+            products.append(key)
+
+    sold = np.zeros((len(products), len(days)))
+    for mi, deal, day, qty in rows:
+        key = (DEAL, deal) if deal else (ITEM, mi)
+        if key in row_of and day in column:
+            sold[row_of[key], column[day]] += qty
+    return products, days, sold
+
+
+def bom_matrix(products):
+    """(material_ids, bom) with bom a products x materials float matrix of base quantity per unit."""
+    row_of = {key: i for i, key in enumerate(products)}
+    lines = list(
+        BomLine.objects
+        .filter(menu_item_id__in=[pk for kind, pk in products if kind == ITEM])
+        .values_list("menu_item_id", "deal_id", "raw_material_id", "base_quantity")
+    ) + list(
+        BomLine.objects
+        .filter(deal_id__in=[pk for kind, pk in products if kind == DEAL])
+        .values_list("menu_item_id", "deal_id", "raw_material_id", "base_quantity")
+    )
+    material_ids = sorted({rm for _, _, rm, _ in lines})
+    col_of = {rm: j for j, rm in enumerate(material_ids)}
+    bom = np.zeros((len(products), len(material_ids)))
+    for mi, deal, rm, q in lines:
+        bom[row_of[(DEAL, deal) if deal else (ITEM, mi)], col_of[rm]] = float(q)
+    return material_ids, bom
+
+
+def theoretical_usage(start_day, end_day):
+    """Expected use of every raw material per business day start_day..end_day."""
+    products, days, sold = sold_matrix(start_day, end_day)
+    material_ids, bom = bom_matrix(products)
+    usage = bom.T @ sold
+    names = {pk: (name, unit) for pk, name, unit in
+             RawMaterial.objects.filter(pk__in=material_ids).values_list("pk", "name", "unit")}
+    materials = [(pk, *names.get(pk, (f"#{pk}", ""))) for pk in material_ids]
+    # busiest materials first
+    order = np.argsort(-usage.sum(axis=1), kind="stable")
+    return Consumption(days, [materials[i] for i in order], usage[order])
+
+
+def as_json(consumption, places=3):
+    """Plain lists for JsonResponse / templates."""
+    days, materials, usage = consumption
+    return {
+        "days": [d.isoformat() for d in days],
+        "materials": [
+            {"id": pk, "name": name, "unit": unit,
+             "total": round(float(row.sum()), places),
+             "daily": [round(float(v), places) for v in row]}
+            for (pk, name, unit), row in zip(materials, usage)
+        ],
+    }
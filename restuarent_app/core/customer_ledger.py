@@ -0,0 +1,255 @@
+# core/customer_ledger.py
+"""
+Customer (Udhaar) ledger postings.
+
+Credit sales, the cash part paid at the counter, PaymentReceived receipts
+and manual balance adjustments are written to CustomerLedgerEntry together
+with the running balance after each entry. Posting an entry in the middle
+of the history (a back-dated receipt, an edited amount) shifts every later
+balance with one UPDATE, so reads never have to re-walk the history.
+
+The ledger is also the journal behind Customer.current_balance: every
+posting and removal moves it with an F() update in the same transaction,
+so concurrent payments and credit orders cannot lose each other's change.
+Nothing else writes that column.
+
+`rebuild_customer_ledger` recomputes everything from the source tables.
+Adjustments, which have no source table, are kept. The balance carried
+forward at the upgrade (migration 0051) is re-derived: it brings the running
+balance at that point back to what the customer owed then.
+`recalculate_balances` / `verify_balances` check the column against it.
+"""
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Customer, CustomerLedgerEntry, Order, Payment, PaymentReceived
+from .party_balances import muted, sync_customers
+
+logger = logging.getLogger("core.ledger")
+
+ZERO = Decimal('0')
+
+
+def _after(posted_at, pk):
+    return Q(posted_at__gt=posted_at) | Q(posted_at=posted_at, id__gt=pk)
+
+
+def _before(posted_at, pk):
+    return Q(posted_at__lt=posted_at) | Q(posted_at=posted_at, id__lt=pk)
+
+
+def _move_balance(customer_id, delta):
+    if delta:
+        Customer.objects.filter(pk=customer_id).update(current_balance=F('current_balance') + delta)
+
+
+def balance_before(customer_id, posted_at):
+    """Running balance just before `posted_at` (the opening balance of a window)."""
+    bal = (CustomerLedgerEntry.objects
+           .filter(customer_id=customer_id, posted_at__lt=posted_at)
+           .order_by('-posted_at', '-id')
+           .values_list('balance', flat=True)
+           .first())
+    return bal if bal is not None else ZERO
+
+
+def receipt_time(receipt):
+    """PaymentReceived has a business date plus created_at; post it on that date at the entry time."""
+    created = timezone.localtime(receipt.created_at) if receipt.created_at else timezone.localtime()
+    return timezone.make_aware(datetime.combine(receipt.date, created.time()))
+
+
+def order_description(order):
+    names = ", ".join(
+        f"{i.menu_item.name if i.menu_item_id else i.deal.name} x{i.quantity}"
+        for i in order.items.select_related('menu_item', 'deal')
+    )
+    return f"Order #{order.number}: {names}"[:500]
+
+
+@transaction.atomic
+def post_entry(customer_id, posted_at, kind, debit=ZERO, credit=ZERO, description='', order=None, receipt=None):
+    # serialise postings per customer (a no-op on SQLite, which locks the whole db)
+    list(Customer.objects.select_for_update().filter(pk=customer_id).values_list('pk'))
+
+    entry = CustomerLedgerEntry.objects.create(
+        customer_id=customer_id, posted_at=posted_at, kind=kind, order=order, receipt=receipt,
+        description=description, debit=debit, credit=credit,
+    )
+    prev = (CustomerLedgerEntry.objects
+            .filter(_before(posted_at, entry.pk), customer_id=customer_id)
+            .order_by('-posted_at', '-id')
+            .values_list('balance', flat=True)
+            .first()) or ZERO
+    entry.balance = prev + debit - credit
+    CustomerLedgerEntry.objects.filter(pk=entry.pk).update(balance=entry.balance)
+
+    if debit != credit:
+        (CustomerLedgerEntry.objects
+         .filter(_after(posted_at, entry.pk), customer_id=customer_id)
+         .update(balance=F('balance') + (debit - credit)))
+        _move_balance(customer_id, debit - credit)
+    return entry
+
+
+@transaction.atomic
+def remove_entries(entries):
+    """Delete entries and take their effect out of every later balance."""
+    for e in list(entries.order_by('-posted_at', '-id')):
+        delta = e.debit - e.credit
+        if delta:
+            (CustomerLedgerEntry.objects
+             .filter(_after(e.posted_at, e.pk), customer_id=e.customer_id)
+             .update(balance=F('balance') - delta))
+            _move_balance(e.customer_id, -delta)
+        e.delete()
+
+
+# ---------- hooks called from views / models ----------
+
+@transaction.atomic
+def post_order(order, counter_paid=ZERO):
+    """
+    Called when a credit order is paid. Debits the grand total and credits
+    whatever was paid at the counter. Re-posting an order replaces its entries.
+    """
+    remove_entries(CustomerLedgerEntry.objects.filter(order=order))
+    if not order.customer_id or order.status != 'paid':
+        return
+    desc = order_description(order)
+    post_entry(order.customer_id, order.created_at, CustomerLedgerEntry.ORDER,
+               debit=order.grand_total, description=desc, order=order)
+    if counter_paid > 0:
+        post_entry(order.customer_id, order.created_at, CustomerLedgerEntry.COUNTER_PAYMENT,
+                   credit=counter_paid, description=f"Paid at counter for Order #{order.number}", order=order)
+
+
+def unpost_order(order):
+    remove_entries(CustomerLedgerEntry.objects.filter(order=order))
+
+
+@transaction.atomic
+def post_receipt(receipt):
+    """Called from PaymentReceived.save(); replaces any earlier posting of the receipt."""
+    remove_entries(CustomerLedgerEntry.objects.filter(receipt_id=receipt.pk))
+    if not receipt.customer_id:
+        return
+    desc = f"Payment Received ({receipt.get_payment_method_display()}) {receipt.description}".strip()
+    post_entry(receipt.customer_id, receipt_time(receipt), CustomerLedgerEntry.RECEIPT,
+               credit=receipt.amount, description=desc, receipt=receipt)
+
+
+def unpost_receipt(receipt):
+    remove_entries(CustomerLedgerEntry.objects.filter(receipt_id=receipt.pk))
+
+
+def post_adjustment(customer_id, amount, description="Balance adjustment", posted_at=None):
+    """Move a customer's balance by `amount` (positive = they owe more) with a journal entry."""
+    amount = Decimal(amount)
+    if not amount:
+        return None
+    return post_entry(customer_id, posted_at or timezone.now(), CustomerLedgerEntry.ADJUSTMENT,
+                      debit=max(amount, ZERO), credit=max(-amount, ZERO), description=description)
+
+
+def set_balance(customer, target, description="Balance adjusted"):
+    """Bring the balance to `target` (the customer form's balance field) via an adjustment."""
+    stored = Customer.objects.filter(pk=customer.pk).values_list('current_balance', flat=True).first()
+    entry = post_adjustment(customer.pk, Decimal(target) - (stored or ZERO), description)
+    customer.current_balance = target
+    return entry
+
+
+# ---------- balance column vs journal ----------
+
+def journal_balance():
+    """Subquery: sum of the customer's ledger entries (debit - credit)."""
+    return Coalesce(Subquery(
+        CustomerLedgerEntry.objects.filter(customer=OuterRef('pk'))
+        .values('customer').annotate(s=Sum(F('debit') - F('credit'))).values('s')[:1],
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    ), ZERO, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def verify_balances(customer_ids=None):
+    """Customers whose stored current_balance differs from their journal, annotated with `journal`."""
+    qs = Customer.objects.annotate(journal=journal_balance()).exclude(current_balance=F('journal'))
+    if customer_ids is not None:
+        qs = qs.filter(pk__in=customer_ids)
+    return qs.order_by('name')
+
+
+def recalculate_balances(customer_ids=None):
+    """Reset current_balance from the journal: one grouped UPDATE for all customers."""
+    qs = Customer.objects.all()
+    if customer_ids is not None:
+        qs = qs.filter(pk__in=customer_ids)
+    return qs.update(current_balance=journal_balance())
+
+
+# ---------- full rebuild ----------
+
+@transaction.atomic
+def rebuild_customer_ledger(customer_ids=None, batch_size=2000):
+    """
+    Recreate the ledger from orders, counter payments and receipts.
+    Returns the number of entries written.
+    """
+    orders = Order.objects.filter(customer__isnull=False, status='paid')
+    receipts = PaymentReceived.objects.filter(customer__isnull=False)
+    existing = CustomerLedgerEntry.objects.all()
+    if customer_ids is not None:
+        orders = orders.filter(customer_id__in=customer_ids)
+        receipts = receipts.filter(customer_id__in=customer_ids)
+        existing = existing.filter(customer_id__in=customer_ids)
+    kept_kinds = (CustomerLedgerEntry.ADJUSTMENT, CustomerLedgerEntry.OPENING)
+    adjustments = list(existing.filter(kind__in=kept_kinds))
+    with muted():
+        existing.exclude(kind__in=kept_kinds).delete()
+
+    counter = dict(Payment.objects.filter(order__in=orders).values_list('order_id', 'amount'))
+    rows = []   # (customer_id, posted_at, tie-break, entry)
+    for o in orders.prefetch_related('items__menu_item', 'items__deal').iterator(chunk_size=batch_size):
+        names = ", ".join(f"{i.menu_item.name if i.menu_item_id else i.deal.name} x{i.quantity}"
+                          for i in o.items.all())
+        rows.append((o.customer_id, o.created_at, (0, o.pk), CustomerLedgerEntry(
+            customer_id=o.customer_id, posted_at=o.created_at, kind=CustomerLedgerEntry.ORDER,
+            order_id=o.pk, description=f"Order #{o.number}: {names}"[:500], debit=o.grand_total)))
+        paid = counter.get(o.pk) or ZERO
+        if paid > 0:
+            rows.append((o.customer_id, o.created_at, (1, o.pk), CustomerLedgerEntry(
+                customer_id=o.customer_id, posted_at=o.created_at, kind=CustomerLedgerEntry.COUNTER_PAYMENT,
+                order_id=o.pk, description=f"Paid at counter for Order #{o.number}", credit=paid)))
+    for r in receipts.iterator(chunk_size=batch_size):
+        at = receipt_time(r)
+        rows.append((r.customer_id, at, (2, r.pk), CustomerLedgerEntry(
+            customer_id=r.customer_id, posted_at=at, kind=CustomerLedgerEntry.RECEIPT, receipt_id=r.pk,
+            description=f"Payment Received ({r.get_payment_method_display()}) {r.description}".strip(),
+            credit=r.amount)))
+
+    for a in adjustments:
+        rows.append((a.customer_id, a.posted_at, (-1, a.pk), a))
+
+    rows.sort(key=lambda r: (r[0], r[1], r[2]))
+    running, last_customer = ZERO, None
+    for customer_id, _, _, entry in rows:
+        if customer_id != last_customer:
+            running, last_customer = ZERO, customer_id
+        if entry.kind == CustomerLedgerEntry.OPENING:
+            # its stored balance is what the customer owed at the upgrade
+            carried = entry.balance - running
+            entry.debit, entry.credit = max(carried, ZERO), max(-carried, ZERO)
+        running += entry.debit - entry.credit
+        entry.balance = running
+    CustomerLedgerEntry.objects.bulk_create([r[3] for r in rows if r[3].pk is None], batch_size=batch_size)
+    CustomerLedgerEntry.objects.bulk_update(adjustments, ['debit', 'credit', 'balance'], batch_size=batch_size)
+    recalculate_balances(customer_ids)
+    sync_customers(customer_ids)
+    logger.info("Customer ledger rebuilt: %d entries", len(rows))
+    return len(rows)
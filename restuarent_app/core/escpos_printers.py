@@ -187,15 +187,13 @@ def print_bill(order):
 
         data += b"------------------------------\n"
 
-        # (6) Totals
-        subtotal = sum((oi.quantity * float(oi.unit_price)) for oi in order.items.all())
-        discount = float(order.discount or 0)
-        tax_perc = float(order.tax_percentage or 0)
-        service_charge = float(order.service_charge or 0)
-
-        after_discount = max(subtotal - discount, 0)
-        tax_amt = after_discount * (tax_perc / 100)
-        grand_total = after_discount + tax_amt + service_charge
+        # (6) Totals (stored on the order)
+        subtotal = order.subtotal
+        discount = order.discount or 0
+        tax_perc = order.tax_percentage or 0
+        service_charge = order.service_charge or 0
+        tax_amt = order.tax_amount
+        grand_total = order.grand_total
 
         data += f"Subtotal:       ₹{subtotal:,.2f}\n".encode("ascii", "replace")
         data += f"Discount:       ₹{discount:,.2f}\n".encode("ascii", "replace")
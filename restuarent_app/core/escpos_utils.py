@@ -136,19 +136,13 @@ def print_bill(order):
 
         p.text("--------------------------------\n")
 
-        # Subtotal is annotated on the order (assuming you did that in OrderListView)
-        subtotal = getattr(order, "subtotal", None)
-        if subtotal is None:
-            # Fallback: calculate manually
-            subtotal = sum(oi.quantity * oi.unit_price for oi in order.items.all())
-
+        # Totals are stored on the order (Order.set_totals)
+        subtotal = order.subtotal
         discount = order.discount or 0
         tax_perc = order.tax_percentage or 0
         service = order.service_charge or 0
-
-        after_discount = max(subtotal - discount, 0)
-        tax_amount = (after_discount * tax_perc) / 100
-        grand_total = after_discount + tax_amount + service
+        tax_amount = order.tax_amount
+        grand_total = order.grand_total
 
         p.text(f"{'Subtotal:':<20}{subtotal:>10.2f}\n")
         p.text(f"{'Discount:':<20}{discount:>10.2f}\n")
@@ -0,0 +1,200 @@
+# core/instrumentation.py
+"""
+Per-request instrumentation: wall time, DB query count / time and printer
+time for every view, kept in a rolling in-memory ring buffer with per-view
+latency histograms. Requests slower than SLOW_REQUEST_MS get their SQL
+written to the "core.slow_requests" logger.
+
+Settings (all optional):
+    REQUEST_METRICS_BUFFER   ring buffer size            (default 500)
+    SLOW_REQUEST_MS          slow-request threshold, ms  (default 1000)
+    SLOW_REQUEST_MAX_SQL     statements kept per request (default 200)
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+logger = logging.getLogger("core.slow_requests")
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open ended.
+BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_local = threading.local()
+
+
+def _buffer_size():
+    return getattr(settings, "REQUEST_METRICS_BUFFER", 500)
+
+
+def _slow_ms():
+    return getattr(settings, "SLOW_REQUEST_MS", 1000)
+
+
+# ---------- hooks used by other modules ----------
+
+def add_printer_time(ms):
+    """Called by printing.send_to_printer; no-op outside a request."""
+    state = getattr(_local, "state", None)
+    if state is not None:
+        state["printer_ms"] += ms
+
+
+class _QueryCollector:
+    """connection.execute_wrapper hook counting queries and DB time."""
+
+    def __init__(self, state, keep_sql):
+        self.state = state
+        self.keep_sql = keep_sql
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.state["queries"] += 1
+            self.state["db_ms"] += ms
+            if len(self.state["sql"]) < self.keep_sql:
+                self.state["sql"].append((round(ms, 2), sql))
+
+
+# ---------- in-memory store ----------
+
+class RequestMetrics:
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=size)
+        self.views = {}
+
+    def record(self, row):
+        with self.lock:
+            self.recent.append(row)
+
+            v = self.views.get(row["view"])
+            if v is None:
+                v = self.views[row["view"]] = {
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "queries": 0, "db_ms": 0.0, "printer_ms": 0.0,
+                    "histogram": [0] * (len(BUCKETS_MS) + 1),
+                }
+            v["count"] += 1
+            v["total_ms"] += row["wall_ms"]
+            v["max_ms"] = max(v["max_ms"], row["wall_ms"])
+            v["queries"] += row["queries"]
+            v["db_ms"] += row["db_ms"]
+            v["printer_ms"] += row["printer_ms"]
+            for i, bound in enumerate(BUCKETS_MS):
+                if row["wall_ms"] <= bound:
+                    v["histogram"][i] += 1
+                    break
+            else:
+                v["histogram"][-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            recent = list(self.recent)
+            views = {k: dict(v, histogram=list(v["histogram"])) for k, v in self.views.items()}
+
+        by_view = {}
+        for row in recent:
+            by_view.setdefault(row["view"], []).append(row["wall_ms"])
+
+        out = []
+        for name, v in views.items():
+            walls = sorted(by_view.get(name, []))
+            n = v["count"]
+            out.append({
+                "view": name,
+                "count": n,
+                "avg_ms": round(v["total_ms"] / n, 2),
+                "max_ms": round(v["max_ms"], 2),
+                "p50_ms": _pct(walls, 50),
+                "p95_ms": _pct(walls, 95),
+                "avg_queries": round(v["queries"] / n, 1),
+                "avg_db_ms": round(v["db_ms"] / n, 2),
+                "avg_printer_ms": round(v["printer_ms"] / n, 2),
+                "histogram": dict(zip([f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"],
+                                      v["histogram"])),
+            })
+        out.sort(key=lambda r: r["p95_ms"], reverse=True)
+        return {"buffer_size": len(recent), "slow_ms": _slow_ms(), "views": out,
+                "recent": recent[-50:]}
+
+    def reset(self):
+        with self.lock:
+            self.recent.clear()
+            self.views.clear()
+
+
+def _pct(sorted_values, pct):
+    if not sorted_values:
+        return None
+    idx = max(0, -(-pct * len(sorted_values) // 100) - 1)
+    return round(sorted_values[int(idx)], 2)
+
+
+METRICS = RequestMetrics(_buffer_size())
+
+
+# ---------- middleware ----------
+
+class RequestMetricsMiddleware:
+    """Add near the top of MIDDLEWARE so the timing covers the whole stack."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {"queries": 0, "db_ms": 0.0, "printer_ms": 0.0, "sql": []}
+        _local.state = state
+        collector = _QueryCollector(state, getattr(settings, "SLOW_REQUEST_MAX_SQL", 200))
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(collector):
+                response = self.get_response(request)
+        finally:
+            _local.state = None
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or request.path
+        row = {
+            "view": view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "wall_ms": round(wall_ms, 2),
+            "queries": state["queries"],
+            "db_ms": round(state["db_ms"], 2),
+            "printer_ms": round(state["printer_ms"], 2),
+            "at": time.time(),
+        }
+        METRICS.record(row)
+
+        if wall_ms >= _slow_ms():
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries, %.0f ms DB, %.0f ms printer\n%s",
+                request.method, request.path, view, wall_ms, state["queries"],
+                state["db_ms"], state["printer_ms"],
+                "\n".join(f"  [{ms} ms] {sql}" for ms, sql in state["sql"]),
+            )
+        return response
+
+
+# ---------- admin JSON endpoint ----------
+
+def is_admin(user):
+    return user.is_authenticated and (user.is_superuser or getattr(user, "role", None) == "admin")
+
+
+def request_metrics_json(request):
+    if not is_admin(request.user):
+        return JsonResponse({"error": "Admins only."}, status=403)
+    if request.method == "POST" and request.POST.get("reset"):
+        METRICS.reset()
+    return JsonResponse(METRICS.snapshot())
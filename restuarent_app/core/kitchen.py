@@ -4,12 +4,11 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
 from django.shortcuts import redirect, render
-from django.db.models import Sum, Q
+from django.db import transaction
+from django.db.models import Q
 # from django.utils import timezone  # not used here
 
-from core.models import (
-    KitchenVoucher, KitchenVoucherItem, RawMaterial, PurchaseOrderItem
-)
+from core.models import KitchenVoucher, RawMaterial
 from .forms import KitchenVoucherForm, VoucherItemFormSet  # <-- correct import path
 
 
@@ -37,6 +36,16 @@ class KitchenVoucherListView(LoginRequiredMixin, ListView):
         return qs
 
 
+@transaction.atomic
+def _save_voucher(voucher, formset):
+    """Header, then items, then one bulk stock sync -- all or nothing."""
+    voucher.save(sync=False)
+    formset.instance = voucher
+    formset.save()
+    voucher.sync_transactions()
+    return voucher
+
+
 class KitchenVoucherCreateView(LoginRequiredMixin, CreateView):
     model = KitchenVoucher
     form_class = KitchenVoucherForm
@@ -59,18 +68,14 @@ class KitchenVoucherCreateView(LoginRequiredMixin, CreateView):
         return ctx
 
     def form_valid(self, form):
-        # Save parent first (without using super()) so we can control formset behavior
-        self.object = form.save(commit=False)
-        self.object.created_by = self.request.user
-        self.object.save()
-
-        formset = VoucherItemFormSet(self.request.POST, instance=self.object)
-        if formset.is_valid():
-            formset.save()
-            self.object.sync_transactions()
-            return redirect(self.get_success_url())
-        # If formset has errors, re-render with errors visible
-        return self.render_to_response(self.get_context_data(form=form, formset=formset))
+        voucher = form.save(commit=False)
+        voucher.created_by = self.request.user
+        formset = VoucherItemFormSet(self.request.POST, instance=voucher)
+        if not formset.is_valid():
+            # If formset has errors, re-render with errors visible
+            return self.render_to_response(self.get_context_data(form=form, formset=formset))
+        self.object = _save_voucher(voucher, formset)
+        return redirect(self.get_success_url())
 
     def form_invalid(self, form):
         # Ensure formset is present on invalid render
@@ -91,13 +96,12 @@ class KitchenVoucherUpdateView(LoginRequiredMixin, UpdateView):
         return ctx
 
     def form_valid(self, form):
-        self.object = form.save()
-        formset = VoucherItemFormSet(self.request.POST, instance=self.object)
-        if formset.is_valid():
-            formset.save()
-            self.object.sync_transactions()
-            return redirect(self.get_success_url())
-        return self.render_to_response(self.get_context_data(form=form, formset=formset))
+        voucher = form.save(commit=False)
+        formset = VoucherItemFormSet(self.request.POST, instance=voucher)
+        if not formset.is_valid():
+            return self.render_to_response(self.get_context_data(form=form, formset=formset))
+        self.object = _save_voucher(voucher, formset)
+        return redirect(self.get_success_url())
 
     def form_invalid(self, form):
         formset = VoucherItemFormSet(self.request.POST or None, instance=self.object)
@@ -114,76 +118,63 @@ class KitchenVoucherDeleteView(LoginRequiredMixin, DeleteView):
 
 class KitchenStockSummaryView(LoginRequiredMixin, TemplateView):
     """
-    Purchased (PO items) minus Issued to Kitchen plus Returned from Kitchen.
-    Ignores recipe consumption by design; that remains covered by your existing flow.
+    Purchased minus Issued to Kitchen plus Returned from Kitchen, from the
+    stock movement index (core.movements): last month's snapshot plus this
+    month's movements. current_stock (which also carries sales) alongside.
     """
     template_name = 'kitchen/stock_summary.html'
 
     def get_context_data(self, **kwargs):
-        ctx = super().get_context_data(**kwargs)
-
-        # Purchased (sum of PO item quantities)
-        purchased = (
-            PurchaseOrderItem.objects
-            .values('raw_material_id', 'raw_material__name', 'raw_material__unit')
-            .annotate(q=Sum('quantity'))
-        )
-
-        # Issued & Returned via vouchers
-        issued = (
-            KitchenVoucherItem.objects
-            .filter(voucher__vtype='issue')
-            .values('raw_material_id')
-            .annotate(q=Sum('quantity'))
-        )
-        returned = (
-            KitchenVoucherItem.objects
-            .filter(voucher__vtype='return')
-            .values('raw_material_id')
-            .annotate(q=Sum('quantity'))
-        )
-
-        i_map = {r['raw_material_id']: r['q'] or 0 for r in issued}
-        r_map = {r['raw_material_id']: r['q'] or 0 for r in returned}
+        from core.movements import store_balance, totals
 
+        ctx = super().get_context_data(**kwargs)
+        moved = totals()
         rows = []
-        seen_ids = set()
-
-        for p in purchased:
-            rid = p['raw_material_id']
-            seen_ids.add(rid)
-            name = p['raw_material__name']
-            unit = p['raw_material__unit']
-            p_qty = p['q'] or 0
-            i_qty = i_map.get(rid, 0)
-            r_qty = r_map.get(rid, 0)
-            remaining = p_qty - i_qty + r_qty
+        for rid, name, unit, current in RawMaterial.objects.order_by('name').values_list(
+                'id', 'name', 'unit', 'current_stock'):
+            t = moved.get(rid)
             rows.append({
                 'id': rid,
                 'name': name,
                 'unit': unit,
-                'purchased': p_qty,
-                'issued': i_qty,
-                'returned': r_qty,
-                'remaining': remaining,
+                'purchased': t['purchased'] if t else 0,
+                'issued': t['issued'] if t else 0,
+                'returned': t['returned'] if t else 0,
+                'remaining': store_balance(t) if t else 0,
+                'current_stock': current,
             })
+        ctx['rows'] = rows
+        return ctx
 
-        # include materials never purchased (edge case)
-        for rm in RawMaterial.objects.exclude(id__in=seen_ids).values('id', 'name', 'unit'):
-            rows.append({
-                'id': rm['id'],
-                'name': rm['name'],
-                'unit': rm['unit'],
-                'purchased': 0,
-                'issued': 0,
-                'returned': 0,
-                'remaining': 0,
-            })
 
-        # current_stock (your live figure including recipe usage) for comparison
-        cs_map = {rm.id: rm.current_stock for rm in RawMaterial.objects.all()}
-        for r in rows:
-            r['current_stock'] = cs_map.get(r['id'], 0)
+# ------------------- VARIANCE -------------------
 
-        ctx['rows'] = rows
+class KitchenVarianceView(LoginRequiredMixin, TemplateView):
+    """
+    Net kitchen issues against recipe-theoretical use per raw material
+    (core.variance); materials off by more than ?threshold= percent are flagged.
+    """
+    template_name = 'kitchen/variance.html'
+
+    def get_context_data(self, **kwargs):
+        from decimal import Decimal, InvalidOperation
+        from core import variance
+        from core.utils import request_day_range
+
+        ctx = super().get_context_data(**kwargs)
+        # same engine as the consumption report: same 92-day cap (400 beyond)
+        start, end = request_day_range(self.request)
+        try:
+            threshold = abs(Decimal(self.request.GET.get('threshold') or variance.DEFAULT_THRESHOLD))
+        except InvalidOperation:
+            threshold = variance.DEFAULT_THRESHOLD
+        if not threshold.is_finite():   # nan / inf
+            threshold = variance.DEFAULT_THRESHOLD
+
+        rows = variance.daily(start, end, threshold)
+        ctx.update({
+            'from': start, 'to': end, 'threshold': threshold,
+            'materials': variance.summary(rows, threshold),
+            'flagged_days': [r for r in rows if r['flagged']],
+        })
         return ctx
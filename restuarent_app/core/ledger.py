@@ -40,6 +40,14 @@ from .models import (
     Order,           # NEW
     PaymentReceived  # NEW
 )
+from .utils import local_day_bounds
+from .models import CustomerLedgerEntry
+from .customer_ledger import balance_before
+from .supplier_ledger import SupplierLedger, Key, encode_key, decode_key, po_items_payload
+from .payroll import opening_balance as payroll_opening_balance
+from .party_balances import refresh_staff
+from .models import PartyBalance
+from django.http import JsonResponse
 # ---------- Helpers ----------
 
 def dt_from_str(s):
@@ -78,20 +86,8 @@ def safe_net_total(po: PurchaseOrder) -> Decimal:
     return (subtotal + (subtotal * tax / Decimal("100")) - (subtotal * disc / Decimal("100"))).quantize(Decimal("0.01"))
 
 def calculate_order_total(order) -> Decimal:
-    """Helper to calculate Grand Total of a customer order."""
-    # 1. Sum items
-    subtotal = sum(item.quantity * item.unit_price for item in order.items.all())
-    # 2. Apply Discount
-    discount = order.discount or Decimal(0)
-    after_disc = subtotal - discount
-    if after_disc < 0: after_disc = Decimal(0)
-    # 3. Apply Tax
-    tax_p = order.tax_percentage or Decimal(0)
-    tax_amt = (after_disc * tax_p) / Decimal(100)
-    # 4. Apply Service
-    svc = order.service_charge or Decimal(0)
-    
-    return (after_disc + tax_amt + svc).quantize(Decimal("0.01"))
+    """Grand Total of a customer order (stored on the order, see Order.set_totals)."""
+    return order.grand_total
 
 
 def colored_direction(amount: Decimal):
@@ -116,150 +112,129 @@ class LedgerBaseView(TemplateView):
             q_to = timezone.localdate()
         return q_from, q_to, from_start
 
-# ---------- Home (lists suppliers & staff with quick balances) ----------
+# ---------- Home (lists suppliers, customers & staff with quick balances) ----------
 
 class LedgerHomeView(LoginRequiredMixin, TemplateView):
+    """
+    Reads the PartyBalance index (core.party_balances): every party with its
+    balance and last activity, sorted / filtered in the database.
+    """
     template_name = "ledger/ledger_home.html"
 
+    SORTS = {
+        "outstanding": ("-balance", "name"),
+        "advance": ("balance", "name"),
+        "name": ("name",),
+        "recent": (F("last_activity").desc(nulls_last=True), "name"),
+    }
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx["suppliers"] = Supplier.objects.order_by("name")
-        ctx["staff"] = Staff.objects.order_by("full_name")
-        ctx["customers"] = Customer.objects.order_by("name") # Added Customers
+        refresh_staff()   # salary accrual for a new month, if any
+
+        q = (self.request.GET.get("q") or "").strip()
+        sort = self.request.GET.get("sort") or "outstanding"
+        if sort not in self.SORTS:
+            sort = "outstanding"
+        nonzero = self.request.GET.get("nonzero") in ["1", "true", "on"]
+
+        rows = PartyBalance.objects.all()
+        if q:
+            rows = rows.filter(name__icontains=q)
+        if nonzero:
+            rows = rows.exclude(balance=0)
+
+        grouped = {PartyBalance.SUPPLIER: [], PartyBalance.CUSTOMER: [], PartyBalance.STAFF: []}
+        for r in rows.order_by(*self.SORTS[sort]):
+            grouped[r.party_type].append(r)
+
+        ctx["suppliers"] = grouped[PartyBalance.SUPPLIER]
+        ctx["customers"] = grouped[PartyBalance.CUSTOMER]
+        ctx["staff"] = grouped[PartyBalance.STAFF]
+        ctx.update({"q": q, "sort": sort, "nonzero": nonzero})
         return ctx
 
 
 # ---------- Supplier Ledger ----------
 
 class SupplierLedgerView(LoginRequiredMixin, LedgerBaseView):
+    """
+    Purchases (CR), payments (DR) and refunds (CR) for one supplier, via
+    core.supplier_ledger: balances from aggregates, entries keyset-paged,
+    PO line items loaded on expand.
+    """
     template_name = "ledger/supplier_ledger.html"
+    page_size = 50
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         supplier = get_object_or_404(Supplier, pk=kwargs["pk"])
         dfrom, dto, from_start = self.parse_filters(self.request)
+        ledger = SupplierLedger(supplier)
 
-        entries = []
-
-        # 1. Purchases (PO) -> CREDIT (We owe them)
-        # Prefetch items and raw_material to build detailed description strings
-        po_qs = (
-            PurchaseOrder.objects
-            .filter(supplier=supplier)
-            .select_related("supplier")
-            .prefetch_related("items__raw_material")
-            .order_by("created_at")
-        )
-        if dfrom: po_qs = po_qs.filter(created_at__date__gte=dfrom)
-        if dto:   po_qs = po_qs.filter(created_at__date__lte=dto)
-
-        for po in po_qs:
-            nt = safe_net_total(po)
-            # Build detailed description
-            item_details = ", ".join([
-                f"{i.quantity}{i.raw_material.unit} {i.raw_material.name} @{i.unit_price}" 
-                for i in po.items.all()
-            ])
-            desc_str = f"PO #{po.id}: {item_details}" if item_details else f"PO #{po.id}"
-
-            entries.append({
-                "dt": po.created_at,
-                "desc": desc_str,
-                "ref": po.id,
-                "dr": Decimal("0.00"),
-                "cr": nt,
-            })
-
-        # 2. Expenses (Payments TO Supplier) -> DEBIT (We paid them)
-        pay_qs = Expense.objects.filter(
-            Q(supplier=supplier) | Q(purchase_order__supplier=supplier)
-        ).order_by("created_at")
-        if dfrom: pay_qs = pay_qs.filter(created_at__date__gte=dfrom)
-        if dto:   pay_qs = pay_qs.filter(created_at__date__lte=dto)
-
-        for e in pay_qs:
-            label = f"Payment ({e.get_category_display()})"
-            if e.description: label += f" - {e.description}"
-            if e.purchase_order_id: label += f" [Ref PO #{e.purchase_order_id}]"
-            
-            entries.append({
-                "dt": getattr(e, "created_at", None) or datetime.combine(e.date, datetime.min.time()),
-                "desc": label,
-                "ref": e.id,
-                "dr": Decimal(e.amount or 0),
-                "cr": Decimal("0.00"),
-            })
+        start = local_day_bounds(dfrom)[0] if (dfrom and not from_start) else None
+        end = local_day_bounds(dto)[1] if dto else None
 
-        # 3. Payment Received (Refund FROM Supplier) -> CREDIT 
-        # (Treating refund as 'Reverse Payment' or 'Income' which reduces the debit side, 
-        # effectively increasing the balance we owe/offsetting the payment).
-        # Alternatively: It's Money In. Accounting: Supplier Account (Dr), Cash (Cr). 
-        # Wait, if Supplier gives money back, our liability to them DECREASES? No.
-        # Simple Logic: 
-        #   We Buy 1000 (Cr). Bal: 1000 (Owe).
-        #   We Pay 1000 (Dr). Bal: 0.
-        #   We Return Item. They give 200 Cash. 
-        #   This acts like a negative payment. So it should appear on the CREDIT side 
-        #   to balance out the cash we received.
-        recv_qs = PaymentReceived.objects.filter(supplier=supplier, party_type='supplier').order_by('created_at')
-        if dfrom: recv_qs = recv_qs.filter(date__gte=dfrom)
-        if dto:   recv_qs = recv_qs.filter(date__lte=dto)
-        
-        for r in recv_qs:
-            entries.append({
-                "dt": getattr(r, "created_at", None) or datetime.combine(r.date, datetime.min.time()),
-                "desc": f"Refund Received: {r.description}",
-                "ref": r.id,
-                "dr": Decimal("0.00"), 
-                "cr": Decimal(r.amount), # Increases 'payable' balance or offsets previous debit
-            })
+        # Opening Balance: aggregates over everything before the window
+        opening = ledger.balance_before(start) if start else Decimal("0.00")
 
+        after = decode_key(self.request.GET.get("after", ""))
+        entries, has_more = ledger.page(start, end, after=after, size=self.page_size)
 
-        # 4. Opening Balance Logic
-        opening = Decimal("0.00")
-        if not from_start and dfrom:
-            # Purchases before
-            cr_before = sum(safe_net_total(po) for po in PurchaseOrder.objects.filter(supplier=supplier, created_at__date__lt=dfrom))
-            
-            # Refunds before
-            ref_before = PaymentReceived.objects.filter(supplier=supplier, date__lt=dfrom).aggregate(s=Coalesce(Sum('amount'), Decimal('0')))['s']
-            cr_total_before = cr_before + ref_before
-
-            # Payments before
-            dr_before = Decimal(Expense.objects.filter(
-                Q(supplier=supplier) | Q(purchase_order__supplier=supplier),
-                created_at__date__lt=dfrom
-            ).aggregate(s=Coalesce(Sum("amount"), Decimal("0")))["s"])
-            
-            opening = (cr_total_before - dr_before)
-
-        # Sort & Running Balance
-        entries.sort(key=lambda x: x["dt"] or timezone.now())
-        running = opening
+        # Running balance continues from the previous page (aggregate up to the cursor)
+        running = ledger.balance_through(after) if after else opening
+        page_opening = running
         for it in entries:
             running = running + it["cr"] - it["dr"]
             it["bal"] = running
 
+        # Closing Balance: the last page already ends there, otherwise aggregate to the window end
+        closing = running
+        if has_more:
+            closing = ledger.balance_through(Key(end, -1, 0)) if end else ledger.balance_through()
+
         # Color: Positive = We owe them (Red), Negative = Advance (Green)
-        color = "red" if running > 0 else "green"
+        color = "red" if closing > 0 else "green"
+
+        params = self.request.GET.copy()
+        params.pop("after", None)
+        if has_more:
+            nxt = params.copy()
+            nxt["after"] = encode_key(entries[-1]["key"])
+            ctx["next_query"] = nxt.urlencode()
+        ctx["later_page"] = bool(after)
+        ctx["first_query"] = params.urlencode()
 
         ctx.update({
             "supplier": supplier,
             "entries": entries,
             "opening": opening,
-            "closing": running,
+            "page_opening": page_opening,
+            "closing": closing,
             "closing_color": color,
             "from": dfrom,
             "to": dto,
             "from_start": from_start,
         })
         return ctx
+
+
+def supplier_po_items_json(request, pk):
+    """Line items of one purchase order, for the supplier ledger's expand rows."""
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required."}, status=401)
+    po = get_object_or_404(PurchaseOrder, pk=pk)
+    return JsonResponse({"po": po.id, "items": po_items_payload(po)})
     
 
 
 # ---------- Customer Ledger (NEW) ----------
 
 class CustomerLedgerView(LoginRequiredMixin, LedgerBaseView):
+    """
+    Reads CustomerLedgerEntry (see core.customer_ledger): one indexed range
+    scan for the window plus one lookup for the opening balance.
+    """
     template_name = "ledger/customer_ledger.html"
 
     def get_context_data(self, **kwargs):
@@ -267,70 +242,29 @@ class CustomerLedgerView(LoginRequiredMixin, LedgerBaseView):
         customer = get_object_or_404(Customer, pk=kwargs["pk"])
         dfrom, dto, from_start = self.parse_filters(self.request)
 
-        entries = []
-
-        # 1. Orders (Sales) -> DEBIT (They owe us)
-        # Filter: Orders linked to this customer
-        # Note: We need to calculate grand total dynamically as it's not stored as a single db field usually
-        order_qs = (
-            Order.objects
-            .filter(customer=customer)
-            .exclude(status='cancelled') # Safety check
-            .prefetch_related('items')
-            .order_by("created_at")
-        )
-        
-        if dfrom: order_qs = order_qs.filter(created_at__date__gte=dfrom)
-        if dto:   order_qs = order_qs.filter(created_at__date__lte=dto)
-
-        for o in order_qs:
-            g_total = calculate_order_total(o)
-            
-            # Detail string: "Chicken Biryani x2, Coke x1"
-            items_desc = ", ".join([f"{i.menu_item.name if i.menu_item else i.deal.name} x{i.quantity}" for i in o.items.all()])
-            desc = f"Order #{o.number}: {items_desc}"
-
-            entries.append({
-                "dt": o.created_at,
-                "desc": desc,
-                "ref": o.id,
-                "dr": g_total,         # Debit = Receivable
-                "cr": Decimal("0.00"),
-            })
+        entry_qs = CustomerLedgerEntry.objects.filter(customer=customer).order_by("posted_at", "id")
+        if dfrom and not from_start:
+            entry_qs = entry_qs.filter(posted_at__gte=local_day_bounds(dfrom)[0])
+        if dto:
+            entry_qs = entry_qs.filter(posted_at__lt=local_day_bounds(dto)[1])
 
-        # 2. Payments Received (From Customer) -> CREDIT (Reduces balance)
-        pay_qs = PaymentReceived.objects.filter(customer=customer).order_by("created_at")
-        if dfrom: pay_qs = pay_qs.filter(date__gte=dfrom)
-        if dto:   pay_qs = pay_qs.filter(date__lte=dto)
-
-        for p in pay_qs:
-            entries.append({
-                "dt": getattr(p, "created_at", None) or datetime.combine(p.date, datetime.min.time()),
-                "desc": f"Payment Received ({p.get_payment_method_display()}) {p.description}",
-                "ref": p.id,
-                "dr": Decimal("0.00"),
-                "cr": Decimal(p.amount), # Credit = Reduces Receivable
-            })
-
-        # 3. Opening Balance Logic
+        # Opening balance = running balance of the last entry before the window
         opening = Decimal("0.00")
         if not from_start and dfrom:
-            # Sales before
-            orders_before = Order.objects.filter(customer=customer, created_at__date__lt=dfrom).exclude(status='cancelled')
-            dr_before = sum(calculate_order_total(o) for o in orders_before)
-
-            # Payments before
-            cr_before = PaymentReceived.objects.filter(customer=customer, date__lt=dfrom).aggregate(s=Coalesce(Sum('amount'), Decimal('0')))['s']
-            
-            opening = dr_before - cr_before
-
-        # Sort & Running Balance
-        entries.sort(key=lambda x: x["dt"] or timezone.now())
-        running = opening
-        for it in entries:
-            # For Customer: Balance = Debit (Sale) - Credit (Payment)
-            running = running + it["dr"] - it["cr"]
-            it["bal"] = running
+            opening = balance_before(customer.pk, local_day_bounds(dfrom)[0])
+
+        entries = [
+            {
+                "dt": e.posted_at,
+                "desc": e.description,
+                "ref": e.order_id or e.receipt_id,
+                "dr": e.debit,        # Debit = Receivable
+                "cr": e.credit,       # Credit = Reduces Receivable
+                "bal": e.balance,
+            }
+            for e in entry_qs
+        ]
+        running = entries[-1]["bal"] if entries else opening
 
         # Color: Positive = They owe us (Red/Warning), Negative = Advance (Green)
         # (Though usually Receivable is considered Asset, highlighted Red often means "Outstanding Debt" in UI context)
@@ -420,18 +354,10 @@ class StaffLedgerView(LoginRequiredMixin, DetailView):
         if start > end:
             start, end = end, start
 
-        # Opening
+        # Opening: cached month closings (core.payroll), not a walk over the whole tenure
         opening = Decimal("0")
         if not from_start:
-            accr_before = Decimal("0")
-            cur = self._month_start(base_start)
-            first_of_period = self._month_start(start)
-            while cur < first_of_period:
-                accr_before += monthly
-                cur = self._add_month(cur)
-
-            paid_before = pay_base.filter(edate__lt=start).aggregate(s=Sum("amount"))["s"] or Decimal("0")
-            opening = accr_before - paid_before
+            opening = payroll_opening_balance(staff, start)
 
         # Rows in period
         rows = []
@@ -493,9 +419,14 @@ class StaffLedgerView(LoginRequiredMixin, DetailView):
 from django.views.generic import TemplateView
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import RawMaterial, PurchaseOrderItem, KitchenVoucherItem
+from .models import RawMaterial
 
 class RawMaterialLedgerView(TemplateView):
+    """
+    One material's movements from core.movements: the store side (PO
+    receipts, kitchen issues / returns) by default, every movement with
+    ?scope=all. Opening = month snapshot + the movements up to `from`.
+    """
     template_name = 'ledger/raw_material_ledger.html'
 
     def parse_filters(self, request):
@@ -510,49 +441,36 @@ class RawMaterialLedgerView(TemplateView):
         return f, t, from_start
 
     def get_context_data(self, **kwargs):
+        from . import movements
+        from .stock import signed_quantity
+
         ctx = super().get_context_data(**kwargs)
         rm = get_object_or_404(RawMaterial, pk=kwargs['pk'])
         f, t, from_start = self.parse_filters(self.request)
-
-        rows = []
-
-        # Purchases (IN)
-        pos = PurchaseOrderItem.objects.filter(raw_material=rm).select_related('purchase_order').order_by('purchase_order__created_at')
-        if f: pos = pos.filter(purchase_order__created_at__date__gte=f)
-        if t: pos = pos.filter(purchase_order__created_at__date__lte=t)
-        for it in pos:
-            rows.append({'dt': it.purchase_order.created_at, 'desc': f"PO #{it.purchase_order_id}",
-                         'in': it.quantity, 'out': 0})
-
-        # Issues to kitchen (OUT)
-        issues = KitchenVoucherItem.objects.filter(raw_material=rm, voucher__vtype='issue').select_related('voucher').order_by('voucher__date','id')
-        if f: issues = issues.filter(voucher__date__gte=f)
-        if t: issues = issues.filter(voucher__date__lte=t)
-        for it in issues:
-            rows.append({'dt': it.voucher.date, 'desc': f"Issue to Kitchen KV#{it.voucher_id}",
-                         'in': 0, 'out': it.quantity})
-
-        # Returns from kitchen (IN)
-        returns = KitchenVoucherItem.objects.filter(raw_material=rm, voucher__vtype='return').select_related('voucher').order_by('voucher__date','id')
-        if f: returns = returns.filter(voucher__date__gte=f)
-        if t: returns = returns.filter(voucher__date__lte=t)
-        for it in returns:
-            rows.append({'dt': it.voucher.date, 'desc': f"Return from Kitchen KV#{it.voucher_id}",
-                         'in': it.quantity, 'out': 0})
+        scope = 'all' if self.request.GET.get('scope') == 'all' else 'store'
+        sources = None if scope == 'all' else movements.STORE_SOURCES
+        balance = movements.stock_balance if scope == 'all' else movements.store_balance
 
         # Opening (prior to range)
         opening = 0
         if not from_start and f:
-            p_before = PurchaseOrderItem.objects.filter(raw_material=rm, purchase_order__created_at__date__lt=f).aggregate(s=Sum('quantity'))['s'] or 0
-            i_before = KitchenVoucherItem.objects.filter(raw_material=rm, voucher__vtype='issue', voucher__date__lt=f).aggregate(s=Sum('quantity'))['s'] or 0
-            r_before = KitchenVoucherItem.objects.filter(raw_material=rm, voucher__vtype='return', voucher__date__lt=f).aggregate(s=Sum('quantity'))['s'] or 0
-            opening = p_before - i_before + r_before
+            before = movements.totals(before=f, rm_ids=[rm.pk]).get(rm.pk)
+            opening = balance(before) if before else 0
 
-        rows.sort(key=lambda x: x['dt'])
+        rows = []
         run = opening
-        for r in rows:
-            run += (r['in'] - r['out'])
-            r['bal'] = run
+        for m in movements.moves(rm.pk, f, t, sources):
+            qty = signed_quantity(m.transaction_type, m.quantity)
+            stamp = timezone.localtime(m.timestamp) if m.timestamp else None
+            run += qty
+            rows.append({
+                # the time only when the movement was entered on its own date
+                'dt': stamp if stamp and stamp.date() == m.date else m.date,
+                'desc': m.notes or m.get_source_display(),
+                'in': qty if qty > 0 else 0,
+                'out': -qty if qty < 0 else 0,
+                'bal': run,
+            })
 
         ctx.update({
             'rm': rm,
@@ -560,5 +478,6 @@ class RawMaterialLedgerView(TemplateView):
             'opening': opening,
             'closing': run,
             'from': f, 'to': t, 'from_start': from_start,
+            'scope': scope,
         })
         return ctx
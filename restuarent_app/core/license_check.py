@@ -1,6 +1,9 @@
 # core/license_check.py
 
+import functools
 import json
+import logging
+import threading
 import uuid
 import datetime
 import os
@@ -13,6 +16,8 @@ LICENSE_JSON = os.path.join(settings.BASE_DIR, "license.json")
 LICENSE_SIG = os.path.join(settings.BASE_DIR, "license.sig")
 PUB_KEY_PATH = os.path.join(settings.BASE_DIR, "core", "keys", "public_key.pem")
 
+logger = logging.getLogger("core.license")
+
 
 def load_and_verify_license():
     """
@@ -62,6 +67,7 @@ def load_and_verify_license():
     return data
 
 
+@functools.lru_cache(maxsize=1)
 def get_local_macs():
     """
     Return a set of MAC addresses (uppercase) on this machine.
@@ -69,15 +75,17 @@ def get_local_macs():
     mac_int = uuid.getnode()
     mac_hex = f"{mac_int:012X}"
     mac = ":".join(mac_hex[i : i + 2] for i in range(0, 12, 2))
-    print(f"MAC Address found: {mac}")
+    logger.debug("MAC address found: %s", mac)
     return {mac}
 
 
-def is_mac_allowed():
+def is_mac_allowed(lic=None):
     """
-    Load & verify license, then check local MAC against allowed_macs.
+    Load & verify license (unless an already verified one is passed), then
+    check local MAC against allowed_macs.
     """
-    lic = load_and_verify_license()
+    if lic is None:
+        lic = load_and_verify_license()
     allowed = {m.upper() for m in lic.get("allowed_macs", [])}
     local = get_local_macs()
     return bool(True)
@@ -98,11 +106,116 @@ def is_not_expired():
     return datetime.date.today() <= expiry
 
 
+class LicenseService:
+    """
+    Verifies the license once and keeps the outcome in memory.
+
+    The cached result is keyed by the mtimes of license.json, license.sig
+    and the public key, so replacing any of them is picked up on the next
+    check. The first check (normally the first login request) starts a
+    daemon thread that re-checks every LICENSE_RECHECK_SECONDS; management
+    commands that never ask pay for neither. Views and middleware only ever
+    read the cached flag.
+    """
+
+    def __init__(self, paths, recheck_seconds=300):
+        self.paths = tuple(paths)
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        self._key = None
+        self._authorized = False
+        self._message = "License not checked yet."
+        self._license = None
+        self._checked_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def _file_key(self):
+        key = []
+        for path in self.paths:
+            try:
+                key.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+    def refresh(self, force=False):
+        """Re-verify if any license file changed (or when forced)."""
+        key = self._file_key()
+        if not force and key == self._key:
+            return self._authorized
+        with self._lock:
+            if not force and key == self._key:
+                return self._authorized
+            try:
+                lic = load_and_verify_license()
+                authorized = is_mac_allowed(lic)
+                message = "" if authorized else "MAC address not authorized."
+            except RuntimeError as e:
+                lic, authorized, message = None, False, str(e)
+            if not authorized:
+                logger.warning("License check failed: %s", message)
+            self._license = lic
+            self._authorized = authorized
+            self._message = message
+            self._checked_at = datetime.datetime.now()
+            self._key = key
+        return authorized
+
+    def is_authorized(self):
+        if not self._started:
+            self.start()
+        return self._authorized
+
+    def status(self):
+        """(authorized, message) from the cache."""
+        authorized = self.is_authorized()
+        return authorized, self._message
+
+    @property
+    def license(self):
+        return self._license
+
+    def start(self):
+        """Verify now and start the background re-check thread (idempotent)."""
+        with self._start_lock:
+            if self._started:
+                return
+            self.refresh(force=True)
+            if self.recheck_seconds:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="license-recheck", daemon=True)
+                self._thread.start()
+            self._started = True
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.recheck_seconds):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Background license re-check failed")
+
+
+LICENSE = LicenseService(
+    (LICENSE_JSON, LICENSE_SIG, PUB_KEY_PATH),
+    recheck_seconds=getattr(settings, "LICENSE_RECHECK_SECONDS", 300),
+)
+
+
+def is_authorized():
+    """Cheap in-memory check for views and middleware."""
+    return LICENSE.is_authorized()
+
+
 def enforce_authorization(request):
-    print(f"Hello: {get_local_macs()}")
-    if not is_mac_allowed():
-        print("mac rise")
-        raise RuntimeError("MAC address not authorized.")
+    authorized, message = LICENSE.status()
+    if not authorized:
+        raise RuntimeError(message)
     # if not is_not_expired():
     #     print("expiry rise")
     #     raise RuntimeError("Software license has expired.")
@@ -0,0 +1,91 @@
+# core/logconfig.py
+"""
+Non-blocking JSON logging.
+
+Views only ever put records on an in-memory queue (QueueHandler); a single
+background QueueListener thread formats them as JSON lines and writes them
+to a rotating file (and optionally the console). A slow or blocked Windows
+console therefore never stalls a request.
+
+Wired up from settings.LOGGING; subsystem loggers are
+core.printing, core.orders, core.tokens, core.inventory, core.ledger,
+core.license and core.slow_requests.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+# attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that owns its QueueListener and target handlers, so it can
+    be declared as a single handler in settings.LOGGING (dictConfig on
+    Python < 3.12 cannot wire a listener itself).
+    """
+
+    def __init__(self, filename=None, max_bytes=5 * 1024 * 1024, backup_count=5, console=False):
+        super().__init__(queue.SimpleQueue())
+        formatter = JsonFormatter()
+        targets = []
+        if filename:
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            fh = logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+            targets.append(fh)
+        if console or not targets:
+            targets.append(logging.StreamHandler())
+        for h in targets:
+            h.setFormatter(formatter)
+
+        self.listener = logging.handlers.QueueListener(self.queue, *targets, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self._stop_listener)
+
+    def _stop_listener(self):
+        # QueueListener.stop() is not idempotent
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        # Resolve the message now (args may be mutable objects) but keep the
+        # record structured: the JSON formatting happens on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        self._stop_listener()
+        super().close()
@@ -0,0 +1,24 @@
+# core/management/commands/audit_bank_balances.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import BankAccount
+
+
+class Command(BaseCommand):
+    help = "Compare each bank account's stored flow balance with its CashFlow aggregate (and optionally repair it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched balances')
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            bad = BankAccount.audit_balances(fix=opts['fix'])
+        for acc, stored, actual in bad:
+            self.stdout.write(f"  {acc}: stored {stored}, cash flows say {actual}")
+        if not bad:
+            self.stdout.write(self.style.SUCCESS("✅  All bank balances match their cash flows."))
+        elif opts['fix']:
+            self.stdout.write(self.style.SUCCESS(f"✅  {len(bad)} bank balance(s) repaired."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(bad)} mismatched; re-run with --fix to repair."))
@@ -0,0 +1,58 @@
+# core/management/commands/backfill_order_totals.py
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, F, DecimalField
+
+from core.models import Order, OrderItem
+
+TOTAL_FIELDS = ['subtotal', 'tax_amount', 'grand_total']
+
+
+class Command(BaseCommand):
+    help = ("Recompute the stored Order.subtotal / tax_amount / grand_total columns from order items. "
+            "Migration 0044 fills them on upgrade; this is for repairs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--only-missing', action='store_true',
+                            help='Only orders whose grand_total is still 0')
+
+    def handle(self, *args, **opts):
+        batch = opts['batch_size']
+        qs = Order.objects.order_by('id')
+        if opts['only_missing']:
+            qs = qs.filter(grand_total=0)
+
+        line_total = Sum(F('quantity') * F('unit_price'),
+                         output_field=DecimalField(max_digits=12, decimal_places=2))
+        last_id, done, changed = 0, 0, 0
+        while True:
+            orders = list(
+                qs.filter(id__gt=last_id)
+                .only('id', 'discount', 'tax_percentage', 'service_charge', *TOTAL_FIELDS)[:batch]
+            )
+            if not orders:
+                break
+            last_id = orders[-1].id
+            ids = [o.id for o in orders]
+            sums = dict(
+                OrderItem.objects.filter(order_id__in=ids)
+                .values_list('order_id').annotate(s=line_total)
+            )
+
+            dirty = []
+            for o in orders:
+                before = (o.subtotal, o.tax_amount, o.grand_total)
+                o.set_totals(sums.get(o.id) or Decimal('0'), save=False)
+                if (o.subtotal, o.tax_amount, o.grand_total) != before:
+                    dirty.append(o)
+            with transaction.atomic():
+                Order.objects.bulk_update(dirty, TOTAL_FIELDS, batch_size=batch)
+
+            done += len(orders)
+            changed += len(dirty)
+            self.stdout.write(f"  {done} orders checked, {changed} updated")
+
+        self.stdout.write(self.style.SUCCESS(f"✅  Order totals backfilled ({changed} of {done} changed)."))
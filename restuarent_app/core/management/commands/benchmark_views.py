@@ -0,0 +1,215 @@
+# core/management/commands/benchmark_views.py
+import json
+import math
+import statistics
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    MenuItem, TableSession, TableMenuItem, Customer, Supplier, Staff,
+)
+
+User = get_user_model()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (no interpolation; fine for small samples)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class QueryCounter:
+    """connection.execute_wrapper hook; unlike CaptureQueriesContext it is
+    not capped by the 9000-entry debug query log."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the hot views (order create, table token print, order list, reports, "
+        "ledgers, cost report) through the test client and report p50/p95 latency "
+        "and query counts. Writes are rolled back. Run generate_dataset first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--username', help='User to log in as (default: first superuser)')
+        parser.add_argument('--only', help='Comma separated scenario names to run')
+        parser.add_argument('--printer', action='store_true',
+                            help='Send tokens/bills to the real printer instead of discarding them')
+        parser.add_argument('--save', help='Write results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against a JSON file written by --save')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown vs baseline as a fraction (default 0.25)')
+
+    def handle(self, *args, **opts):
+        user = self.get_user(opts.get('username'))
+        self.client = Client()
+        self.client.force_login(user)
+        self.today = timezone.localdate()
+
+        scenarios = self.scenarios()
+        if opts.get('only'):
+            wanted = {s.strip() for s in opts['only'].split(',') if s.strip()}
+            unknown = wanted - set(scenarios)
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}. "
+                                   f"Available: {', '.join(scenarios)}")
+            scenarios = {k: v for k, v in scenarios.items() if k in wanted}
+
+        patcher = None
+        if not opts['printer']:
+            patcher = mock.patch('core.views.send_to_printer', lambda *a, **k: None)
+            patcher.start()
+        try:
+            results = {}
+            for name, (fn, writes) in scenarios.items():
+                if fn is None:
+                    self.stdout.write(self.style.WARNING(f"{name:<22} skipped (no data)"))
+                    continue
+                results[name] = self.run_scenario(fn, writes, opts['warmup'], opts['iterations'])
+        finally:
+            if patcher:
+                patcher.stop()
+
+        self.report(results)
+
+        if opts.get('save'):
+            with open(opts['save'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Saved results to {opts['save']}")
+
+        if opts.get('baseline'):
+            self.compare(results, opts['baseline'], opts['tolerance'])
+
+    # ------------------------------------------------------------------
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User '{username}' not found")
+        user = User.objects.filter(is_superuser=True).first() or User.objects.first()
+        if not user:
+            raise CommandError("No users in the database; run generate_dataset or createsuperuser first")
+        return user
+
+    def scenarios(self):
+        """name -> (callable returning a response, performs writes?)"""
+        month_ago = self.today - timedelta(days=30)
+        quarter_ago = self.today - timedelta(days=90)
+
+        menu = list(MenuItem.objects.filter(is_available=True).values('id', 'price')[:50])
+        session = TableSession.objects.order_by('id').first()
+        customer = (Customer.objects.annotate(n=Count('orders')).order_by('-n').first())
+        supplier = (Supplier.objects.annotate(n=Count('purchase_orders')).order_by('-n').first())
+        staff = Staff.objects.order_by('id').first()
+
+        def order_create():
+            items = [{"type": "menu", "menu_item_id": m['id'], "quantity": 2,
+                      "unit_price": str(m['price'])} for m in menu[:3]]
+            payload = {"items": items, "action": "paid", "payment_method": "cash"}
+            return self.client.post(reverse('order_create'), data=json.dumps(payload),
+                                    content_type='application/json')
+
+        def print_token():
+            now = timezone.now()
+            for m in menu[:2]:
+                TableMenuItem.objects.create(session=session, source_type='menu', source_id=m['id'],
+                                             quantity=2, unit_price=m['price'],
+                                             created_at=now, updated_at=now)
+            return self.client.post(reverse('print_token', args=[session.table_id]))
+
+        def get(url, **params):
+            return lambda: self.client.get(url, params)
+
+        ledger_range = {'from': quarter_ago.isoformat(), 'to': self.today.isoformat()}
+        return {
+            'order_create': (order_create if menu else None, True),
+            'table_print_token': (print_token if (menu and session) else None, True),
+            'order_list': (get(reverse('order_list')), False),
+            'order_list_30d': (get(reverse('order_list'),
+                                   date_from=f"{month_ago}T00:00", date_to=f"{self.today}T23:59"), False),
+            'reports_overview': (get(reverse('reports')), False),
+            'ledger_home': (get(reverse('ledger_home')), False),
+            'ledger_customer': (get(reverse('ledger_customer', args=[customer.pk]), **ledger_range)
+                                if customer else None, False),
+            'ledger_supplier': (get(reverse('ledger_supplier', args=[supplier.pk]), **ledger_range)
+                                if supplier else None, False),
+            'ledger_staff': (get(reverse('ledger_staff', args=[staff.pk]), **ledger_range)
+                             if staff else None, False),
+            'cost_report': (get(reverse('cost_report')), False),
+        }
+
+    def run_scenario(self, fn, writes, warmup, iterations):
+        timings, queries, statuses = [], [], set()
+        for i in range(warmup + iterations):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                if writes:
+                    with transaction.atomic():
+                        resp = fn()
+                        transaction.set_rollback(True)
+                else:
+                    resp = fn()
+                elapsed = (time.perf_counter() - start) * 1000
+            if i < warmup:
+                continue
+            timings.append(elapsed)
+            queries.append(counter.count)
+            statuses.add(resp.status_code)
+        return {
+            'n': len(timings),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'max_ms': round(max(timings), 2) if timings else 0.0,
+            'queries': int(statistics.median(queries)) if queries else 0,
+            'max_queries': max(queries) if queries else 0,
+            'status': sorted(statuses),
+        }
+
+    def report(self, results):
+        header = f"{'scenario':<22}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'queries':>9}  status"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, r in results.items():
+            line = (f"{name:<22}{r['n']:>5}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                    f"{r['max_ms']:>10.1f}{r['queries']:>9}  {','.join(map(str, r['status']))}")
+            bad = any(s >= 400 for s in r['status'])
+            self.stdout.write(self.style.ERROR(line) if bad else line)
+
+    def compare(self, results, path, tolerance):
+        with open(path) as fh:
+            baseline = json.load(fh)
+        problems = []
+        for name, r in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            if r['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                problems.append(f"{name}: p95 {r['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+            if r['queries'] > base['queries']:
+                problems.append(f"{name}: {r['queries']} queries vs baseline {base['queries']}")
+        if problems:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
@@ -0,0 +1,428 @@
+# core/management/commands/generate_dataset.py
+import random
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Sum, Case, When, F, DecimalField
+from django.utils import timezone
+
+from core.customer_ledger import rebuild_customer_ledger
+from core.party_balances import rebuild_party_balances
+from core.cashbook import clear_snapshots
+from core import movements, reorder
+from core.bom import rebuild_bom
+from core.models import (
+    Unit, Supplier, RawMaterial, RawMaterialUnitConversion, DEFAULT_FACTORS,
+    Category, MenuItem, Deal, DealItem, Recipe, RecipeRawMaterial, RecipeSubRecipe,
+    Table, TableSession, Waiter, Customer, Staff, BankAccount,
+    Order, OrderItem, Payment, PurchaseOrder, PurchaseOrderItem, InventoryTransaction,
+    KitchenVoucher, KitchenVoucherItem, Expense, ExpenseCategory, CashFlow, PaymentReceived,
+    StaffMonthBalance,
+)
+
+User = get_user_model()
+
+D2 = Decimal('0.01')
+
+
+def q2(v):
+    return Decimal(v).quantize(D2, rounding=ROUND_HALF_UP)
+
+
+@contextmanager
+def manual_timestamps(*fields):
+    """
+    bulk_create runs pre_save, so auto_now_add would stamp every row with
+    "now". Switch it off while we write back-dated rows.
+    """
+    saved = [(f, f.auto_now_add) for f in fields]
+    for f, _ in saved:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, v in saved:
+            f.auto_now_add = v
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic restaurant dataset (menu, recipes, orders, POs, "
+        "kitchen vouchers, expenses) at a configurable scale for benchmarking."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=730, help='History length in days (default 730)')
+        parser.add_argument('--orders', type=int, default=500000, help='Total orders to create')
+        parser.add_argument('--menu-items', type=int, default=300)
+        parser.add_argument('--deals', type=int, default=50)
+        parser.add_argument('--raw-materials', type=int, default=250)
+        parser.add_argument('--suppliers', type=int, default=40)
+        parser.add_argument('--customers', type=int, default=300)
+        parser.add_argument('--staff', type=int, default=25)
+        parser.add_argument('--tables', type=int, default=30)
+        parser.add_argument('--pos-per-day', type=int, default=3, help='Purchase orders per day')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='SYN',
+                            help='Prefix for generated names and order numbers (keeps them apart from real data)')
+
+    def handle(self, *args, **opts):
+        if opts['days'] < 1 or opts['orders'] < 0:
+            raise CommandError("--days must be >= 1 and --orders >= 0")
+
+        self.rng = random.Random(opts['seed'])
+        self.opts = opts
+        self.prefix = opts['prefix']
+        self.batch = opts['batch_size']
+        self.tz = timezone.get_current_timezone()
+
+        self.user = User.objects.filter(is_superuser=True).first()
+        if not self.user:
+            self.user, _ = User.objects.get_or_create(
+                username=f"{self.prefix.lower()}_admin", defaults={'role': 'admin'})
+
+        with transaction.atomic():
+            self.build_master_data()
+        self.stdout.write(self.style.SUCCESS(
+            f"Master data: {len(self.materials)} raw materials, {len(self.menu_items)} menu items, "
+            f"{len(self.deals)} deals, {len(self.recipes)} recipes"))
+
+        self.build_history()
+        self.finalise_balances()
+        self.stdout.write(self.style.SUCCESS("✅  Dataset generated."))
+
+    # ------------------------------------------------------------------
+    # Master data
+    # ------------------------------------------------------------------
+    def build_master_data(self):
+        rng, p = self.rng, self.prefix
+        o = self.opts
+
+        for symbol, name, utype in [('g', 'Gram', 'mass'), ('kg', 'Kilogram', 'mass'),
+                                    ('ml', 'Milliliter', 'volume'), ('l', 'Liter', 'volume'),
+                                    ('pc', 'Piece', 'count')]:
+            Unit.objects.get_or_create(symbol=symbol, defaults={'name': name, 'unit_type': utype})
+        units = {u.symbol: u for u in Unit.objects.all()}
+        self.unit_g = units['g']
+
+        self.suppliers = Supplier.objects.bulk_create([
+            Supplier(name=f"{p} Supplier {i + 1}", contact_number=f"0300{i:07d}") for i in range(o['suppliers'])
+        ])
+
+        stock_units = ['kg', 'kg', 'kg', 'l', 'pc']
+        self.materials = RawMaterial.objects.bulk_create([
+            RawMaterial(
+                name=f"{p} Material {i + 1}",
+                unit=rng.choice(stock_units),
+                reorder_level=Decimal(rng.randint(2, 40)),
+                supplier=rng.choice(self.suppliers),
+            )
+            for i in range(o['raw_materials'])
+        ], batch_size=self.batch)
+        # bulk_create skips the seed_unit_conversions signal
+        RawMaterialUnitConversion.objects.bulk_create([
+            RawMaterialUnitConversion(raw_material=rm, unit=units[s], to_base_factor=f)
+            for rm in self.materials
+            for s, f in DEFAULT_FACTORS.items() if s in units
+        ], batch_size=self.batch)
+        self.material_price = {rm.id: Decimal(rng.randint(50, 2500)) for rm in self.materials}
+
+        categories = Category.objects.bulk_create([
+            Category(name=f"{p} Category {i + 1}", rank=i) for i in range(12)
+        ])
+        self.menu_items = MenuItem.objects.bulk_create([
+            MenuItem(
+                category=rng.choice(categories),
+                name=f"{p} Item {i + 1}",
+                price=Decimal(rng.randrange(150, 3000, 10)),
+                rank=i,
+            )
+            for i in range(o['menu_items'])
+        ], batch_size=self.batch)
+
+        self.deals = Deal.objects.bulk_create([
+            Deal(name=f"{p} Deal {i + 1}", price=Decimal(rng.randrange(800, 6000, 50)), rank=i)
+            for i in range(o['deals'])
+        ])
+        DealItem.objects.bulk_create([
+            DealItem(deal=d, menu_item=mi, quantity=rng.randint(1, 3))
+            for d in self.deals
+            for mi in rng.sample(self.menu_items, min(len(self.menu_items), rng.randint(2, 4)))
+        ], batch_size=self.batch)
+
+        # ~80% of menu items get a recipe; some reuse an earlier recipe as a sub-recipe
+        with_recipe = [mi for mi in self.menu_items if rng.random() < 0.8]
+        self.recipes = Recipe.objects.bulk_create([
+            Recipe(menu_item=mi, name=f"Recipe {mi.name}") for mi in with_recipe
+        ], batch_size=self.batch)
+        lines, subs = [], []
+        for idx, rec in enumerate(self.recipes):
+            for rm in rng.sample(self.materials, min(len(self.materials), rng.randint(3, 8))):
+                lines.append(RecipeRawMaterial(recipe=rec, raw_material=rm,
+                                               quantity=Decimal(rng.randint(5, 400)), unit=self.unit_g))
+            if idx > 0 and rng.random() < 0.1:
+                # only point backwards so the graph stays acyclic
+                subs.append(RecipeSubRecipe(recipe=rec, sub_recipe=self.recipes[rng.randrange(idx)],
+                                            quantity=Decimal(rng.randint(50, 300)), unit=self.unit_g))
+        RecipeRawMaterial.objects.bulk_create(lines, batch_size=self.batch)
+        RecipeSubRecipe.objects.bulk_create(subs, batch_size=self.batch)
+
+        start_no = (Table.objects.aggregate(m=Max('number'))['m'] or 0) + 1
+        self.tables = Table.objects.bulk_create([
+            Table(number=start_no + i) for i in range(o['tables'])
+        ])
+        TableSession.objects.bulk_create([TableSession(table=t) for t in self.tables])
+
+        self.waiters = Waiter.objects.bulk_create([Waiter(name=f"{p} Waiter {i + 1}") for i in range(10)])
+        self.customers = Customer.objects.bulk_create([
+            Customer(name=f"{p} Customer {i + 1}", phone=f"{p}-{i:07d}") for i in range(o['customers'])
+        ], batch_size=self.batch)
+        first_day = timezone.localdate() - timedelta(days=o['days'] - 1)
+        self.staff = Staff.objects.bulk_create([
+            Staff(full_name=f"{p} Staff {i + 1}", role='helper', joined_on=first_day,
+                  salary_start=first_day, monthly_salary=Decimal(rng.randrange(25000, 90000, 1000)))
+            for i in range(o['staff'])
+        ])
+        self.banks = BankAccount.objects.bulk_create([
+            BankAccount(name=f"{p} Current A/C", bank_name="HBL", opening_balance=Decimal('500000')),
+            BankAccount(name=f"{p} Savings A/C", bank_name="MCB", opening_balance=Decimal('250000')),
+        ])
+
+        # popularity skew: a few items sell most of the volume
+        self.item_weights = [1.0 / (i + 1) ** 0.8 for i in range(len(self.menu_items))]
+        self.rng.shuffle(self.item_weights)
+
+    # ------------------------------------------------------------------
+    # History (one transaction per business day)
+    # ------------------------------------------------------------------
+    def build_history(self):
+        o, rng = self.opts, self.rng
+        days = o['days']
+        weights = [1.4 if (timezone.localdate() - timedelta(days=d)).weekday() >= 4 else 1.0
+                   for d in range(days)]
+        scale = o['orders'] / sum(weights) if weights else 0
+        per_day = [int(w * scale * rng.uniform(0.8, 1.2)) for w in weights]
+        per_day[0] += o['orders'] - sum(per_day)  # land on the exact total
+        per_day[0] = max(per_day[0], 0)
+
+        self.credit = {}          # customer_id -> outstanding
+        ts_fields = [Order._meta.get_field('created_at'),
+                     PurchaseOrder._meta.get_field('created_at'),
+                     InventoryTransaction._meta.get_field('timestamp'),
+                     KitchenVoucher._meta.get_field('created_at'),
+                     Expense._meta.get_field('created_at'),
+                     PaymentReceived._meta.get_field('created_at')]
+
+        with manual_timestamps(*ts_fields):
+            for back in range(days - 1, -1, -1):
+                day = timezone.localdate() - timedelta(days=back)
+                with transaction.atomic():
+                    self.make_orders(day, per_day[back])
+                    self.make_purchases(day)
+                    self.make_vouchers(day)
+                    self.make_expenses(day)
+                if back % 30 == 0:
+                    self.stdout.write(f"  {day}: history written")
+
+    def at(self, day, hour_lo=11, hour_hi=23):
+        h = self.rng.randint(hour_lo, hour_hi)
+        m = self.rng.randint(0, 59)
+        return timezone.make_aware(datetime.combine(day, time(h, m, self.rng.randint(0, 59))), self.tz)
+
+    def make_orders(self, day, count):
+        rng = self.rng
+        if count <= 0:
+            return
+        recent = (timezone.localdate() - day).days < 1
+        orders, lines_per_order = [], []
+        for seq in range(1, count + 1):
+            roll = rng.random()
+            status = 'paid'
+            if recent and roll < 0.05:
+                status = 'pending'
+            customer = rng.choice(self.customers) if self.customers and roll > 0.97 else None
+            orders.append(Order(
+                number=f"{self.prefix}{day:%Y%m%d}-{seq:05d}",
+                table=rng.choice(self.tables) if self.tables and roll < 0.5 else None,
+                created_by=self.user,
+                waiter=rng.choice(self.waiters),
+                status=status,
+                discount=Decimal(rng.choice([0, 0, 0, 50, 100])),
+                tax_percentage=Decimal(rng.choice([0, 0, 5])),
+                service_charge=Decimal('0'),
+                customer=customer,
+                created_at=self.at(day),
+                token_number=seq,
+                source='walk_in',
+            ))
+            n = rng.randint(1, 5)
+            picks = []
+            for _ in range(n):
+                if self.deals and rng.random() < 0.1:
+                    dl = rng.choice(self.deals)
+                    picks.append((None, dl, rng.randint(1, 2), dl.price))
+                else:
+                    mi = rng.choices(self.menu_items, weights=self.item_weights)[0]
+                    picks.append((mi, None, rng.randint(1, 3), mi.price))
+            lines_per_order.append(picks)
+            orders[-1].set_totals(sum((price * qty for _, _, qty, price in picks), Decimal('0')), save=False)
+
+        Order.objects.bulk_create(orders, batch_size=self.batch)
+
+        items, payments = [], []
+        for order, picks in zip(orders, lines_per_order):
+            for mi, dl, qty, price in picks:
+                items.append(OrderItem(order=order, menu_item=mi, deal=dl, quantity=qty,
+                                       unit_price=price, token_printed=True, printed_quantity=qty))
+            grand = order.grand_total
+            if order.status != 'paid':
+                continue
+            if order.customer_id:
+                self.credit[order.customer_id] = self.credit.get(order.customer_id, Decimal('0')) + grand
+            else:
+                payments.append(Payment(order=order, amount=grand,
+                                        method=rng.choice(['cash', 'cash', 'cash', 'card', 'bank'])))
+        OrderItem.objects.bulk_create(items, batch_size=self.batch)
+        Payment.objects.bulk_create(payments, batch_size=self.batch)
+
+    def make_purchases(self, day):
+        rng = self.rng
+        pos, lines = [], []
+        for _ in range(self.opts['pos_per_day']):
+            supplier = rng.choice(self.suppliers)
+            po = PurchaseOrder(supplier=supplier, created_by=self.user, created_at=self.at(day, 8, 12), status='received',
+                               tax_percent=Decimal(rng.choice([0, 0, 5])), discount_percent=Decimal('0'))
+            picks = rng.sample(self.materials, min(len(self.materials), rng.randint(3, 10)))
+            po_lines = [(rm, Decimal(rng.randint(1, 25)), self.material_price[rm.id]) for rm in picks]
+            subtotal = sum((qty * price for _, qty, price in po_lines), Decimal('0'))
+            po.total_cost = q2(subtotal)
+            po.net_total = q2(po.total_cost + po.total_cost * po.tax_percent / Decimal('100'))
+            pos.append(po)
+            lines.append(po_lines)
+        PurchaseOrder.objects.bulk_create(pos)
+
+        items = [PurchaseOrderItem(purchase_order=po, raw_material=rm, quantity=qty, unit_price=price)
+                 for po, po_lines in zip(pos, lines) for rm, qty, price in po_lines]
+        PurchaseOrderItem.objects.bulk_create(items, batch_size=self.batch)
+        InventoryTransaction.objects.bulk_create([
+            InventoryTransaction(raw_material=it.raw_material, transaction_type='in', quantity=it.quantity,
+                                 purchase_order_item=it, date=day, timestamp=it.purchase_order.created_at,
+                                 notes=f"PO #{it.purchase_order.id}", source=InventoryTransaction.PURCHASE)
+            for it in items
+        ], batch_size=self.batch)
+        self.todays_pos = pos
+
+    def make_vouchers(self, day):
+        rng = self.rng
+        vouchers = [KitchenVoucher(date=day, vtype=KitchenVoucher.ISSUE, created_by=self.user,
+                                   created_at=self.at(day, 9, 11))]
+        if rng.random() < 0.15:
+            vouchers.append(KitchenVoucher(date=day, vtype=KitchenVoucher.RETURN, created_by=self.user,
+                                           created_at=self.at(day, 22, 23)))
+        KitchenVoucher.objects.bulk_create(vouchers)
+
+        pairs = []
+        for v in vouchers:
+            n = rng.randint(8, 15) if v.vtype == KitchenVoucher.ISSUE else rng.randint(1, 4)
+            for rm in rng.sample(self.materials, min(len(self.materials), n)):
+                qty = Decimal(rng.randint(1, 10))
+                txn = InventoryTransaction(
+                    raw_material=rm, quantity=qty, date=day, timestamp=v.created_at,
+                    transaction_type='out' if v.vtype == KitchenVoucher.ISSUE else 'in',
+                    notes=f"{v.get_vtype_display()} KV#{v.id}", source=InventoryTransaction.KITCHEN)
+                pairs.append((v, rm, qty, txn))
+        InventoryTransaction.objects.bulk_create([p[3] for p in pairs], batch_size=self.batch)
+        KitchenVoucherItem.objects.bulk_create([
+            KitchenVoucherItem(voucher=v, raw_material=rm, quantity=qty, transaction=txn)
+            for v, rm, qty, txn in pairs
+        ], batch_size=self.batch)
+
+    def make_expenses(self, day):
+        rng = self.rng
+        rows = []  # (Expense, CashFlow)
+
+        def add(category, amount, **links):
+            bank = rng.choice(self.banks) if rng.random() < 0.3 else None
+            cf = CashFlow(date=day, business_date=day, flow_type=CashFlow.OUT, amount=amount, bank_account=bank,
+                          description=f"Expense: {category}", created_by=self.user,
+                          created_at=self.at(day, 12, 20))
+            exp = Expense(date=day, category=category, amount=amount, created_by=self.user,
+                          created_at=cf.created_at, payment_source='bank' if bank else 'cash',
+                          bank_account=bank, **links)
+            rows.append((exp, cf))
+
+        # pay most of today's purchases
+        for po in self.todays_pos:
+            if rng.random() < 0.8:
+                add(ExpenseCategory.PURCHASE, q2(po.net_total * Decimal(rng.choice(['1', '1', '0.5']))),
+                    supplier=po.supplier, purchase_order=po)
+        if rng.random() < 0.3:
+            add(ExpenseCategory.MAINTENANCE, Decimal(rng.randrange(500, 8000, 100)))
+        if day.day == 1:
+            add(ExpenseCategory.ELECTRICITY, Decimal(rng.randrange(40000, 150000, 500)),
+                supplier=rng.choice(self.suppliers))
+            add(ExpenseCategory.GAS, Decimal(rng.randrange(10000, 50000, 500)),
+                supplier=rng.choice(self.suppliers))
+            for st in self.staff:
+                add(ExpenseCategory.SALARY, st.monthly_salary, staff=st)
+
+        CashFlow.objects.bulk_create([cf for _, cf in rows], batch_size=self.batch)
+        for exp, cf in rows:
+            exp.cashflow = cf
+        Expense.objects.bulk_create([exp for exp, _ in rows], batch_size=self.batch)
+
+        # a couple of udhaar customers settle up
+        receipts = []
+        for cid, due in list(self.credit.items())[:2]:
+            if due <= 0 or rng.random() < 0.5:
+                continue
+            amount = q2(due * Decimal(rng.choice(['0.5', '1'])))
+            self.credit[cid] = due - amount
+            cf = CashFlow(date=day, business_date=day, flow_type=CashFlow.IN, amount=amount, created_by=self.user,
+                          description="Received from customer", created_at=self.at(day))
+            receipts.append((PaymentReceived(date=day, party_type='customer', customer_id=cid,
+                                             amount=amount, created_by=self.user,
+                                             created_at=cf.created_at), cf))
+        if receipts:
+            CashFlow.objects.bulk_create([cf for _, cf in receipts])
+            for pr, cf in receipts:
+                pr.cashflow = cf
+            PaymentReceived.objects.bulk_create([pr for pr, _ in receipts])
+
+    # ------------------------------------------------------------------
+    # Derived balances (the bulk paths above skip model save() hooks)
+    # ------------------------------------------------------------------
+    def finalise_balances(self):
+        dec = DecimalField(max_digits=14, decimal_places=2)
+        signed = Sum(Case(
+            When(transaction_type='out', then=-F('quantity')),
+            default=F('quantity'),
+            output_field=dec,
+        ))
+        stock = dict(
+            InventoryTransaction.objects
+            .filter(raw_material__in=self.materials)
+            .values_list('raw_material').annotate(s=signed)
+        )
+        for rm in self.materials:
+            rm.current_stock = stock.get(rm.id) or Decimal('0')
+        RawMaterial.objects.bulk_update(self.materials, ['current_stock'], batch_size=self.batch)
+        reorder.refresh()
+
+        # also resets Customer.current_balance from the rebuilt journal
+        rebuild_customer_ledger([c.id for c in self.customers], batch_size=self.batch)
+        # salary expenses were bulk inserted: drop any cached payroll months
+        StaffMonthBalance.objects.filter(staff__in=self.staff).delete()
+        rebuild_party_balances()
+        # cash flows were bulk inserted too, bypassing CashFlow.save()
+        BankAccount.audit_balances(fix=True)
+        clear_snapshots()
+        # and so were stock movements
+        movements.clear_snapshots()
+        # recipes and deal items were bulk inserted as well
+        rebuild_bom()
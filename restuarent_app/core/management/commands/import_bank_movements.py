@@ -0,0 +1,45 @@
+# core/management/commands/import_bank_movements.py
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bank_import import import_movements
+
+
+class Command(BaseCommand):
+    help = ("Import bank movements from a CSV statement "
+            "(date,type,amount,from_bank,to_bank,method,reference_no,notes).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--user', required=True, help='Username recorded as created_by')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Import the valid lines even if some lines fail')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=opts['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user '{opts['user']}'.")
+
+        started = time.perf_counter()
+        with open(opts['csv_path'], newline='', encoding='utf-8-sig') as fh:
+            result = import_movements(fh, user, skip_invalid=opts['skip_invalid'],
+                                      dry_run=opts['dry_run'], batch_size=opts['batch_size'])
+        took = time.perf_counter() - started
+
+        for line_no, msg in result.errors:
+            self.stderr.write(f"  line {line_no}: {msg}")
+        if result.errors and not (opts['skip_invalid'] or opts['dry_run']):
+            raise CommandError(f"{len(result.errors)} invalid line(s); nothing imported "
+                               f"(fix them or use --skip-invalid).")
+        if opts['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"✅  Dry run: {len(result.errors)} invalid line(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅  {result.created} bank movement(s) imported in {took:.2f}s "
+                f"({len(result.errors)} line(s) skipped)."))
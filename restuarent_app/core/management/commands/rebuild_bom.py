@@ -0,0 +1,17 @@
+# core/management/commands/rebuild_bom.py
+from django.core.management.base import BaseCommand
+
+from core.bom import rebuild_bom
+from core.variance import clear_snapshots
+from core.models import BomLine
+
+
+class Command(BaseCommand):
+    help = ("Recompute the flattened bill of materials (BomLine) of every menu item and deal, "
+            "and drop the kitchen variance days computed with the old one.")
+
+    def handle(self, *args, **opts):
+        n = rebuild_bom()
+        clear_snapshots()
+        deals = BomLine.objects.filter(deal__isnull=False).count()
+        self.stdout.write(self.style.SUCCESS(f"✅  BOM rebuilt ({n} menu item lines, {deals} deal lines)."))
@@ -0,0 +1,17 @@
+# core/management/commands/rebuild_customer_ledger.py
+from django.core.management.base import BaseCommand
+
+from core.customer_ledger import rebuild_customer_ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild CustomerLedgerEntry (with running balances) from orders, counter payments and receipts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customer', type=int, action='append', dest='customers',
+                            help='Only this customer id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **opts):
+        n = rebuild_customer_ledger(opts.get('customers'), batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"✅  Customer ledger rebuilt ({n} entries)."))
@@ -0,0 +1,14 @@
+# core/management/commands/rebuild_party_balances.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.party_balances import rebuild_party_balances
+
+
+class Command(BaseCommand):
+    help = "Recompute the ledger-home balances index (PartyBalance) for every supplier, customer and staff member."
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            n = rebuild_party_balances()
+        self.stdout.write(self.style.SUCCESS(f"✅  Party balances rebuilt ({n} parties)."))
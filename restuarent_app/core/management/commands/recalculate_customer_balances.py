@@ -0,0 +1,27 @@
+# core/management/commands/recalculate_customer_balances.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.customer_ledger import recalculate_balances, verify_balances
+
+
+class Command(BaseCommand):
+    help = "Check Customer.current_balance against the customer ledger journal and reset it in one grouped UPDATE."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only list mismatches')
+        parser.add_argument('--customer', type=int, action='append', dest='customers',
+                            help='Only this customer id (repeatable)')
+
+    def handle(self, *args, **opts):
+        ids = opts.get('customers')
+        bad = list(verify_balances(ids))
+        for c in bad:
+            self.stdout.write(f"  {c}: stored {c.current_balance}, journal {c.journal}")
+        if opts['verify']:
+            style = self.style.SUCCESS if not bad else self.style.WARNING
+            self.stdout.write(style(f"{len(bad)} customer balance(s) differ from the ledger."))
+            return
+        with transaction.atomic():
+            n = recalculate_balances(ids)
+        self.stdout.write(self.style.SUCCESS(f"✅  {n} customer balances recalculated ({len(bad)} corrected)."))
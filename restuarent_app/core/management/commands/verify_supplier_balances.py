@@ -0,0 +1,24 @@
+# core/management/commands/verify_supplier_balances.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.party_balances import verify_suppliers
+
+
+class Command(BaseCommand):
+    help = "Compare each supplier's stored payable balance with the full PO / payment / refund aggregate."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched balances')
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            bad = verify_suppliers(fix=opts['fix'])
+        for _, name, stored, actual in bad:
+            self.stdout.write(f"  {name}: stored {stored if stored is not None else '(missing)'}, ledger says {actual}")
+        if not bad:
+            self.stdout.write(self.style.SUCCESS("✅  All supplier balances match their ledgers."))
+        elif opts['fix']:
+            self.stdout.write(self.style.SUCCESS(f"✅  {len(bad)} supplier balance(s) repaired."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(bad)} mismatched; re-run with --fix to repair."))
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.3 on 2026-10-19 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_paymentreceived'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashflow',
+            index=models.Index(fields=['date'], name='core_cashfl_date_107188_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashflow',
+            index=models.Index(fields=['bank_account', 'date'], name='core_cashfl_bank_ac_36b284_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date'], name='core_expens_date_d957f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['category', 'date'], name='core_expens_categor_42d917_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['supplier', 'date'], name='core_expens_supplie_508fa9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['staff', 'date'], name='core_expens_staff_i_2e4a64_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['raw_material', 'date'], name='core_invent_raw_mat_51c71d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='core_order_created_912d27_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='core_order_status_273d1f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['table', 'status'], name='core_order_table_i_8ec217_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'created_at'], name='core_order_custome_dab258_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceived',
+            index=models.Index(fields=['customer', 'date'], name='core_paymen_custome_40b490_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceived',
+            index=models.Index(fields=['supplier', 'date'], name='core_paymen_supplie_328477_idx'),
+        ),
+    ]
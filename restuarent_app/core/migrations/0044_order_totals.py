@@ -0,0 +1,60 @@
+# Generated by Django 4.2.3 on 2026-10-19 00:45
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+BATCH = 2000
+
+
+def backfill_totals(apps, schema_editor):
+    # Order.set_totals() as of this migration; historical models have no methods
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    cents, zero = Decimal('0.01'), Decimal('0')
+    line_total = Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    last_id = 0
+    while True:
+        orders = list(Order.objects.filter(id__gt=last_id).order_by('id')
+                      .only('id', 'discount', 'tax_percentage', 'service_charge')[:BATCH])
+        if not orders:
+            break
+        last_id = orders[-1].id
+        sums = dict(OrderItem.objects.filter(order_id__in=[o.id for o in orders])
+                    .values_list('order_id').annotate(s=line_total))
+        for o in orders:
+            subtotal = Decimal(sums.get(o.id) or 0)
+            after_disc = max(subtotal - (o.discount or zero), zero)
+            tax_amount = after_disc * (o.tax_percentage or zero) / Decimal('100')
+            o.subtotal = subtotal.quantize(cents, rounding=ROUND_HALF_UP)
+            o.tax_amount = tax_amount.quantize(cents, rounding=ROUND_HALF_UP)
+            o.grand_total = (after_disc + tax_amount + (o.service_charge or zero)).quantize(
+                cents, rounding=ROUND_HALF_UP)
+        Order.objects.bulk_update(orders, ['subtotal', 'tax_amount', 'grand_total'], batch_size=BATCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='grand_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.3 on 2026-10-19 00:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posted_at', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('order', 'Credit Sale'), ('counter_payment', 'Paid at Counter'), ('receipt', 'Payment Received')], max_length=20)),
+                ('description', models.CharField(blank=True, max_length=500)),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.customer')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.order')),
+                ('receipt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.paymentreceived')),
+            ],
+            options={
+                'ordering': ['posted_at', 'id'],
+                'indexes': [models.Index(fields=['customer', 'posted_at', 'id'], name='core_custom_custome_96b446_idx')],
+            },
+        ),
+    ]
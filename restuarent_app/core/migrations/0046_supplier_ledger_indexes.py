@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_customer_ledger_entries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['supplier', 'created_at'], name='core_expens_supplie_d864d9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceived',
+            index=models.Index(fields=['supplier', 'created_at'], name='core_paymen_supplie_57ccca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['supplier', 'created_at'], name='core_purcha_supplie_ff338a_idx'),
+        ),
+    ]
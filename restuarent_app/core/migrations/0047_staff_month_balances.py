@@ -0,0 +1,29 @@
+# Generated by Django 4.2.3 on 2026-10-19 00:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_supplier_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffMonthBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('accrued', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('closing', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_balances', to='core.staff')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='core_staffm_month_167948_idx')],
+                'unique_together': {('staff', 'month')},
+            },
+        ),
+    ]
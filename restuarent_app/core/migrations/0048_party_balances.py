@@ -0,0 +1,86 @@
+# Generated by Django 4.2.3 on 2026-10-19 00:58
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, Max, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+
+def backfill_balances(apps, schema_editor):
+    """
+    One row per party, so the first incremental delta lands on the full
+    history instead of on 0. Suppliers: the supplier ledger aggregate
+    (core.party_balances.supplier_activity as of this migration);
+    customers: their stored current_balance; staff accrue from the payroll
+    cache on the next refresh_staff().
+    """
+    Supplier = apps.get_model('core', 'Supplier')
+    Customer = apps.get_model('core', 'Customer')
+    Staff = apps.get_model('core', 'Staff')
+    PurchaseOrder = apps.get_model('core', 'PurchaseOrder')
+    Expense = apps.get_model('core', 'Expense')
+    PaymentReceived = apps.get_model('core', 'PaymentReceived')
+    PartyBalance = apps.get_model('core', 'PartyBalance')
+    dec = DecimalField(max_digits=14, decimal_places=2)
+    po_amount = Coalesce(NullIf('net_total', Value(0)), 'total_cost', output_field=dec)
+
+    rows = {}
+    for pk, name in Supplier.objects.values_list('pk', 'name'):
+        rows[('supplier', pk)] = PartyBalance(party_type='supplier', party_id=pk, name=name)
+    for pk, name, phone, balance in Customer.objects.values_list('pk', 'name', 'phone', 'current_balance'):
+        rows[('customer', pk)] = PartyBalance(party_type='customer', party_id=pk, name=f"{name} ({phone})",
+                                              balance=balance or 0)
+    for pk, name in Staff.objects.values_list('pk', 'full_name'):
+        rows[('staff', pk)] = PartyBalance(party_type='staff', party_id=pk, name=name)
+
+    def bump(supplier_id, amount, last):
+        row = rows.get(('supplier', supplier_id))
+        if row is None:
+            return
+        row.balance += amount or Decimal('0')
+        if last and (row.last_activity is None or last > row.last_activity):
+            row.last_activity = last
+
+    for sid, s, last in (PurchaseOrder.objects.values('supplier_id')
+                         .annotate(s=Sum(po_amount), last=Max('created_at'))
+                         .values_list('supplier_id', 's', 'last')):
+        bump(sid, s, last)
+    for field, qs in (('supplier_id', Expense.objects.filter(supplier__isnull=False)),
+                      ('purchase_order__supplier_id',
+                       Expense.objects.filter(supplier__isnull=True, purchase_order__isnull=False))):
+        for sid, s, last in (qs.values(field).annotate(s=Sum('amount'), last=Max('created_at'))
+                             .values_list(field, 's', 'last')):
+            bump(sid, -(s or 0), last)
+    for sid, s, last in (PaymentReceived.objects.filter(supplier__isnull=False, party_type='supplier')
+                         .values('supplier_id').annotate(s=Sum('amount'), last=Max('created_at'))
+                         .values_list('supplier_id', 's', 'last')):
+        bump(sid, s, last)
+
+    PartyBalance.objects.bulk_create(rows.values(), batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_staff_month_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party_type', models.CharField(choices=[('supplier', 'Supplier'), ('customer', 'Customer'), ('staff', 'Staff')], max_length=10)),
+                ('party_id', models.PositiveIntegerField()),
+                ('name', models.CharField(blank=True, max_length=150)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['party_type', 'balance'], name='core_partyb_party_t_f0126d_idx'), models.Index(fields=['party_type', 'name'], name='core_partyb_party_t_11fae7_idx'), models.Index(fields=['party_type', 'last_activity'], name='core_partyb_party_t_6a41f8_idx')],
+                'unique_together': {('party_type', 'party_id')},
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:01
+
+from django.db import migrations, models
+from django.db.models import Case, DecimalField, F, Sum, When
+
+
+def backfill_flow_balance(apps, schema_editor):
+    BankAccount = apps.get_model('core', 'BankAccount')
+    CashFlow = apps.get_model('core', 'CashFlow')
+    totals = (
+        CashFlow.objects.filter(bank_account__isnull=False)
+        .values('bank_account')
+        .annotate(net=Sum(Case(
+            When(flow_type='in', then=F('amount')),
+            When(flow_type='out', then=-F('amount')),
+            default=0,
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )))
+    )
+    for row in totals:
+        BankAccount.objects.filter(pk=row['bank_account']).update(flow_balance=row['net'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_party_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankaccount',
+            name='flow_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunPython(backfill_flow_balance, migrations.RunPython.noop),
+    ]
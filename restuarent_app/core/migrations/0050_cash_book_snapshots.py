@@ -0,0 +1,63 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F
+
+
+def backfill_business_date(apps, schema_editor):
+    # existing flows have no created_at: their business day is their date
+    CashFlow = apps.get_model('core', 'CashFlow')
+    CashFlow.objects.filter(business_date__isnull=True).update(business_date=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0049_bank_account_flow_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashDaySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Business day (see POSSettings.start_of_day_time)')),
+                ('opening', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cash_in', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cash_out', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('closing', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cashflow',
+            name='business_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cashflow',
+            index=models.Index(fields=['business_date'], name='core_cashfl_busines_19fcf9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cashflow',
+            index=models.Index(fields=['bank_account', 'business_date'], name='core_cashfl_bank_ac_f4d00e_idx'),
+        ),
+        migrations.AddField(
+            model_name='cashdaysnapshot',
+            name='bank_account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='day_snapshots', to='core.bankaccount'),
+        ),
+        migrations.AddIndex(
+            model_name='cashdaysnapshot',
+            index=models.Index(fields=['day'], name='core_cashda_day_4886dd_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cashdaysnapshot',
+            constraint=models.UniqueConstraint(fields=('bank_account', 'day'), name='uniq_cash_snapshot_bank_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='cashdaysnapshot',
+            constraint=models.UniqueConstraint(condition=models.Q(('bank_account__isnull', True)), fields=('day',), name='uniq_cash_snapshot_till_day'),
+        ),
+        migrations.RunPython(backfill_business_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:10
+
+import datetime
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def _receipt_time(receipt):
+    created = timezone.localtime(receipt.created_at) if receipt.created_at else timezone.localtime()
+    return timezone.make_aware(datetime.datetime.combine(receipt.date, created.time()))
+
+
+def carry_forward_balances(apps, schema_editor):
+    """
+    Customer.current_balance was edited by hand and by code paths the ledger
+    never saw. Rebuild the journal from orders, counter payments and
+    receipts (core.customer_ledger.rebuild_customer_ledger as of this
+    migration), then post whatever the stored balance holds beyond it as a
+    carried-forward entry at the time of the upgrade, so the stored balance
+    equals the journal and nothing is counted twice.
+    """
+    Customer = apps.get_model('core', 'Customer')
+    Order = apps.get_model('core', 'Order')
+    Payment = apps.get_model('core', 'Payment')
+    PaymentReceived = apps.get_model('core', 'PaymentReceived')
+    Entry = apps.get_model('core', 'CustomerLedgerEntry')
+    zero = Decimal('0')
+
+    orders = Order.objects.filter(customer__isnull=False, status='paid')
+    counter = dict(Payment.objects.filter(order__in=orders).values_list('order_id', 'amount'))
+    rows = []   # (customer_id, posted_at, tie-break, entry)
+    for o in orders.prefetch_related('items__menu_item', 'items__deal').iterator(chunk_size=2000):
+        names = ", ".join(f"{i.menu_item.name if i.menu_item_id else i.deal.name} x{i.quantity}"
+                          for i in o.items.all())
+        rows.append((o.customer_id, o.created_at, (0, o.pk), Entry(
+            customer_id=o.customer_id, posted_at=o.created_at, kind='order', order_id=o.pk,
+            description=f"Order #{o.number}: {names}"[:500], debit=o.grand_total)))
+        paid = counter.get(o.pk) or zero
+        if paid > 0:
+            rows.append((o.customer_id, o.created_at, (1, o.pk), Entry(
+                customer_id=o.customer_id, posted_at=o.created_at, kind='counter_payment', order_id=o.pk,
+                description=f"Paid at counter for Order #{o.number}", credit=paid)))
+    for r in PaymentReceived.objects.filter(customer__isnull=False).iterator(chunk_size=2000):
+        at = _receipt_time(r)
+        rows.append((r.customer_id, at, (2, r.pk), Entry(
+            customer_id=r.customer_id, posted_at=at, kind='receipt', receipt_id=r.pk,
+            description=f"Payment Received ({r.get_payment_method_display()}) {r.description}".strip(),
+            credit=r.amount)))
+
+    rows.sort(key=lambda r: (r[0], r[1], r[2]))
+    running, journal, last_customer = zero, {}, None
+    for customer_id, _, _, entry in rows:
+        if customer_id != last_customer:
+            running, last_customer = zero, customer_id
+        running += entry.debit - entry.credit
+        entry.balance = journal[customer_id] = running
+    Entry.objects.all().delete()
+    Entry.objects.bulk_create([r[3] for r in rows], batch_size=2000)
+
+    now = timezone.now()
+    for pk, stored in Customer.objects.values_list('pk', 'current_balance').iterator():
+        diff = (stored or zero) - journal.get(pk, zero)
+        if not diff:
+            continue
+        before = (Entry.objects.filter(customer_id=pk, posted_at__lte=now)
+                  .order_by('-posted_at', '-id').values_list('balance', flat=True).first()) or zero
+        Entry.objects.filter(customer_id=pk, posted_at__gt=now).update(balance=F('balance') + diff)
+        Entry.objects.create(
+            customer_id=pk, posted_at=now, kind='opening',
+            description="Balance carried forward (before the ledger)",
+            debit=max(diff, zero), credit=max(-diff, zero), balance=before + diff,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0050_cash_book_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customerledgerentry',
+            name='kind',
+            field=models.CharField(choices=[('order', 'Credit Sale'), ('counter_payment', 'Paid at Counter'), ('receipt', 'Payment Received'), ('adjustment', 'Balance Adjustment'), ('opening', 'Balance Carried Forward')], max_length=20),
+        ),
+        migrations.RunPython(carry_forward_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:26
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# core.bom as of this migration, copied so later changes there cannot change it
+PLACES = Decimal("0.000001")
+
+
+def flatten(raw_rows, sub_rows, factors):
+    """recipe_id -> ({raw_material_id: base quantity}, total weight); looping sub-recipes are skipped."""
+    raw, subs = defaultdict(list), defaultdict(list)
+    for recipe_id, rm_id, qty, unit_id in raw_rows:
+        raw[recipe_id].append((rm_id, Decimal(qty) * Decimal(factors.get((rm_id, unit_id), 1))))
+    for recipe_id, sub_id, qty in sub_rows:
+        subs[recipe_id].append((sub_id, Decimal(qty)))
+
+    memo = {}
+
+    def walk(recipe_id, path=()):
+        if recipe_id in memo:
+            return memo[recipe_id]
+        lines, weight = defaultdict(Decimal), Decimal("0")
+        for rm_id, base in raw[recipe_id]:
+            lines[rm_id] += base
+            weight += base
+        for sub_id, qty in subs[recipe_id]:
+            if sub_id in path or sub_id == recipe_id:
+                continue
+            sub_lines, sub_weight = walk(sub_id, path + (recipe_id,))
+            weight += qty
+            if sub_weight:
+                for rm_id, base in sub_lines.items():
+                    lines[rm_id] += base * qty / sub_weight
+        memo[recipe_id] = (lines, weight)
+        return memo[recipe_id]
+
+    return walk
+
+
+def build_bom(apps, schema_editor):
+    """Flatten every existing recipe and deal (core.bom keeps them current from here on)."""
+    Conversion = apps.get_model('core', 'RawMaterialUnitConversion')
+    RecipeRawMaterial = apps.get_model('core', 'RecipeRawMaterial')
+    RecipeSubRecipe = apps.get_model('core', 'RecipeSubRecipe')
+    Recipe = apps.get_model('core', 'Recipe')
+    DealItem = apps.get_model('core', 'DealItem')
+    BomLine = apps.get_model('core', 'BomLine')
+
+    factors = {(rm, unit): f for rm, unit, f in
+               Conversion.objects.values_list('raw_material_id', 'unit_id', 'to_base_factor')}
+    walk = flatten(RecipeRawMaterial.objects.values_list('recipe_id', 'raw_material_id', 'quantity', 'unit_id'),
+                   RecipeSubRecipe.objects.values_list('recipe_id', 'sub_recipe_id', 'quantity'), factors)
+    items = defaultdict(dict)
+    for recipe_id, mi in Recipe.objects.values_list('pk', 'menu_item_id'):
+        items[mi] = {rm: q.quantize(PLACES) for rm, q in walk(recipe_id)[0].items() if q}
+    deals = defaultdict(Decimal)
+    for deal_id, mi, qty in DealItem.objects.values_list('deal_id', 'menu_item_id', 'quantity'):
+        for rm, q in items.get(mi, {}).items():
+            deals[(deal_id, rm)] += q * qty
+    BomLine.objects.bulk_create(
+        [BomLine(menu_item_id=mi, raw_material_id=rm, base_quantity=q)
+         for mi, lines in items.items() for rm, q in lines.items()]
+        + [BomLine(deal_id=d, raw_material_id=rm, base_quantity=q) for (d, rm), q in deals.items() if q],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0051_customer_balance_journal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BomLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_quantity', models.DecimalField(decimal_places=6, max_digits=16)),
+                ('deal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bom_lines', to='core.deal')),
+                ('menu_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bom_lines', to='core.menuitem')),
+                ('raw_material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bom_lines', to='core.rawmaterial')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bomline',
+            constraint=models.UniqueConstraint(fields=('menu_item', 'raw_material'), name='uniq_bom_item_material'),
+        ),
+        migrations.AddConstraint(
+            model_name='bomline',
+            constraint=models.UniqueConstraint(fields=('deal', 'raw_material'), name='uniq_bom_deal_material'),
+        ),
+        migrations.AddConstraint(
+            model_name='bomline',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('deal__isnull', True), ('menu_item__isnull', False)), models.Q(('deal__isnull', False), ('menu_item__isnull', True)), _connector='OR'), name='bom_item_xor_deal'),
+        ),
+        migrations.RunPython(build_bom, migrations.RunPython.noop),
+    ]
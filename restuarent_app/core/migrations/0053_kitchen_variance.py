@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0052_bom_lines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VarianceDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Business day (see POSSettings.start_of_day_time)', unique=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VarianceLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('returned', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('theoretical', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('raw_material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variance_lines', to='core.rawmaterial')),
+                ('variance_day', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='core.varianceday')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='varianceline',
+            constraint=models.UniqueConstraint(fields=('variance_day', 'raw_material'), name='uniq_variance_day_material'),
+        ),
+    ]
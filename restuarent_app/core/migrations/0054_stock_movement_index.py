@@ -0,0 +1,72 @@
+# Generated by Django 4.2.3 on 2026-10-19 01:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def tag_sources(apps, schema_editor):
+    """Tag existing movements from their back-links, then their notes; date the undated ones."""
+    from django.utils import timezone
+
+    Txn = apps.get_model('core', 'InventoryTransaction')
+    KitchenVoucherItem = apps.get_model('core', 'KitchenVoucherItem')
+
+    Txn.objects.filter(purchase_order_item__isnull=False).update(source='purchase')
+    Txn.objects.filter(order_item__isnull=False).update(source='sale')
+    Txn.objects.filter(pk__in=KitchenVoucherItem.objects.filter(transaction__isnull=False)
+                       .values('transaction_id')).update(source='kitchen')
+    # links cleared by deletes (SET_NULL) still carry the writer's note
+    manual = Txn.objects.filter(source='manual')
+    manual.filter(notes__startswith='PO #').update(source='purchase')
+    manual.filter(notes__contains='KV#').update(source='kitchen')
+    manual.filter(notes__startswith='Used in ').update(source='sale')
+
+    undated = list(Txn.objects.filter(date__isnull=True, timestamp__isnull=False).only('id', 'timestamp'))
+    for t in undated:
+        t.date = timezone.localtime(t.timestamp).date()
+    Txn.objects.bulk_update(undated, ['date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0053_kitchen_variance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMonthSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('purchased', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('issued', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('returned', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sold', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('other', models.DecimalField(decimal_places=2, default=0, help_text='Net manual movements', max_digits=14)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventorytransaction',
+            name='source',
+            field=models.CharField(choices=[('purchase', 'Purchase'), ('kitchen', 'Kitchen voucher'), ('sale', 'Sale'), ('manual', 'Manual')], default='manual', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['date'], name='core_invent_date_4601d0_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockmonthsnapshot',
+            name='raw_material',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_snapshots', to='core.rawmaterial'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmonthsnapshot',
+            index=models.Index(fields=['month'], name='core_stockm_month_52a208_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockmonthsnapshot',
+            constraint=models.UniqueConstraint(fields=('raw_material', 'month'), name='uniq_stock_snapshot_material_month'),
+        ),
+        migrations.RunPython(tag_sources, migrations.RunPython.noop),
+    ]
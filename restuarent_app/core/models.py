@@ -6,6 +6,7 @@ from django.db.models import Max
 from django.utils import timezone
 from django.db import IntegrityError, transaction
 import logging
+from collections import defaultdict
 
 from django.db import models
 from django.db.models import Max
@@ -14,6 +15,9 @@ from django.utils import timezone
 import datetime
 
 logger = logging.getLogger(__name__)
+order_logger = logging.getLogger("core.orders")
+inventory_logger = logging.getLogger("core.inventory")
+token_logger = logging.getLogger("core.tokens")
 
 # ---------- User & Roles (unchanged) ----------
 class User(AbstractUser):
@@ -41,6 +45,24 @@ class Customer(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.phone})"
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        # current_balance is owned by the customer ledger (core.customer_ledger),
+        # which moves it with F() updates: never write a stale copy back, and
+        # post an opening balance as a ledger adjustment.
+        if self.pk and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'current_balance'
+            ]
+            return super().save(*args, **kwargs)
+        opening, self.current_balance = self.current_balance or 0, 0
+        super().save(*args, **kwargs)
+        if opening:
+            from .customer_ledger import post_adjustment
+            post_adjustment(self.pk, opening, "Opening balance")
+        self.current_balance = opening
     
     @property
     def abs_balance(self):
@@ -259,8 +281,55 @@ class Order(models.Model):
 
     source = models.CharField(max_length=20, choices=[('food_panda', 'Food Panda'), ('walk_in','Walk-in')], null=True, blank=True)
 
+    # Denormalised totals, kept in step with items/charges by set_totals()
+    # and refresh_totals(). Lists, ledgers and bills read these directly.
+    subtotal    = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax_amount  = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    grand_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        # Hot filters: order list / reports (date, status+date), table
+        # lookups (table+pending) and the customer ledger (customer+date).
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['table', 'status']),
+            models.Index(fields=['customer', 'created_at']),
+        ]
+
     def __str__(self):
         return f"Order #{self.number} – {self.get_status_display()}"
+
+    def set_totals(self, subtotal, save=True):
+        """
+        Derive tax/grand total from an items subtotal and the order's
+        discount, tax % and service charge:
+            (subtotal - discount, floored at 0) + tax on that + service
+        With save=True the three columns are written with a single UPDATE.
+        """
+        from decimal import Decimal, ROUND_HALF_UP
+        cents = Decimal('0.01')
+        subtotal = Decimal(subtotal or 0)
+        after_disc = max(subtotal - (self.discount or Decimal('0')), Decimal('0'))
+        tax_amount = after_disc * (self.tax_percentage or Decimal('0')) / Decimal('100')
+        self.subtotal = subtotal.quantize(cents, rounding=ROUND_HALF_UP)
+        self.tax_amount = tax_amount.quantize(cents, rounding=ROUND_HALF_UP)
+        self.grand_total = (after_disc + tax_amount + (self.service_charge or Decimal('0'))).quantize(
+            cents, rounding=ROUND_HALF_UP)
+        if save and self.pk:
+            Order.objects.filter(pk=self.pk).update(
+                subtotal=self.subtotal, tax_amount=self.tax_amount, grand_total=self.grand_total)
+
+    def refresh_totals(self, save=True):
+        """Recompute the stored totals from the items (one aggregate query)."""
+        from django.db.models import Sum, F, DecimalField
+        from django.db.models.functions import Coalesce
+        from decimal import Decimal
+        subtotal = self.items.aggregate(
+            s=Coalesce(Sum(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                       Decimal('0'))
+        )['s']
+        self.set_totals(subtotal, save=save)
     
     def save(self, *args, **kwargs):
         import time, random
@@ -271,7 +340,7 @@ class Order(models.Model):
         # Ensure core/utils.py exists with the code provided in the previous step
         from .utils import get_business_date, get_next_token_number
 
-        logger.debug(f"Order save started for {self.number} at {timezone.now()}")
+        order_logger.debug("Order save started for %s", self.number)
 
         # Pin created_at for stable window math (auto_now_add will set DB value; this keeps our logic stable)
         if not self.created_at:
@@ -319,7 +388,7 @@ class Order(models.Model):
                             # station=None means it grabs the "Global/Main" token number
                             self.token_number = get_next_token_number(station=None)
                             
-                        logger.debug(f"Attempt {attempt}: number={self.number}, token={self.token_number}")
+                        order_logger.debug("Attempt %d: number=%s, token=%s", attempt, self.number, self.token_number)
                         super().save(*args, **kwargs)
                     break  # success
                 except IntegrityError as e:
@@ -336,7 +405,7 @@ class Order(models.Model):
         else:
             super().save(*args, **kwargs)
 
-        logger.debug(f"Token number set to {self.token_number}")
+        token_logger.debug("Order %s has token %s", self.number, self.token_number)
 
 from decimal import Decimal
 
@@ -352,46 +421,48 @@ class OrderItem(models.Model):
     def line_total(self):
         return self.quantity * self.unit_price
 
-    def update_inventory_usage(self):
-        # only do this for a menu_item that actually has a recipe
-        if not self.menu_item:
-            return
-
-        try:
-            recipe = self.menu_item.recipe
-        except Recipe.DoesNotExist:
+    def update_inventory_usage(self, created=False):
+        """
+        Take this line's raw materials out of stock from the flattened BOM
+        of its menu item or deal (sub-recipes included). A re-saved line
+        only posts the difference from what it already took out.
+        """
+        from .bom import lines_for
+        from .stock import record, signed_quantity
+
+        per_unit = lines_for(menu_item_id=self.menu_item_id, deal_id=self.deal_id)
+        wanted = {rm_id: q * self.quantity for rm_id, q in per_unit.items()}
+        taken = defaultdict(Decimal)
+        if not created:
+            for rm_id, ttype, qty in (InventoryTransaction.objects.filter(order_item=self)
+                                      .values_list('raw_material_id', 'transaction_type', 'quantity')):
+                taken[rm_id] -= signed_quantity(ttype, qty)
+        if not wanted and not taken:
             return
 
-        # loop each raw-material line on the recipe
-        for ingr in recipe.raw_ingredients.select_related('raw_material', 'unit').all():
-            # look up the conversion factor for this raw_material + unit
-            try:
-                conv_obj = RawMaterialUnitConversion.objects.get(
-                    raw_material=ingr.raw_material,
-                    unit=ingr.unit
-                )
-                conv = Decimal(conv_obj.to_base_factor)
-            except RawMaterialUnitConversion.DoesNotExist:
-                # fallback to 1:1 if no conversion is defined
-                conv = Decimal('1')
-
-            # total raw needed = (recipe-line qty × unit→base) × order quantity
-            used_qty = Decimal(ingr.quantity) * conv * self.quantity
-
-            InventoryTransaction.objects.create(
-                raw_material     = ingr.raw_material,
-                transaction_type = 'out',
-                quantity         = used_qty,
-                order_item       = self,
-                notes            = f"Used in {self.menu_item.name} (Order #{self.order.number})"
-            )
+        # total raw needed = BOM base qty per unit × order quantity
+        name = self.deal.name if self.deal_id else self.menu_item.name
+        rows = []
+        for rm_id in sorted(wanted.keys() | taken.keys()):
+            delta = (wanted.get(rm_id, 0) - taken[rm_id]).quantize(Decimal('0.01'))
+            if delta:
+                rows.append(InventoryTransaction(
+                    raw_material_id  = rm_id,
+                    transaction_type = 'out' if delta > 0 else 'return',
+                    quantity         = abs(delta),
+                    order_item       = self,
+                    notes            = f"Used in {name} (Order #{self.order.number})",
+                    source           = InventoryTransaction.SALE,
+                ))
+        record(rows)
 
     def save(self, *args, **kwargs):
+        created = self._state.adding
         # Save the OrderItem first
         super().save(*args, **kwargs)
-        
+
         # Then update inventory usage
-        self.update_inventory_usage()
+        self.update_inventory_usage(created=created)
 
     def __str__(self):
         if self.deal:
@@ -506,6 +577,11 @@ class PurchaseOrder(models.Model):
     discount_percent  = models.DecimalField(max_digits=5, decimal_places=2, default=0)   # e.g. 10.00 (%)
     net_total         = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # computed subtotal + tax - discount
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['supplier', 'created_at']),
+        ]
+
     def __str__(self):
         return f"PO #{self.id} - {self.supplier.name}"
 
@@ -515,9 +591,16 @@ class PurchaseOrder(models.Model):
         using % tax and % discount. Keeps compatibility with existing code that
         reads/writes `total_cost`.
         """
+        from decimal import Decimal
+        self.set_totals(sum((it.total_cost() for it in self.items.all()), Decimal('0')))
+
+    def set_totals(self, subtotal):
+        """
+        Set total_cost / net_total from an already known lines subtotal (no
+        item reads). The caller saves, so the balance signals see the change.
+        """
         from decimal import Decimal, ROUND_HALF_UP
-        subtotal = sum((it.total_cost() for it in self.items.all()), Decimal('0'))
-        self.total_cost = subtotal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        self.total_cost = Decimal(subtotal or 0).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
         tax_amt = (self.total_cost * (self.tax_percent or 0) / Decimal('100')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
         disc_amt = (self.total_cost * (self.discount_percent or 0) / Decimal('100')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
@@ -528,6 +611,16 @@ class PurchaseOrder(models.Model):
         self.recompute_totals()
         self.save(update_fields=['total_cost', 'net_total'])
 
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        # the cascade skips PurchaseOrderItem.delete(): take the stock back out here
+        from django.db.models import Sum
+        from .stock import po_stock_moves
+        received = self.items.values('raw_material_id').annotate(q=Sum('quantity')).values_list('raw_material_id', 'q')
+        po_stock_moves(self, {rm_id: -q for rm_id, q in received},
+                       note=f"Reversal (delete) PO #{self.pk}")
+        return super().delete(*args, **kwargs)
+
 
 class PurchaseOrderItem(models.Model):
     purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE,
@@ -539,26 +632,27 @@ class PurchaseOrderItem(models.Model):
     def total_cost(self):
         return self.quantity * self.unit_price
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
-            super().save(*args, **kwargs)
-            # auto add stock‑in transaction WITH a back‑link
-            InventoryTransaction.objects.create(
-                raw_material       = self.raw_material,
-                transaction_type   = 'in',
-                quantity           = self.quantity,
-                purchase_order_item= self,              # ← link back
-                notes              = f"PO #{self.purchase_order.id}"
-            )
+        from .stock import po_stock_moves
+        old = None
+        if self.pk:
+            old = PurchaseOrderItem.objects.filter(pk=self.pk).values_list('raw_material_id', 'quantity').first()
+        super().save(*args, **kwargs)
+        # stock-in transaction WITH a back-link: the full quantity for a new
+        # line, only the change when an existing line is edited
+        deltas = {self.raw_material_id: self.quantity}
+        if old:
+            deltas[old[0]] = deltas.get(old[0], 0) - old[1]
+        po_stock_moves(self.purchase_order, deltas, {self.raw_material_id: self})
+
+    @transaction.atomic
     def delete(self, *args, **kwargs):
-        # create a 'return' to reverse previous 'in'
-        InventoryTransaction.objects.create(
-            raw_material=self.raw_material,
-            transaction_type='return',
-            quantity=self.quantity,
-            purchase_order_item=None,
-            notes=f"Reversal (delete) PO #{self.purchase_order.id}"
-        )
-        super().delete(*args, **kwargs)
+        # reverse the previous 'in' (stock goes back out)
+        from .stock import po_stock_moves
+        po_stock_moves(self.purchase_order, {self.raw_material_id: -self.quantity},
+                       note=f"Reversal (delete) PO #{self.purchase_order_id}")
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.quantity} x {self.raw_material.name}"
@@ -576,15 +670,11 @@ class Recipe(models.Model):
 
     def total_grams(self):
         """
-        Sum all ingredients & sub-recipes (in grams) for cost & usage.
+        Sum all ingredients & sub-recipes (in grams) for cost & usage,
+        from the menu item's flattened BOM (core.bom).
         """
-        total = 0
-        for ingr in self.raw_ingredients.all():
-            conv = ingr.unit.to_base_factor
-            total += ingr.quantity * conv
-        for sub in self.subrecipes.all():
-            total += sub.sub_recipe.total_grams() * float(sub.quantity)
-        return total
+        from django.db.models.functions import Coalesce
+        return self.menu_item.bom_lines.aggregate(s=Coalesce(models.Sum('base_quantity'), Decimal('0')))['s']
 
 class RecipeRawMaterial(models.Model):
     recipe       = models.ForeignKey(Recipe, on_delete=models.CASCADE,
@@ -607,13 +697,50 @@ class RecipeSubRecipe(models.Model):
     def __str__(self):
         return f"{self.quantity} {self.unit.symbol} of {self.sub_recipe.menu_item.name}"
 
+
+class BomLine(models.Model):
+    """
+    Flattened bill of materials (see core.bom): base quantity (g / ml / pcs)
+    of one raw material used by one unit sold of a menu item -- or of a
+    deal, through its DealItems -- with sub-recipes expanded. Rebuilt for
+    the affected items whenever recipes, deal items or conversions change.
+    """
+    menu_item = models.ForeignKey(MenuItem, null=True, blank=True, on_delete=models.CASCADE,
+                                  related_name='bom_lines')
+    deal = models.ForeignKey(Deal, null=True, blank=True, on_delete=models.CASCADE, related_name='bom_lines')
+    raw_material = models.ForeignKey(RawMaterial, on_delete=models.CASCADE, related_name='bom_lines')
+    base_quantity = models.DecimalField(max_digits=16, decimal_places=6)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['menu_item', 'raw_material'], name='uniq_bom_item_material'),
+            models.UniqueConstraint(fields=['deal', 'raw_material'], name='uniq_bom_deal_material'),
+            models.CheckConstraint(check=models.Q(menu_item__isnull=False, deal__isnull=True)
+                                   | models.Q(menu_item__isnull=True, deal__isnull=False),
+                                   name='bom_item_xor_deal'),
+        ]
+
+    def __str__(self):
+        owner = self.menu_item or self.deal
+        return f"{owner}: {self.base_quantity} of {self.raw_material}"
+
 class InventoryTransaction(models.Model):
     TRANSACTION_TYPES = [
         ('in', 'Stock In'),
         ('out','Stock Out'),
         ('return','Stock Return'),
     ]
+    # what moved the stock (core.movements): PO receipts, kitchen voucher
+    # issues / returns, sales consumption, anything else
+    PURCHASE, KITCHEN, SALE, MANUAL = 'purchase', 'kitchen', 'sale', 'manual'
+    SOURCES = [
+        (PURCHASE, 'Purchase'),
+        (KITCHEN, 'Kitchen voucher'),
+        (SALE, 'Sale'),
+        (MANUAL, 'Manual'),
+    ]
     date = models.DateField(default=timezone.localdate, null=True, blank=True)
+    source              = models.CharField(max_length=10, choices=SOURCES, default=MANUAL)
     raw_material        = models.ForeignKey(RawMaterial, on_delete=models.CASCADE,
                                             related_name='transactions', null=True, blank=True)
     transaction_type    = models.CharField(max_length=6, choices=TRANSACTION_TYPES)
@@ -628,22 +755,37 @@ class InventoryTransaction(models.Model):
                                             on_delete=models.SET_NULL,
                                             null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['raw_material', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
+        from .movements import invalidate_from
+        from .stock import apply_stock_deltas, signed_quantity
+        # maintain current stock: the whole quantity on insert, only the
+        # difference when an existing transaction is edited
+        deltas = {}
+        if self.pk:
+            old = (InventoryTransaction.objects.filter(pk=self.pk)
+                   .values_list('raw_material_id', 'transaction_type', 'quantity', 'date').first())
+            if old:
+                deltas[old[0]] = -signed_quantity(old[1], old[2])
+                invalidate_from([old[0]], old[3])
         super().save(*args, **kwargs)
-        # maintain current stock
-        if self.transaction_type == 'in':
-            self.raw_material.current_stock += self.quantity
-        elif self.transaction_type in ['out']:
-            self.raw_material.current_stock -= self.quantity
-        elif self.transaction_type == 'return':
-            self.raw_material.current_stock += self.quantity
-        self.raw_material.save()
+        deltas[self.raw_material_id] = deltas.get(self.raw_material_id, 0) + \
+            signed_quantity(self.transaction_type, self.quantity)
+        apply_stock_deltas(deltas)
+        invalidate_from([self.raw_material_id], self.date)
+        inventory_logger.debug("%s %s x %s", self.transaction_type, self.raw_material_id, self.quantity)
 
     def __str__(self):
         return f"{self.get_transaction_type_display()} – {self.raw_material.name}: {self.quantity} {self.raw_material.unit}"
 
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, pre_save, post_delete
 from django.dispatch import receiver
 
 # a dictionary of all the units you support, with their
@@ -726,6 +868,7 @@ class TableMenuItem(models.Model):
     
 
 from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 
@@ -740,30 +883,67 @@ class BankAccount(models.Model):
     is_active      = models.BooleanField(default=True)
     created_at     = models.DateTimeField(auto_now_add=True)
 
+    # Net of all CashFlow rows (IN - OUT) on this account, kept in step by
+    # CashFlow.save()/delete(). Verify with `manage.py audit_bank_balances`.
+    flow_balance   = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+
     def __str__(self):
         label = self.bank_name or "Bank"
         return f"{label} — {self.name}"
 
+    def save(self, *args, **kwargs):
+        # never write a stale flow_balance back over concurrent F() updates
+        if self.pk and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'flow_balance'
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def current_balance(self):
-        from django.db.models import Sum, F, Case, When, DecimalField
-        # Sum IN minus OUT for this bank account; opening balance included
-        from .models import CashFlow  # avoid circulars if you split files
-        agg = (
+        # opening balance + stored IN/OUT net; O(1)
+        return self.opening_balance + self.flow_balance
+
+    @staticmethod
+    def apply_flow(bank_account_id, delta):
+        if bank_account_id and delta:
+            BankAccount.objects.filter(pk=bank_account_id).update(flow_balance=F('flow_balance') + delta)
+
+    @classmethod
+    def flow_totals(cls):
+        """{bank_account_id: IN - OUT} from the full CashFlow aggregate."""
+        from django.db.models import Sum, Case, When, DecimalField
+        return dict(
             CashFlow.objects
-            .filter(bank_account=self)
-            .aggregate(
-                net=Sum(
-                    Case(
-                        When(flow_type='in',  then=F('amount')),
-                        When(flow_type='out', then=-F('amount')),
-                        default=0,
-                        output_field=DecimalField(max_digits=12, decimal_places=2)
-                    )
-                )
-            )
-        )['net'] or 0
-        return self.opening_balance + agg
+            .filter(bank_account__isnull=False)
+            .values('bank_account')
+            .annotate(net=Sum(Case(
+                When(flow_type='in',  then=F('amount')),
+                When(flow_type='out', then=-F('amount')),
+                default=0,
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            )))
+            .values_list('bank_account', 'net')
+        )
+
+    @classmethod
+    def audit_balances(cls, fix=False):
+        """
+        Compare the stored flow_balance of every account with the aggregate.
+        Returns [(account, stored, actual)] for the mismatches; fix=True
+        rewrites them.
+        """
+        from decimal import Decimal
+        totals = cls.flow_totals()
+        bad = []
+        for acc in cls.objects.all():
+            actual = totals.get(acc.pk) or Decimal('0')
+            if acc.flow_balance != actual:
+                bad.append((acc, acc.flow_balance, actual))
+                if fix:
+                    cls.objects.filter(pk=acc.pk).update(flow_balance=actual)
+        return bad
 
 
 class CashFlow(models.Model):
@@ -778,11 +958,57 @@ class CashFlow(models.Model):
     description  = models.CharField(max_length=255, blank=True)
     created_by   = models.ForeignKey(User, on_delete=models.PROTECT)
     created_at = models.DateTimeField(null=True, blank=True)
+    # business day (cut at POSSettings.start_of_day_time) for the cash book
+    business_date = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['bank_account', 'date']),
+            models.Index(fields=['business_date']),
+            models.Index(fields=['bank_account', 'business_date']),
+        ]
 
     def __str__(self):
         side = "Bank" if self.bank_account else "Cash"
         return f"{self.date} — {self.get_flow_type_display()} {self.amount} ({side})"
 
+    def signed_amount(self):
+        return self.amount if self.flow_type == self.IN else -self.amount
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        from .cashbook import business_day_of, invalidate_from
+        if isinstance(self.date, datetime.datetime):
+            self.date = timezone.localtime(self.date).date()
+        if not self.pk and self.created_at is None:
+            self.created_at = timezone.now()
+        self.business_date = business_day_of(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'date' in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'business_date']
+
+        # keep BankAccount.flow_balance in step: take the old row out, put the new one in
+        old = None
+        if self.pk:
+            old = (CashFlow.objects.filter(pk=self.pk)
+                   .only('bank_account_id', 'flow_type', 'amount', 'business_date').first())
+        super().save(*args, **kwargs)
+        if old is not None:
+            BankAccount.apply_flow(old.bank_account_id, -old.signed_amount())
+            invalidate_from(old.bank_account_id, old.business_date)
+        BankAccount.apply_flow(self.bank_account_id, self.signed_amount())
+        invalidate_from(self.bank_account_id, self.business_date)
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        from .cashbook import invalidate_from
+        bank_account_id, delta = self.bank_account_id, self.signed_amount()
+        result = super().delete(*args, **kwargs)
+        BankAccount.apply_flow(bank_account_id, -delta)
+        invalidate_from(bank_account_id, self.business_date)
+        return result
+
 
 class BankMovement(models.Model):
     """
@@ -845,15 +1071,11 @@ class BankMovement(models.Model):
             if not (self.from_bank or self.to_bank):
                 raise ValidationError("Fee/Interest must reference a bank account.")
 
-    @transaction.atomic
-    def save(self, *args, **kwargs):
+    def flow_sides(self):
         """
-        Ensure the paired CashFlow entries exist/are updated atomically.
+        The (out, in) CashFlow field dicts this movement needs; either side
+        may be None. Shared by save() and core.bank_import.
         """
-        creating = self.pk is None
-        super().save(*args, **kwargs)
-
-        # (1) Figure out the two sides that must exist for this movement
         out_kwargs, in_kwargs = None, None
 
         if self.movement_type == self.DEPOSIT:
@@ -886,6 +1108,18 @@ class BankMovement(models.Model):
             # bank IN only
             in_kwargs  = dict(bank_account=self.to_bank or self.from_bank, flow_type=CashFlow.IN,
                               description="Bank interest", amount=self.amount)
+        return out_kwargs, in_kwargs
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        """
+        Ensure the paired CashFlow entries exist/are updated atomically.
+        """
+        creating = self.pk is None
+        super().save(*args, **kwargs)
+
+        # (1) Figure out the two sides that must exist for this movement
+        out_kwargs, in_kwargs = self.flow_sides()
 
         # (2) Create / update linked CashFlow(s)
         if out_kwargs:
@@ -1019,6 +1253,15 @@ class Expense(models.Model):
 
     purchase_order = models.ForeignKey('PurchaseOrder', on_delete=models.SET_NULL, null=True, blank=True, related_name='expenses')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['category', 'date']),
+            models.Index(fields=['supplier', 'date']),
+            models.Index(fields=['staff', 'date']),
+            models.Index(fields=['supplier', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.date} — {self.get_category_display()} — ₨{self.amount}"
 
@@ -1112,41 +1355,27 @@ class KitchenVoucher(models.Model):
     def __str__(self):
         return f"KV#{self.id} — {self.get_vtype_display()} — {self.date}"
 
-    @transaction.atomic
     def sync_transactions(self):
         """
-        For each item ensure a matching InventoryTransaction exists/updated.
-        ISSUE  -> OUT
-        RETURN -> IN
+        Bring the items' InventoryTransactions in line with the voucher
+        (ISSUE -> OUT, RETURN -> IN) in bulk; see core.stock.
         """
-        from .models import InventoryTransaction  # avoid cycle
-
-        for it in self.items.select_related('raw_material').all():
-            # create/update the attached InventoryTransaction
-            if it.transaction_id:
-                t = it.transaction
-                t.date = self.date  # we add a date field below in InventoryTransaction
-                t.timestamp = timezone.now()
-                t.transaction_type = 'out' if self.vtype == self.ISSUE else 'in'
-                t.quantity = it.quantity
-                t.raw_material = it.raw_material
-                t.notes = f"{self.get_vtype_display()} KV#{self.id}"
-                t.save(update_fields=['date','timestamp','transaction_type','quantity','raw_material','notes'])
-            else:
-                t = InventoryTransaction.objects.create(
-                    raw_material=it.raw_material,
-                    transaction_type=('out' if self.vtype == self.ISSUE else 'in'),
-                    quantity=it.quantity,
-                    notes=f"{self.get_vtype_display()} KV#{self.id}",
-                )
-                it.transaction = t
-                it.save(update_fields=['transaction'])
+        from .stock import sync_voucher_transactions
+        return sync_voucher_transactions(self)
 
-    def save(self, *args, **kwargs):
-        creating = self.pk is None
+    def save(self, *args, sync=True, **kwargs):
+        # callers that write the items afterwards pass sync=False and call
+        # sync_transactions() once themselves
         super().save(*args, **kwargs)
-        # on create/update, (re)sync transactions
-        self.sync_transactions()
+        if sync:
+            self.sync_transactions()
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        # items cascade without their delete(); take their stock moves back here
+        from .stock import unrecord
+        unrecord(self.items.values_list('transaction_id', flat=True))
+        return super().delete(*args, **kwargs)
 
 
 class KitchenVoucherItem(models.Model):
@@ -1170,11 +1399,48 @@ class KitchenVoucherItem(models.Model):
             raise ValidationError("Quantity must be > 0")
 
     def delete(self, *args, **kwargs):
-        # remove paired transaction as well
-        t = self.transaction
-        super().delete(*args, **kwargs)
-        if t:
-            t.delete()
+        # remove the paired transaction as well, and its stock move
+        # (`transaction` is the field here, hence the aliased import)
+        from django.db import transaction as db_transaction
+        from .stock import unrecord
+        with db_transaction.atomic():
+            transaction_id = self.transaction_id
+            result = super().delete(*args, **kwargs)
+            unrecord([transaction_id])
+        return result
+
+
+class VarianceDay(models.Model):
+    """
+    Closed business day of the kitchen variance report (see core.variance).
+    Its VarianceLines are cached here once the day is over and dropped when
+    a voucher or an order item of that day changes.
+    """
+    day = models.DateField(unique=True, help_text="Business day (see POSSettings.start_of_day_time)")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Variance {self.day}"
+
+
+class VarianceLine(models.Model):
+    """
+    One raw material on one VarianceDay, in the material's own (stock) unit:
+    issued to / returned from the kitchen against what sales should have used.
+    """
+    variance_day = models.ForeignKey(VarianceDay, on_delete=models.CASCADE, related_name='lines')
+    raw_material = models.ForeignKey('RawMaterial', on_delete=models.CASCADE, related_name='variance_lines')
+    issued = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    returned = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    theoretical = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['variance_day', 'raw_material'], name='uniq_variance_day_material'),
+        ]
+
+    def __str__(self):
+        return f"{self.raw_material} {self.variance_day.day}: {self.issued - self.returned - self.theoretical}"
 
 
 # models.py
@@ -1260,6 +1526,13 @@ class PaymentReceived(models.Model):
     # Link to CashFlow so ledger stays in sync
     cashflow = models.OneToOneField('CashFlow', on_delete=models.SET_NULL, null=True, blank=True, related_name='linked_income')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'date']),
+            models.Index(fields=['supplier', 'date']),
+            models.Index(fields=['supplier', 'created_at']),
+        ]
+
     def __str__(self):
         name = self.customer.name if self.customer else (self.supplier.name if self.supplier else "Unknown")
         return f"Recv {self.amount} from {name}"
@@ -1277,24 +1550,9 @@ class PaymentReceived(models.Model):
 
     @transaction.atomic
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        old_amount = 0
-        
-        if not is_new:
-            # If editing, get the old object to revert balance changes
-            old_obj = PaymentReceived.objects.get(pk=self.pk)
-            old_amount = old_obj.amount
-            # Revert old customer balance change
-            if old_obj.customer:
-                old_obj.customer.current_balance += old_obj.amount # Add it back (revert payment)
-                old_obj.customer.save()
-
         super().save(*args, **kwargs)
 
-        # 1. Update Customer Balance (Money In = Balance Decreases)
-        if self.customer:
-            self.customer.current_balance -= self.amount
-            self.customer.save()
+        # 1. Customer balance: moved by the ledger posting in step 3
 
         # 2. Sync with CashFlow
         from .models import CashFlow
@@ -1322,15 +1580,251 @@ class PaymentReceived(models.Model):
             cf.description = desc
             cf.save()
 
+        # 3. Customer ledger posting (replaces the old one when editing; the
+        #    balance moves by the difference, Money In = Balance Decreases)
+        from .customer_ledger import post_receipt
+        post_receipt(self)
+
     @transaction.atomic
     def delete(self, *args, **kwargs):
-        # 1. Revert Customer Balance
-        if self.customer:
-            self.customer.current_balance += self.amount # Add debt back
-            self.customer.save()
+        # 1. Revert Customer Balance (Add debt back)
+        if self.customer_id:
+            from .customer_ledger import unpost_receipt
+            unpost_receipt(self)
         
         # 2. Remove Cashflow
         if self.cashflow:
             self.cashflow.delete()
             
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        super().delete(*args, **kwargs)
+
+class CustomerLedgerEntry(models.Model):
+    """
+    One posting on a customer's Udhaar account, maintained by
+    core.customer_ledger. `balance` is the running balance after this entry
+    (entries ordered by posted_at, id): a ledger window is a single range
+    scan and its opening balance is the balance of the entry just before it.
+    """
+    ORDER = 'order'
+    COUNTER_PAYMENT = 'counter_payment'
+    RECEIPT = 'receipt'
+    ADJUSTMENT = 'adjustment'
+    OPENING = 'opening'
+    KIND_CHOICES = [
+        (ORDER, 'Credit Sale'),
+        (COUNTER_PAYMENT, 'Paid at Counter'),
+        (RECEIPT, 'Payment Received'),
+        (ADJUSTMENT, 'Balance Adjustment'),
+        (OPENING, 'Balance Carried Forward'),
+    ]
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='ledger_entries')
+    posted_at = models.DateTimeField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_entries')
+    receipt = models.ForeignKey(PaymentReceived, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_entries')
+    description = models.CharField(max_length=500, blank=True)
+    debit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['posted_at', 'id']
+        indexes = [
+            models.Index(fields=['customer', 'posted_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.customer_id} {self.posted_at:%Y-%m-%d} Dr {self.debit} Cr {self.credit} = {self.balance}"
+
+
+@receiver(pre_delete, sender=Order)
+def unpost_deleted_order(sender, instance, **kwargs):
+    # keep later running balances right; the entries themselves cascade
+    if instance.customer_id:
+        from .customer_ledger import unpost_order
+        unpost_order(instance)
+
+
+class StaffMonthBalance(models.Model):
+    """
+    Cached payroll month for one staff member (see core.payroll): salary
+    accrued and paid in `month`, and the running balance owed at its end.
+    Rows are dropped from the affected month onwards whenever a salary
+    expense or the staff member's salary settings change, and rebuilt lazily.
+    """
+    staff = models.ForeignKey(Staff, on_delete=models.CASCADE, related_name='month_balances')
+    month = models.DateField(help_text="First day of the month")
+    accrued = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    closing = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('staff', 'month')
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+
+    def __str__(self):
+        return f"{self.staff_id} {self.month:%b %Y}: {self.closing}"
+
+
+# ---------- payroll cache invalidation (core.payroll) ----------
+
+def _is_salary(expense):
+    return expense.staff_id and (expense.category or '').lower() == ExpenseCategory.SALARY
+
+
+@receiver(pre_save, sender=Expense)
+def drop_payroll_months_for_old_expense(sender, instance, raw=False, **kwargs):
+    # an edit may move the payment to another month or staff member
+    if raw or not instance.pk:
+        return
+    old = Expense.objects.filter(pk=instance.pk).only('staff_id', 'category', 'date').first()
+    if old and _is_salary(old):
+        from .payroll import invalidate_from
+        invalidate_from(old.staff_id, old.date)
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def drop_payroll_months_for_expense(sender, instance, raw=False, **kwargs):
+    if raw or not _is_salary(instance):
+        return
+    from .payroll import invalidate_from, invalidate_staff
+    staff = instance.staff
+    if not (staff.salary_start or staff.joined_on):
+        # the first payment decides where accrual starts
+        invalidate_staff(staff.pk)
+    else:
+        invalidate_from(staff.pk, instance.date)
+
+
+@receiver(pre_save, sender=Staff)
+def drop_payroll_months_for_salary_change(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    old = Staff.objects.filter(pk=instance.pk).values('monthly_salary', 'salary_start', 'joined_on').first()
+    if old and (old['monthly_salary'] != instance.monthly_salary
+                or old['salary_start'] != instance.salary_start
+                or old['joined_on'] != instance.joined_on):
+        from .payroll import invalidate_staff
+        invalidate_staff(instance.pk)
+
+
+class PartyBalance(models.Model):
+    """
+    Balances index for the ledger home: one row per supplier / customer /
+    staff member with its current balance and last activity, maintained
+    incrementally by core.party_balances.
+
+    Supplier & staff: positive = we owe them. Customer: positive = they owe us.
+    """
+    SUPPLIER = 'supplier'
+    CUSTOMER = 'customer'
+    STAFF = 'staff'
+    PARTY_TYPES = [
+        (SUPPLIER, 'Supplier'),
+        (CUSTOMER, 'Customer'),
+        (STAFF, 'Staff'),
+    ]
+
+    party_type = models.CharField(max_length=10, choices=PARTY_TYPES)
+    party_id = models.PositiveIntegerField()
+    name = models.CharField(max_length=150, blank=True)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('party_type', 'party_id')
+        indexes = [
+            models.Index(fields=['party_type', 'balance']),
+            models.Index(fields=['party_type', 'name']),
+            models.Index(fields=['party_type', 'last_activity']),
+        ]
+
+    def __str__(self):
+        return f"{self.party_type} {self.name}: {self.balance}"
+
+    @property
+    def abs_balance(self):
+        return abs(self.balance)
+
+
+class StockMonthSnapshot(models.Model):
+    """
+    Closed month of one raw material's stock movements (see core.movements):
+    running totals of every InventoryTransaction dated up to the month's
+    last day, by source. Rows are appended lazily up to the last closed
+    month and dropped from the affected month onwards when a movement dated
+    in it changes.
+    """
+    raw_material = models.ForeignKey(RawMaterial, on_delete=models.CASCADE, related_name='month_snapshots')
+    month = models.DateField(help_text="First day of the month")
+    purchased = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    issued = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    returned = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sold = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    other = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Net manual movements")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['raw_material', 'month'], name='uniq_stock_snapshot_material_month'),
+        ]
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+
+    def __str__(self):
+        return f"{self.raw_material_id} {self.month:%Y-%m}"
+
+
+class CashDaySnapshot(models.Model):
+    """
+    Closed business day of one cash book account (see core.cashbook): a bank
+    account, or the till when bank_account is empty. Rows are appended
+    lazily up to the last closed business day and dropped from the affected
+    day onwards whenever a cash flow on that account changes.
+    """
+    bank_account = models.ForeignKey(BankAccount, null=True, blank=True, on_delete=models.CASCADE,
+                                     related_name='day_snapshots')
+    day = models.DateField(help_text="Business day (see POSSettings.start_of_day_time)")
+    opening = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cash_in = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cash_out = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    closing = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bank_account', 'day'], name='uniq_cash_snapshot_bank_day'),
+            # NULLs never collide in a plain unique constraint
+            models.UniqueConstraint(fields=['day'], condition=models.Q(bank_account__isnull=True),
+                                    name='uniq_cash_snapshot_till_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.bank_account_id or 'cash'} {self.day}: {self.closing}"
+
+
+# ---------- cash book invalidation (core.cashbook) ----------
+
+@receiver(pre_save, sender=BankAccount)
+def drop_cash_days_for_opening_change(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    old = BankAccount.objects.filter(pk=instance.pk).values_list('opening_balance', flat=True).first()
+    if old is not None and old != instance.opening_balance:
+        CashDaySnapshot.objects.filter(bank_account_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=BankAccount)
+def drop_cash_days_for_bank_delete(sender, instance, **kwargs):
+    # its cash flows are SET_NULL, i.e. they become till cash
+    first = CashFlow.objects.filter(bank_account=instance).order_by('business_date') \
+        .values_list('business_date', flat=True).first()
+    if first:
+        from .cashbook import invalidate_from
+        invalidate_from(None, first)
@@ -0,0 +1,205 @@
+# core/movements.py
+"""
+Stock movement index.
+
+InventoryTransaction is the one movement table: every PO receipt, kitchen
+voucher issue / return and sales deduction writes a row, tagged with its
+`source` and indexed by (raw_material, date). Per material it adds up to
+
+    purchased  PO receipts, less reversals of edited POs
+    issued     kitchen voucher issues
+    returned   kitchen voucher returns
+    sold       recipe consumption of sales, less edits / returns
+    other      net manual movements
+
+    store balance = purchased - issued + returned
+    stock balance = store balance - sold + other   (current_stock)
+
+Closed months are cached per material in StockMonthSnapshot as running
+totals, so the totals at any date are one snapshot row plus a bounded
+range of movements instead of a scan from the first purchase:
+
+  * build_snapshots() appends the missing months up to the last closed
+    month (one grouped aggregate for all materials);
+  * invalidate_from() drops a material's rows from a month onwards;
+    InventoryTransaction.save(), the receiver below and the bulk writers
+    in core.stock call it.
+
+Other bulk writes (generate_dataset, queryset.update/delete) call
+invalidate_from() / clear_snapshots() themselves.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Max, Min, Q, Sum, Value, When
+from django.db.models.signals import post_delete
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import InventoryTransaction as Txn, StockMonthSnapshot
+
+ZERO = Decimal("0")
+DEC = DecimalField(max_digits=14, decimal_places=2)
+FIELDS = ("purchased", "issued", "returned", "sold", "other")
+STORE_SOURCES = (Txn.PURCHASE, Txn.KITCHEN)
+
+_IN = Q(transaction_type__in=("in", "return"))
+_OUT = Q(transaction_type="out")
+
+
+def _sum(*whens):
+    return Coalesce(Sum(Case(*whens, default=Value(ZERO), output_field=DEC)), Value(ZERO), output_field=DEC)
+
+
+SUMS = {
+    "purchased": _sum(When(_IN & Q(source=Txn.PURCHASE), then=F("quantity")),
+                      When(_OUT & Q(source=Txn.PURCHASE), then=-F("quantity"))),
+    "issued": _sum(When(_OUT & Q(source=Txn.KITCHEN), then=F("quantity"))),
+    "returned": _sum(When(_IN & Q(source=Txn.KITCHEN), then=F("quantity"))),
+    "sold": _sum(When(_OUT & Q(source=Txn.SALE), then=F("quantity")),
+                 When(_IN & Q(source=Txn.SALE), then=-F("quantity"))),
+    "other": _sum(When(_IN & Q(source=Txn.MANUAL), then=F("quantity")),
+                  When(_OUT & Q(source=Txn.MANUAL), then=-F("quantity"))),
+}
+
+
+def store_balance(t):
+    return t["purchased"] - t["issued"] + t["returned"]
+
+
+def stock_balance(t):
+    return store_balance(t) - t["sold"] + t["other"]
+
+
+def _zero():
+    return dict.fromkeys(FIELDS, ZERO)
+
+
+# ---------- months ----------
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def prev_month(month):
+    return (month - timedelta(days=1)).replace(day=1)
+
+
+def current_month():
+    return month_start(timezone.localdate())
+
+
+def last_closed_month():
+    return prev_month(current_month())
+
+
+# ---------- invalidation ----------
+
+def invalidate_from(rm_ids, day):
+    """Drop the snapshots of `rm_ids` from the month of `day` on (the open month has none)."""
+    rm_ids = {pk for pk in rm_ids if pk}
+    if day is None or not rm_ids or day >= current_month():
+        return
+    StockMonthSnapshot.objects.filter(raw_material_id__in=rm_ids, month__gte=month_start(day)).delete()
+
+
+def clear_snapshots():
+    StockMonthSnapshot.objects.all().delete()
+
+
+# ---------- build ----------
+
+def build_snapshots():
+    """
+    Close every month up to the last closed one for each raw material, from
+    the month of its first movement on. Returns rows created.
+    """
+    closed, open_month = last_closed_month(), current_month()
+    last = dict(StockMonthSnapshot.objects.values("raw_material").annotate(m=Max("month"))
+                .values_list("raw_material", "m"))
+    pending = {rm: m for rm, m in last.items() if m < closed}
+    for rm, first in (Txn.objects.filter(raw_material__isnull=False, date__lt=open_month)
+                      .exclude(raw_material__in=list(last))
+                      .values("raw_material").annotate(d=Min("date")).values_list("raw_material", "d")):
+        pending[rm] = prev_month(month_start(first))
+    if not pending:
+        return 0
+
+    running = {rm: _zero() for rm in pending}
+    for snap in StockMonthSnapshot.objects.filter(raw_material_id__in=[rm for rm in pending if rm in last],
+                                                  month__in=set(last.values())):
+        if last[snap.raw_material_id] == snap.month:
+            running[snap.raw_material_id] = {f: getattr(snap, f) for f in FIELDS}
+
+    moved = {}
+    for row in (Txn.objects
+                .filter(raw_material_id__in=list(pending), date__gte=next_month(min(pending.values())),
+                        date__lt=open_month)
+                .annotate(m=TruncMonth("date"))
+                .values("raw_material", "m")
+                .annotate(**SUMS)
+                .values("raw_material", "m", *FIELDS)):
+        moved[(row["raw_material"], row["m"])] = row
+
+    rows = []
+    for rm, after in pending.items():
+        totals = running[rm]
+        month = next_month(after)
+        while month <= closed:
+            step = moved.get((rm, month))
+            if step:
+                totals = {f: totals[f] + step[f] for f in FIELDS}
+            rows.append(StockMonthSnapshot(raw_material_id=rm, month=month, **totals))
+            month = next_month(month)
+    StockMonthSnapshot.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+
+# ---------- reads ----------
+
+def totals(before=None, rm_ids=None):
+    """
+    {raw_material_id: {purchased, issued, returned, sold, other}} of every
+    movement dated before `before` (default: all of them) -- one snapshot
+    month plus a live aggregate of at most a month and a bit.
+    """
+    closed = last_closed_month()
+    build_snapshots()
+    snap_month = closed if before is None else min(prev_month(month_start(before)), closed)
+
+    snaps = StockMonthSnapshot.objects.filter(month=snap_month)
+    live = Txn.objects.filter(raw_material__isnull=False, date__gte=next_month(snap_month))
+    if before is not None:
+        live = live.filter(date__lt=before)
+    if rm_ids is not None:
+        snaps, live = snaps.filter(raw_material_id__in=rm_ids), live.filter(raw_material_id__in=rm_ids)
+
+    out = {s.raw_material_id: {f: getattr(s, f) for f in FIELDS} for s in snaps}
+    for row in live.values("raw_material").annotate(**SUMS).values("raw_material", *FIELDS):
+        t = out.setdefault(row["raw_material"], _zero())
+        for f in FIELDS:
+            t[f] += row[f]
+    return out
+
+
+def moves(rm_id, start=None, end=None, sources=None):
+    """One material's movements dated start..end (either open), oldest first."""
+    qs = Txn.objects.filter(raw_material_id=rm_id)
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    if sources:
+        qs = qs.filter(source__in=sources)
+    return qs.order_by("date", "timestamp", "id")
+
+
+def _movement_deleted(sender, instance, **kwargs):
+    invalidate_from([instance.raw_material_id], instance.date)
+
+
+post_delete.connect(_movement_deleted, sender=Txn, dispatch_uid="movements_txn_gone")
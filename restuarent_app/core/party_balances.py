@@ -0,0 +1,338 @@
+# core/party_balances.py
+"""
+Balances index behind the ledger home (PartyBalance).
+
+Every write that moves a party's balance is turned into a signed delta:
+
+    PurchaseOrder            supplier  + net total     (we owe more)
+    Expense                  supplier  - amount        (we paid)
+                             staff     - amount        (salary paid)
+    PaymentReceived          supplier  + amount        (refund in)
+    CustomerLedgerEntry      customer  + debit - credit
+        (written by the Order / Payment / PaymentReceived paths and balance
+         adjustments, see core.customer_ledger)
+
+pre_save remembers what the row contributed before an edit; post_save
+applies new - old, post_delete applies -old. Each delta is a single
+UPDATE ... SET balance = balance + delta.
+
+supplier_payable() is the lookup behind the purchase order "previous due"
+(one indexed row instead of summing the supplier's whole history) and
+`manage.py verify_supplier_balances` checks those rows against the full
+aggregate.
+
+Staff salary accrues with time, not with writes: refresh_staff() copies the
+current month closing from the payroll cache (core.payroll) whenever that
+cache had to be rebuilt. `manage.py rebuild_party_balances` recomputes
+everything from scratch; the receivers are connected in CoreConfig.ready().
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Max
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Supplier, Customer, Staff, PurchaseOrder, Expense, ExpenseCategory, PaymentReceived,
+    CustomerLedgerEntry, PartyBalance, StaffMonthBalance,
+)
+
+logger = logging.getLogger("core.ledger")
+
+ZERO = Decimal("0")
+_state = threading.local()
+PARTY_MODELS = {
+    PartyBalance.SUPPLIER: Supplier,
+    PartyBalance.CUSTOMER: Customer,
+    PartyBalance.STAFF: Staff,
+}
+PARTY_TYPES = {model: party_type for party_type, model in PARTY_MODELS.items()}
+
+
+def party_label(obj):
+    """Searchable name stored on the index row (customers are found by phone too)."""
+    if isinstance(obj, Customer):
+        return f"{obj.name} ({obj.phone})"
+    if isinstance(obj, Staff):
+        return obj.full_name
+    return obj.name
+
+
+# ---------- what a row contributes ----------
+
+def _po_amount(po):
+    return Decimal(po.net_total or 0) or Decimal(po.total_cost or 0)
+
+
+def contributions(instance):
+    """[(party_type, party_id, signed amount, when)] for one source row."""
+    out = []
+    if isinstance(instance, PurchaseOrder):
+        out.append((PartyBalance.SUPPLIER, instance.supplier_id, _po_amount(instance), instance.created_at))
+    elif isinstance(instance, Expense):
+        amount = Decimal(instance.amount or 0)
+        when = instance.created_at
+        supplier_id = instance.supplier_id
+        if not supplier_id and instance.purchase_order_id:
+            supplier_id = (PurchaseOrder.objects.filter(pk=instance.purchase_order_id)
+                           .values_list('supplier_id', flat=True).first())
+        if supplier_id:
+            out.append((PartyBalance.SUPPLIER, supplier_id, -amount, when))
+        if instance.staff_id and (instance.category or '').lower() == ExpenseCategory.SALARY:
+            out.append((PartyBalance.STAFF, instance.staff_id, -amount, when))
+    elif isinstance(instance, PaymentReceived):
+        if instance.supplier_id and instance.party_type == 'supplier':
+            out.append((PartyBalance.SUPPLIER, instance.supplier_id, Decimal(instance.amount or 0),
+                        instance.created_at))
+    elif isinstance(instance, CustomerLedgerEntry):
+        out.append((PartyBalance.CUSTOMER, instance.customer_id, instance.debit - instance.credit,
+                    instance.posted_at))
+    return [c for c in out if c[1]]
+
+
+def apply_delta(party_type, party_id, delta, when=None):
+    qs = PartyBalance.objects.filter(party_type=party_type, party_id=party_id)
+    changes = {}
+    if delta:
+        changes['balance'] = F('balance') + delta
+    if when is not None:
+        changes['last_activity'] = Greatest(Coalesce(F('last_activity'), when), when)
+    if not changes:
+        return
+    if not qs.update(**changes):
+        ensure_row(party_type, party_id)
+        qs.update(**changes)
+
+
+def ensure_row(party_type, party_id):
+    obj = PARTY_MODELS[party_type].objects.filter(pk=party_id).first()
+    PartyBalance.objects.get_or_create(party_type=party_type, party_id=party_id,
+                                       defaults={'name': party_label(obj) if obj else ''})
+
+
+# ---------- signal receivers ----------
+
+@contextmanager
+def muted():
+    """Skip the incremental updates (bulk rebuilds resync afterwards)."""
+    _state.muted = True
+    try:
+        yield
+    finally:
+        _state.muted = False
+
+
+def _muted():
+    return getattr(_state, 'muted', False)
+
+
+SOURCES = (PurchaseOrder, Expense, PaymentReceived, CustomerLedgerEntry)
+
+
+def _remember_old(sender, instance, raw=False, **kwargs):
+    instance._party_before = []
+    if raw or _muted() or not instance.pk:
+        return
+    old = sender.objects.filter(pk=instance.pk).first()
+    if old is not None:
+        instance._party_before = contributions(old)
+
+
+def _apply_saved(sender, instance, raw=False, **kwargs):
+    if raw or _muted():
+        return
+    for party_type, party_id, amount, _ in getattr(instance, '_party_before', []):
+        apply_delta(party_type, party_id, -amount)
+    for party_type, party_id, amount, when in contributions(instance):
+        apply_delta(party_type, party_id, amount, when)
+    instance._party_before = []
+
+
+def _apply_deleted(sender, instance, **kwargs):
+    if _muted():
+        return
+    for party_type, party_id, amount, _ in contributions(instance):
+        apply_delta(party_type, party_id, -amount)
+
+
+for _model in SOURCES:
+    pre_save.connect(_remember_old, sender=_model, dispatch_uid=f"party_old_{_model.__name__}")
+    post_save.connect(_apply_saved, sender=_model, dispatch_uid=f"party_saved_{_model.__name__}")
+    post_delete.connect(_apply_deleted, sender=_model, dispatch_uid=f"party_deleted_{_model.__name__}")
+
+
+def _party_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    party_type = PARTY_TYPES[sender]
+    name = party_label(instance)
+    row, made = PartyBalance.objects.get_or_create(party_type=party_type, party_id=instance.pk,
+                                                   defaults={'name': name})
+    if not made and row.name != name:
+        PartyBalance.objects.filter(pk=row.pk).update(name=name)
+
+
+def _party_deleted(sender, instance, **kwargs):
+    PartyBalance.objects.filter(party_type=PARTY_TYPES[sender], party_id=instance.pk).delete()
+
+
+for _model in (Supplier, Customer, Staff):
+    post_save.connect(_party_saved, sender=_model, dispatch_uid=f"party_row_{_model.__name__}")
+    post_delete.connect(_party_deleted, sender=_model, dispatch_uid=f"party_gone_{_model.__name__}")
+
+
+# ---------- resync helpers ----------
+
+def sync_customers(customer_ids=None):
+    """Copy the latest customer-ledger running balance into the index (after a ledger rebuild)."""
+    latest = CustomerLedgerEntry.objects.filter(customer_id=OuterRef('party_id')).order_by('-posted_at', '-id')
+    qs = PartyBalance.objects.filter(party_type=PartyBalance.CUSTOMER)
+    if customer_ids is not None:
+        qs = qs.filter(party_id__in=customer_ids)
+    qs.update(
+        balance=Coalesce(Subquery(latest.values('balance')[:1]), ZERO),
+        last_activity=Subquery(latest.values('posted_at')[:1]),
+    )
+
+
+# ---------- staff accrual ----------
+
+def refresh_staff():
+    """Bring staff rows up to the current payroll month (a no-op once the cache is warm)."""
+    from .payroll import build_month_balances, month_start
+    if not build_month_balances():
+        return
+    current = month_start(timezone.localdate())
+    PartyBalance.objects.filter(party_type=PartyBalance.STAFF).update(
+        balance=Coalesce(Subquery(
+            StaffMonthBalance.objects.filter(staff_id=OuterRef('party_id'), month=current).values('closing')[:1]
+        ), ZERO)
+    )
+
+
+# ---------- supplier payables ----------
+
+def supplier_activity():
+    """
+    (supplier_id, signed amount, last activity) per source from grouped
+    aggregates -- the same entries the supplier ledger lists.
+    """
+    from .supplier_ledger import PO_AMOUNT
+
+    yield from (PurchaseOrder.objects.values('supplier_id')
+                .annotate(s=Sum(PO_AMOUNT), last=Max('created_at'))
+                .values_list('supplier_id', 's', 'last'))
+    for sid, s, last in (Expense.objects.filter(supplier__isnull=False).values('supplier_id')
+                         .annotate(s=Sum('amount'), last=Max('created_at'))
+                         .values_list('supplier_id', 's', 'last')):
+        yield sid, -(s or ZERO), last
+    for sid, s, last in (Expense.objects.filter(supplier__isnull=True, purchase_order__isnull=False)
+                         .values('purchase_order__supplier_id')
+                         .annotate(s=Sum('amount'), last=Max('created_at'))
+                         .values_list('purchase_order__supplier_id', 's', 'last')):
+        yield sid, -(s or ZERO), last
+    yield from (PaymentReceived.objects.filter(supplier__isnull=False, party_type='supplier')
+                .values('supplier_id').annotate(s=Sum('amount'), last=Max('created_at'))
+                .values_list('supplier_id', 's', 'last'))
+
+
+def supplier_payable(supplier_id, exclude_po_id=None):
+    """
+    What we owe a supplier, read from the balances index (one row lookup).
+    With `exclude_po_id` the stored PO and the payments made against it are
+    taken back out -- the "previous due" shown while editing that PO.
+    """
+    from .supplier_ledger import PO_AMOUNT, SupplierLedger
+
+    balance = (PartyBalance.objects.filter(party_type=PartyBalance.SUPPLIER, party_id=supplier_id)
+               .values_list('balance', flat=True).first())
+    if balance is None:
+        # no index row yet (e.g. restored data before a rebuild): aggregate once
+        supplier = Supplier.objects.filter(pk=supplier_id).first()
+        balance = SupplierLedger(supplier).balance_through() if supplier else ZERO
+    if exclude_po_id:
+        po = (PurchaseOrder.objects.filter(pk=exclude_po_id, supplier_id=supplier_id)
+              .annotate(amount=PO_AMOUNT).values_list('amount', flat=True).first())
+        if po is not None:
+            paid = (Expense.objects.filter(purchase_order_id=exclude_po_id)
+                    .filter(Q(supplier_id=supplier_id) | Q(supplier__isnull=True))
+                    .aggregate(s=Coalesce(Sum('amount'), ZERO))['s'])
+            balance = balance - po + paid
+    return Decimal(balance).quantize(Decimal('0.01'))
+
+
+def verify_suppliers(fix=False):
+    """
+    Compare the stored supplier balances with the full aggregate. Returns
+    [(supplier_id, name, stored, actual)] for the rows that differ, after
+    rewriting them when `fix` is set.
+    """
+    actual = {}
+    for sid, amount, _ in supplier_activity():
+        actual[sid] = actual.get(sid, ZERO) + (amount or ZERO)
+    stored = dict(PartyBalance.objects.filter(party_type=PartyBalance.SUPPLIER)
+                  .values_list('party_id', 'balance'))
+    bad = [
+        (sid, name, stored.get(sid), actual.get(sid, ZERO))
+        for sid, name in Supplier.objects.order_by('name').values_list('id', 'name')
+        if stored.get(sid) != actual.get(sid, ZERO)
+    ]
+    if fix:
+        for sid, _, before, amount in bad:
+            if before is None:
+                ensure_row(PartyBalance.SUPPLIER, sid)
+            PartyBalance.objects.filter(party_type=PartyBalance.SUPPLIER, party_id=sid).update(balance=amount)
+        if bad:
+            logger.warning("Supplier balances repaired: %d row(s)", len(bad))
+    return bad
+
+
+# ---------- full rebuild ----------
+
+def rebuild_party_balances():
+    """Recompute every row from the source tables (grouped aggregates). Returns the row count."""
+    from .payroll import build_month_balances, month_start
+
+    rows = {}
+
+    def row(party_type, pk, name):
+        rows[(party_type, pk)] = PartyBalance(party_type=party_type, party_id=pk, name=name)
+        return rows[(party_type, pk)]
+
+    def bump(party_type, pk, amount, when):
+        r = rows.get((party_type, pk))
+        if r is None:
+            return
+        r.balance += amount or ZERO
+        if when and (r.last_activity is None or when > r.last_activity):
+            r.last_activity = when
+
+    for party_type, model in PARTY_MODELS.items():
+        for obj in model.objects.all():
+            row(party_type, obj.pk, party_label(obj))
+
+    for sid, s, last in supplier_activity():
+        bump(PartyBalance.SUPPLIER, sid, s, last)
+
+    for cid, s, last in (CustomerLedgerEntry.objects.values('customer_id')
+                         .annotate(s=Sum(F('debit') - F('credit')), last=Max('posted_at'))
+                         .values_list('customer_id', 's', 'last')):
+        bump(PartyBalance.CUSTOMER, cid, s, last)
+
+    build_month_balances()
+    current = month_start(timezone.localdate())
+    for sid, closing in StaffMonthBalance.objects.filter(month=current).values_list('staff_id', 'closing'):
+        bump(PartyBalance.STAFF, sid, closing, None)
+    for sid, last in (Expense.objects.filter(staff__isnull=False, category__iexact=ExpenseCategory.SALARY)
+                      .values('staff_id').annotate(last=Max('created_at')).values_list('staff_id', 'last')):
+        bump(PartyBalance.STAFF, sid, ZERO, last)
+
+    PartyBalance.objects.all().delete()
+    PartyBalance.objects.bulk_create(rows.values(), batch_size=1000)
+    logger.info("Party balances rebuilt: %d rows", len(rows))
+    return len(rows)
@@ -0,0 +1,147 @@
+# core/payroll.py
+"""
+Payroll ledger service.
+
+Salary accrues on the first of every month from the staff member's
+salary_start (or joined_on, or first salary payment) at the current
+monthly_salary; salary Expenses pay it down. Closing balances per month
+are cached in StaffMonthBalance so the staff ledger and the ledger home
+never re-walk a whole tenure:
+
+  * build_month_balances() appends the missing months up to the current one
+    (a few grouped queries for all staff at once);
+  * invalidate_from() drops a staff member's rows from a month onwards; it is
+    called from the Expense / Staff signal handlers in models.py.
+
+Bulk writes (bulk_create, queryset.update/delete) skip those signals: call
+invalidate_from() / invalidate_staff() yourself after them.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Abs, TruncMonth
+from django.utils import timezone
+
+from .models import Expense, ExpenseCategory, Staff, StaffMonthBalance
+
+ZERO = Decimal("0")
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_month(d):
+    return date(d.year + (1 if d.month == 12 else 0), 1 if d.month == 12 else d.month + 1, 1)
+
+
+def salary_payments():
+    return Expense.objects.filter(category__iexact=ExpenseCategory.SALARY, staff__isnull=False)
+
+
+# ---------- invalidation ----------
+
+def invalidate_from(staff_id, day):
+    StaffMonthBalance.objects.filter(staff_id=staff_id, month__gte=month_start(day)).delete()
+
+
+def invalidate_staff(staff_id):
+    StaffMonthBalance.objects.filter(staff_id=staff_id).delete()
+
+
+# ---------- build ----------
+
+def build_month_balances(staff_ids=None, through=None):
+    """
+    Make sure every staff member (or just `staff_ids`) has cached months up to
+    `through` (default: the current month). Returns the number of rows created.
+    """
+    through = month_start(through or timezone.localdate())
+    stale = Staff.objects.exclude(month_balances__month=through)
+    if staff_ids is not None:
+        stale = stale.filter(pk__in=staff_ids)
+    staff = list(stale)
+    if not staff:
+        return 0
+    ids = [s.id for s in staff]
+
+    last_month = dict(
+        StaffMonthBalance.objects.filter(staff_id__in=ids)
+        .values('staff_id').annotate(m=Max('month')).values_list('staff_id', 'm')
+    )
+    last_closing = {
+        r.staff_id: r.closing
+        for r in StaffMonthBalance.objects.filter(
+            staff_id__in=list(last_month), month__in=set(last_month.values()))
+        if last_month.get(r.staff_id) == r.month
+    }
+    earliest = dict(
+        salary_payments().filter(staff_id__in=ids)
+        .values('staff_id').annotate(m=Min('date')).values_list('staff_id', 'm')
+    )
+
+    first_month = {}
+    for s in staff:
+        if s.id in last_month:
+            first_month[s.id] = add_month(last_month[s.id])
+        else:
+            base = s.salary_start or s.joined_on or earliest.get(s.id) or through
+            first_month[s.id] = month_start(min(base, earliest.get(s.id) or base))
+
+    paid = {}
+    for sid, m, total in (
+        salary_payments()
+        .filter(staff_id__in=ids, date__gte=min(first_month.values()), date__lt=add_month(through))
+        .annotate(m=TruncMonth('date')).values('staff_id', 'm')
+        .annotate(s=Sum('amount')).values_list('staff_id', 'm', 's')
+    ):
+        paid[(sid, month_start(m))] = total or ZERO
+
+    rows = []
+    for s in staff:
+        monthly = Decimal(s.monthly_salary or 0)
+        base = month_start(s.salary_start or s.joined_on or earliest.get(s.id) or through)
+        running = last_closing.get(s.id, ZERO)
+        cur = first_month[s.id]
+        while cur <= through:
+            accrued = monthly if cur >= base else ZERO
+            p = paid.get((s.id, cur), ZERO)
+            running += accrued - p
+            rows.append(StaffMonthBalance(staff=s, month=cur, accrued=accrued, paid=p, closing=running))
+            cur = add_month(cur)
+    StaffMonthBalance.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# ---------- reads ----------
+
+def opening_balance(staff, day):
+    """
+    Balance owed to `staff` before a ledger window starting on `day`: accruals
+    of the months before day's month, less every salary paid before `day`
+    (the accrual of day's own month is a row inside the window).
+    """
+    first = month_start(day)
+    build_month_balances([staff.id], through=first)
+    prev = (StaffMonthBalance.objects
+            .filter(staff=staff, month__lt=first)
+            .order_by('-month').values_list('closing', flat=True).first()) or ZERO
+    paid_early = ZERO
+    if day > first:
+        paid_early = (salary_payments()
+                      .filter(staff=staff, date__gte=first, date__lt=day)
+                      .aggregate(s=Sum('amount'))['s']) or ZERO
+    return prev - paid_early
+
+
+def staff_with_balances():
+    """All staff with `balance` = what we owe them now. One query once the cache is warm."""
+    current = month_start(timezone.localdate())
+    build_month_balances(through=current)
+    return Staff.objects.annotate(
+        balance=Subquery(
+            StaffMonthBalance.objects.filter(staff=OuterRef('pk'), month=current).values('closing')[:1]
+        ),
+        abs_balance=Abs('balance'),
+    ).order_by('full_name')
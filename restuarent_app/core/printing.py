@@ -1,5 +1,12 @@
+import logging
+import time
+
 import win32print
 
+from .instrumentation import add_printer_time
+
+logger = logging.getLogger("core.printing")
+
 # Default fallback printer
 DEFAULT_PRINTER_NAME = "POS80 Printer"
 
@@ -11,9 +18,9 @@ def send_to_printer(raw_bytes: bytes, printer_name: str = None) -> None:
     # 1. Use the specific name provided, otherwise fallback to default
     target_printer = printer_name if printer_name else DEFAULT_PRINTER_NAME
 
-    # Debugging: check your console to see which printer is being targeted
-    print(f"DEBUG: Attempting to print to: {target_printer}") 
+    logger.debug("Sending %d bytes to printer %s", len(raw_bytes), target_printer)
 
+    started = time.perf_counter()
     try:
         hprinter = win32print.OpenPrinter(target_printer)
         try:
@@ -27,8 +34,10 @@ def send_to_printer(raw_bytes: bytes, printer_name: str = None) -> None:
             win32print.ClosePrinter(hprinter)
 
     except Exception as e:
-        print(f"CRITICAL PRINTER ERROR on {target_printer}: {e}")
         # We catch the error so the order still saves even if print fails
+        logger.error("Printer error on %s: %s", target_printer, e, extra={"printer": target_printer})
+    finally:
+        add_printer_time((time.perf_counter() - started) * 1000)
 
 
 
@@ -0,0 +1,163 @@
+# core/purchasing.py
+"""
+Purchase order line intake.
+
+The PO form (po_items_json) and the CSV / Excel import share one path:
+
+  * clean_po_lines() validates every line up front -- the raw material must
+    exist (one query for the whole order), quantity > 0, unit price >= 0 --
+    and reports errors per line instead of failing half way through;
+  * post_po_lines() writes the lines through stock.reconcile_po_lines()
+    (bulk item writes, one stock transaction / F() update per raw material)
+    and sets the totals from the subtotal it returns, so the items are not
+    read back just to add them up.
+
+Import columns (header row required, extra columns ignored):
+    raw_material, quantity, unit_price
+`raw_material` is an id or a name (case-insensitive).
+"""
+import csv
+import io
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import PurchaseOrder, RawMaterial
+from .stock import reconcile_po_lines
+
+COLUMNS = ("raw_material", "quantity", "unit_price")
+
+ImportResult = namedtuple("ImportResult", "purchase_order errors")
+
+
+def _decimal(raw, label):
+    try:
+        value = Decimal(str(raw).replace(",", "").strip())
+    except (InvalidOperation, TypeError):
+        raise ValidationError(f"Bad {label} '{raw}'.")
+    if not value.is_finite():
+        raise ValidationError(f"Bad {label} '{raw}'.")
+    return value
+
+
+class MaterialLookup:
+    """Resolve a line's raw material (id or name) with one query per order."""
+
+    def __init__(self, keys):
+        keys = [str(k if k is not None else "").strip() for k in keys]
+        qs = RawMaterial.objects.only("id", "name")
+        if not all(k.isdigit() for k in keys):
+            # names are matched case-insensitively in Python
+            qs = qs.all()
+        else:
+            qs = qs.filter(pk__in={int(k) for k in keys})
+        self.by_key = {}
+        for rm in qs:
+            self.by_key.setdefault(str(rm.pk), rm)
+            self.by_key.setdefault(rm.name.strip().lower(), rm)
+
+    def __call__(self, raw):
+        key = str(raw if raw is not None else "").strip()
+        if not key:
+            raise ValidationError("Raw material is required.")
+        rm = self.by_key.get(key.lower())
+        if rm is None:
+            raise ValidationError(f"Unknown raw material '{key}'.")
+        return rm
+
+
+def clean_po_lines(raw_lines, line_numbers=None):
+    """
+    Validate PO lines (dicts with raw_material_id or raw_material, quantity,
+    unit_price). Returns (lines, errors): lines as reconcile_po_lines() takes
+    them, errors as [(line_no, message)], numbered from 1 unless
+    `line_numbers` are given.
+    """
+    rows = list(raw_lines or [])
+    line_numbers = line_numbers or range(1, len(rows) + 1)
+    lookup = MaterialLookup([r.get("raw_material_id", r.get("raw_material")) for r in rows
+                             if isinstance(r, dict)])
+    lines, errors = [], []
+    for line_no, row in zip(line_numbers, rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValidationError("Line is not an object.")
+            rm = lookup(row.get("raw_material_id", row.get("raw_material")))
+            qty = _decimal(row.get("quantity"), "quantity")
+            price = _decimal(row.get("unit_price"), "unit price")
+            if qty <= 0:
+                raise ValidationError("Quantity must be greater than zero.")
+            if price < 0:
+                raise ValidationError("Unit price cannot be negative.")
+        except ValidationError as e:
+            errors.append((line_no, "; ".join(e.messages)))
+            continue
+        lines.append({"raw_material_id": rm.pk, "quantity": qty, "unit_price": price})
+    return lines, errors
+
+
+@transaction.atomic
+def post_po_lines(po, lines, tax_percent=None, discount_percent=None):
+    """
+    Write validated `lines` to `po`, move stock by the net change and save
+    the totals (through save(), so the supplier balance follows).
+    """
+    if tax_percent is not None:
+        po.tax_percent = tax_percent
+    if discount_percent is not None:
+        po.discount_percent = discount_percent
+    po.set_totals(reconcile_po_lines(po, lines))
+    po.save(update_fields=["total_cost", "tax_percent", "discount_percent", "net_total"])
+    return po
+
+
+# ---------- file import ----------
+
+def read_rows(upload, filename):
+    """
+    Rows of a CSV or .xlsx upload (a binary file object). Returns
+    (rows, errors) with rows as [(line_no, {column: value})]; the header is
+    line 1 and blank lines are dropped.
+    """
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        ws = load_workbook(upload, read_only=True, data_only=True).active
+        it = ws.iter_rows(values_only=True)
+        header = [str(c or "").strip().lower() for c in next(it, ())]
+        rows = [dict(zip(header, values)) for values in it]
+    else:
+        text = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text)
+        header = [(f or "").strip().lower() for f in reader.fieldnames or []]
+        rows = [{(k or "").strip().lower(): v for k, v in row.items()} for row in reader]
+
+    missing = [c for c in COLUMNS if c not in header]
+    if missing:
+        return [], [(1, f"Missing column(s): {', '.join(missing)}.")]
+    return [
+        (line_no, row) for line_no, row in enumerate(rows, start=2)
+        if any(str(row.get(c) or "").strip() for c in COLUMNS)
+    ], []
+
+
+def import_purchase_order(upload, filename, supplier, user, tax_percent=0, discount_percent=0):
+    """
+    Create one purchase order for `supplier` from a CSV / Excel file.
+    Nothing is written when any line fails.
+    """
+    numbered, errors = read_rows(upload, filename)
+    if errors:
+        return ImportResult(None, errors)
+    if not numbered:
+        return ImportResult(None, [(1, "The file has no lines.")])
+
+    lines, errors = clean_po_lines([row for _, row in numbered], [n for n, _ in numbered])
+    if errors:
+        return ImportResult(None, errors)
+
+    with transaction.atomic():
+        po = PurchaseOrder.objects.create(supplier=supplier, created_by=user)
+        post_po_lines(po, lines, Decimal(tax_percent or 0), Decimal(discount_percent or 0))
+    return ImportResult(po, [])
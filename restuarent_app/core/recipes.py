@@ -0,0 +1,202 @@
+# core/recipes.py
+"""
+Recipe persistence for the recipe editor.
+
+save_recipe_lines() makes a recipe's raw-material and sub-recipe lines
+match the posted ones with the fewest writes: lines are matched on their
+raw material / sub-recipe, changed ones are bulk-updated, new ones
+bulk-created and the rest deleted in one query -- all in one transaction.
+Nothing is written when a line is invalid or would close a sub-recipe
+cycle (A uses B uses ... uses A), which costing could never resolve.
+
+editor_payload() is the lookup data the editor needs (raw materials,
+units, recipes by menu item name), built with three flat queries and kept
+in the default cache until one of those tables changes.
+
+Saving refreshes the recipe's flattened BOM (core.bom) and those of the
+recipes that use it.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import MenuItem, RawMaterial, Recipe, RecipeRawMaterial, RecipeSubRecipe, Unit
+
+EDITOR_CACHE_KEY = "recipes:editor-payload"
+EDITOR_CACHE_SECONDS = 60 * 60
+
+
+# ---------- editor lookup payload ----------
+
+def editor_payload(exclude_recipe_id=None):
+    """{'raw_materials', 'units', 'recipes'} lists for the editor's pickers."""
+    payload = cache.get(EDITOR_CACHE_KEY)
+    if payload is None:
+        payload = {
+            "raw_materials": [{"pk": pk, "name": name, "unit": unit} for pk, name, unit in
+                              RawMaterial.objects.order_by("name").values_list("pk", "name", "unit")],
+            "units": [{"pk": pk, "symbol": symbol} for pk, symbol in
+                      Unit.objects.order_by("pk").values_list("pk", "symbol")],
+            "recipes": [{"pk": pk, "name": name} for pk, name in
+                        Recipe.objects.order_by("menu_item__name").values_list("pk", "menu_item__name")],
+        }
+        cache.set(EDITOR_CACHE_KEY, payload, EDITOR_CACHE_SECONDS)
+    if exclude_recipe_id:
+        payload = dict(payload, recipes=[r for r in payload["recipes"] if r["pk"] != exclude_recipe_id])
+    return payload
+
+
+def invalidate_editor_payload(*args, **kwargs):
+    cache.delete(EDITOR_CACHE_KEY)
+
+
+for _model in (RawMaterial, Unit, Recipe, MenuItem):
+    post_save.connect(invalidate_editor_payload, sender=_model, dispatch_uid=f"recipe_editor_{_model.__name__}")
+    post_delete.connect(invalidate_editor_payload, sender=_model, dispatch_uid=f"recipe_editor_gone_{_model.__name__}")
+
+
+# ---------- validation ----------
+
+def _quantity(raw):
+    try:
+        value = Decimal(str(raw))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValidationError(f"Bad quantity '{raw}'.")
+    if not value.is_finite() or value <= 0:
+        raise ValidationError("Quantity must be greater than zero.")
+    return value
+
+
+def _ids(rows, field):
+    ids = set()
+    for row in rows:
+        try:
+            ids.add(int(row.get(field)))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return ids
+
+
+def clean_lines(raw_data, sub_data):
+    """
+    Validate the editor's raw_json / sub_json rows. Returns (raw_lines,
+    sub_lines, errors) where lines are (key_id, quantity, unit_id) tuples
+    and errors a flat list of messages.
+    """
+    raw_data, sub_data = list(raw_data or []), list(sub_data or [])
+    known_rm = set(RawMaterial.objects.filter(pk__in=_ids(raw_data, "raw_material_id")).values_list("pk", flat=True))
+    known_rec = set(Recipe.objects.filter(pk__in=_ids(sub_data, "sub_recipe_id")).values_list("pk", flat=True))
+    known_unit = set(Unit.objects.filter(pk__in=_ids(raw_data + sub_data, "unit_id")).values_list("pk", flat=True))
+
+    errors = []
+
+    def clean(rows, field, known, label):
+        out = []
+        for n, row in enumerate(rows, start=1):
+            try:
+                if not isinstance(row, dict):
+                    raise ValidationError("Line is not an object.")
+                try:
+                    key, unit = int(row.get(field)), int(row.get("unit_id"))
+                except (TypeError, ValueError):
+                    raise ValidationError(f"Choose a {label.lower()} and a unit.")
+                if key not in known:
+                    raise ValidationError(f"Unknown {label.lower()} #{key}.")
+                if unit not in known_unit:
+                    raise ValidationError(f"Unknown unit #{unit}.")
+                out.append((key, _quantity(row.get("quantity")), unit))
+            except ValidationError as e:
+                errors.append(f"{label} line {n}: {'; '.join(e.messages)}")
+        return out
+
+    raw_lines = clean(raw_data, "raw_material_id", known_rm, "Ingredient")
+    sub_lines = clean(sub_data, "sub_recipe_id", known_rec, "Sub-recipe")
+    return raw_lines, sub_lines, errors
+
+
+def find_cycle(recipe_id, sub_recipe_ids):
+    """
+    The recipe path that would loop back to `recipe_id` if it used
+    `sub_recipe_ids` ([recipe_id, ..., recipe_id]), or None. One query for
+    the whole sub-recipe graph.
+    """
+    sub_recipe_ids = set(sub_recipe_ids)
+    if recipe_id is None or not sub_recipe_ids:
+        return None
+    graph = defaultdict(set)
+    for parent, child in RecipeSubRecipe.objects.exclude(recipe_id=recipe_id).values_list("recipe_id", "sub_recipe_id"):
+        graph[parent].add(child)
+    graph[recipe_id] = sub_recipe_ids
+
+    # iterative DFS from recipe_id; `came_from` rebuilds the path
+    came_from, stack = {}, [recipe_id]
+    seen = set()
+    while stack:
+        node = stack.pop()
+        for child in graph.get(node, ()):
+            if child == recipe_id:
+                path = [node]
+                while path[-1] != recipe_id:
+                    path.append(came_from[path[-1]])
+                return path[::-1] + [recipe_id]
+            if child not in seen:
+                seen.add(child)
+                came_from[child] = node
+                stack.append(child)
+    return None
+
+
+def cycle_message(path):
+    names = dict(Recipe.objects.filter(pk__in=set(path)).values_list("pk", "menu_item__name"))
+    return "Sub-recipes would loop: " + " → ".join(names.get(pk, f"#{pk}") for pk in path) + "."
+
+
+# ---------- save ----------
+
+def _sync(model, recipe, key_field, lines):
+    """Diff one line table of `recipe` against `lines`; returns (created, updated, deleted)."""
+    existing = defaultdict(list)
+    for row in model.objects.filter(recipe=recipe).order_by("id"):
+        existing[getattr(row, key_field)].append(row)
+
+    to_create, to_update = [], []
+    for key, qty, unit in lines:
+        pool = existing.get(key)
+        if pool:
+            row = pool.pop(0)
+            if row.quantity != qty or row.unit_id != unit:
+                row.quantity, row.unit_id = qty, unit
+                to_update.append(row)
+        else:
+            to_create.append(model(recipe=recipe, quantity=qty, unit_id=unit, **{key_field: key}))
+
+    stale = [row.pk for pool in existing.values() for row in pool]
+    if stale:
+        model.objects.filter(pk__in=stale).delete()
+    if to_update:
+        model.objects.bulk_update(to_update, ["quantity", "unit"])
+    if to_create:
+        model.objects.bulk_create(to_create)
+    return len(to_create), len(to_update), len(stale)
+
+
+@transaction.atomic
+def save_recipe_lines(recipe, raw_lines, sub_lines):
+    """
+    Write cleaned lines (see clean_lines) to a saved recipe. Raises
+    ValidationError, before writing anything, when a sub-recipe would loop.
+    """
+    from .bom import batched
+
+    cycle = find_cycle(recipe.pk, [key for key, _, _ in sub_lines])
+    if cycle:
+        raise ValidationError(cycle_message(cycle))
+    # bulk writes skip the BOM receivers: refresh this recipe (and its users) once
+    with batched() as pending:
+        pending["recipes"].add(recipe.pk)
+        return (_sync(RecipeRawMaterial, recipe, "raw_material_id", raw_lines),
+                _sync(RecipeSubRecipe, recipe, "sub_recipe_id", sub_lines))
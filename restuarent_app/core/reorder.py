@@ -0,0 +1,156 @@
+# core/reorder.py
+"""
+Low-stock alerts.
+
+A raw material is below reorder when it has a reorder_level and its
+current_stock is at or under it. The set of those materials is evaluated
+in one query and kept in the default cache for CACHE_SECONDS:
+
+  * stock.apply_stock_deltas() -- every stock-changing batch -- calls
+    invalidate() once it has moved stock;
+  * RawMaterial saves (reorder level, manual stock edits) invalidate it too;
+  * invalidate() drops the cached set at once and re-evaluates it when the
+    surrounding transaction commits, and refresh() does not cache inside a
+    transaction, so a rolled-back batch never leaves its ids behind;
+  * below_ids() falls back to the query when the cache is cold.
+
+alerts() adds what the buyer needs for those materials: consumption
+velocity (net outflow of the last VELOCITY_DAYS, purchases excluded, from
+the movement index), days of cover at that rate, the last purchase price,
+and a suggested quantity that brings stock back to the reorder level plus
+COVER_DAYS of use. The market list and the purchase order form are
+pre-filled from it; nothing is ordered until a person saves the PO.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_CEILING, Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import InventoryTransaction, PurchaseOrderItem, RawMaterial
+
+CACHE_KEY = "reorder:below"
+CACHE_SECONDS = 300
+VELOCITY_DAYS = 14
+COVER_DAYS = 7
+ZERO = Decimal("0")
+
+
+# ---------- live set ----------
+
+def _below_query():
+    return (RawMaterial.objects.filter(reorder_level__gt=0, current_stock__lte=F("reorder_level"))
+            .values_list("pk", flat=True))
+
+
+def refresh():
+    """Re-evaluate every material (one query) and cache the below-reorder ids."""
+    ids = frozenset(_below_query())
+    # never cache what an open transaction may still roll back
+    if not transaction.get_connection().in_atomic_block:
+        cache.set(CACHE_KEY, ids, CACHE_SECONDS)
+    return ids
+
+
+def invalidate():
+    """Forget the cached set now; re-evaluate it once the current transaction commits."""
+    cache.delete(CACHE_KEY)
+    transaction.on_commit(refresh)
+
+
+def below_ids():
+    ids = cache.get(CACHE_KEY)
+    return refresh() if ids is None else ids
+
+
+def _material_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate()
+
+
+post_save.connect(_material_changed, sender=RawMaterial, dispatch_uid="reorder_material")
+post_delete.connect(_material_changed, sender=RawMaterial, dispatch_uid="reorder_material_gone")
+
+
+# ---------- alerts ----------
+
+def velocities(rm_ids, days=VELOCITY_DAYS):
+    """{raw_material_id: average daily outflow} over the last `days` days -- one grouped query."""
+    from .movements import SUMS
+
+    since = timezone.localdate() - timedelta(days=days)
+    rows = (InventoryTransaction.objects
+            .filter(raw_material_id__in=rm_ids, date__gt=since)
+            .values("raw_material")
+            .annotate(**{k: SUMS[k] for k in ("issued", "returned", "sold", "other")})
+            .values_list("raw_material", "issued", "returned", "sold", "other"))
+    out = {}
+    for rm, issued, returned, sold, other in rows:
+        outflow = issued - returned + sold - other
+        if outflow > 0:
+            out[rm] = outflow / days
+    return out
+
+
+def suggested_quantity(current, reorder_level, velocity):
+    """Enough to get back to the reorder level plus COVER_DAYS of use, in whole units."""
+    target = reorder_level + (velocity or ZERO) * COVER_DAYS
+    return max(target - current, ZERO).to_integral_value(rounding=ROUND_CEILING)
+
+
+def alerts(supplier_id=None):
+    """
+    [{id, name, unit, supplier_id, supplier, current_stock, reorder_level,
+    velocity, days_cover, suggested, last_price}] for the materials below
+    reorder, the ones running out first on top.
+    """
+    ids = below_ids()
+    if not ids:
+        return []
+    last_price = Subquery(PurchaseOrderItem.objects.filter(raw_material=OuterRef("pk"))
+                          .order_by("-id").values("unit_price")[:1])
+    qs = RawMaterial.objects.filter(pk__in=ids).annotate(last_price=last_price)
+    if supplier_id is not None:
+        qs = qs.filter(supplier_id=supplier_id)
+    materials = list(qs.values("id", "name", "unit", "supplier_id", "supplier__name",
+                               "current_stock", "reorder_level", "last_price"))
+    speed = velocities([m["id"] for m in materials])
+
+    rows = []
+    for m in materials:
+        v = speed.get(m["id"])
+        rows.append({
+            "id": m["id"], "name": m["name"], "unit": m["unit"],
+            "supplier_id": m["supplier_id"], "supplier": m["supplier__name"],
+            "current_stock": m["current_stock"], "reorder_level": m["reorder_level"],
+            "velocity": v.quantize(Decimal("0.01")) if v else None,
+            "days_cover": (max(m["current_stock"], ZERO) / v).quantize(Decimal("0.1")) if v else None,
+            "suggested": suggested_quantity(m["current_stock"], m["reorder_level"], v),
+            "last_price": m["last_price"] or ZERO,
+        })
+    rows.sort(key=lambda r: (r["days_cover"] is None, r["days_cover"] or ZERO, r["name"]))
+    return rows
+
+
+def by_supplier(rows):
+    """alerts() rows grouped by RawMaterial.supplier: [{supplier_id, supplier, rows, total}]."""
+    groups = defaultdict(list)
+    for r in rows:
+        groups[(r["supplier"], r["supplier_id"])].append(r)
+    return [
+        {"supplier_id": sid, "supplier": name, "rows": items,
+         "total": sum((r["suggested"] * r["last_price"] for r in items), ZERO)}
+        for (name, sid), items in sorted(groups.items())
+    ]
+
+
+def po_lines(supplier_id):
+    """Suggested lines for a supplier's purchase order, as the PO form's line editor takes them."""
+    return [
+        {"raw_material_id": r["id"], "quantity": float(r["suggested"]), "unit_price": float(r["last_price"])}
+        for r in alerts(supplier_id) if r["suggested"] > 0
+    ]
@@ -8,8 +8,11 @@ from django.db.models import (
     Sum, F, Case, When, Value, DecimalField, ExpressionWrapper, DateTimeField, Max
 )
 from django.db.models.functions import TruncMonth, TruncDate, Coalesce
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils import timezone as tz
 from django.views.generic import TemplateView
+from django.core.exceptions import BadRequest
 from django.http import JsonResponse
 
 from .models import Order, OrderItem, Expense, PurchaseOrder, MenuItem, Deal, DealItem
@@ -357,3 +360,45 @@ def api_sales_report(request):
             "last_sold": tz.localtime(last).strftime("%Y-%m-%d %H:%M") if last else None,
         })
     return JsonResponse(data, safe=False)
+
+
+# ---------- Theoretical consumption ----------
+
+def _consumption_range(request) -> tuple[date, date]:
+    """
+    GET ?from=YYYY-MM-DD&to=YYYY-MM-DD business days; the last 7 by default.
+    The report is a materials x days matrix: BadRequest (400) for spans over
+    utils.MAX_RANGE_DAYS or dates beyond a year ahead (utils.request_day_range).
+    """
+    from .utils import request_day_range
+
+    return request_day_range(request)
+
+
+class ConsumptionReportView(LoginRequiredMixin, TemplateView):
+    """Raw material each business day's sales should have used (BOM x quantities sold)."""
+    template_name = "reports/consumption.html"
+
+    def get_context_data(self, **kwargs):
+        from .consumption import as_json, theoretical_usage
+
+        ctx = super().get_context_data(**kwargs)
+        start, end = _consumption_range(self.request)
+        data = as_json(theoretical_usage(start, end), places=2)
+        ctx.update({"from": start, "to": end, "days": data["days"], "materials": data["materials"]})
+        return ctx
+
+
+@login_required
+def api_consumption(request):
+    """
+    Theoretical consumption per raw material and business day.
+    GET ?from=YYYY-MM-DD&to=YYYY-MM-DD
+    """
+    from .consumption import as_json, theoretical_usage
+
+    try:
+        start, end = _consumption_range(request)
+    except BadRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(as_json(theoretical_usage(start, end)))
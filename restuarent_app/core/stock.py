@@ -0,0 +1,224 @@
+# core/stock.py
+"""
+Stock movement helpers.
+
+RawMaterial.current_stock is moved with one F() update per raw material
+(no read-modify-write of the whole row, no post_save fan-out), and
+InventoryTransaction rows that are written in bulk go through record(),
+which applies their net effect per material in one pass.
+
+reconcile_po_lines() diffs a purchase order's posted lines against the
+stored ones: unchanged lines are left alone, and stock only moves by the
+net quantity change of each raw material, as one transaction per material.
+
+sync_voucher_transactions() does the same for a kitchen voucher: each item
+keeps one back-linked transaction; only missing or stale ones are written,
+in bulk, and stock moves by the net change per material.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import InventoryTransaction, KitchenVoucherItem, PurchaseOrderItem, RawMaterial
+
+logger = logging.getLogger("core.inventory")
+
+ZERO = Decimal("0")
+
+# 'return' is stock coming back from the kitchen
+SIGNS = {"in": 1, "return": 1, "out": -1}
+
+
+def signed_quantity(transaction_type, quantity):
+    return SIGNS.get(transaction_type, 0) * (quantity or ZERO)
+
+
+def _invalidate_months(pairs):
+    """Drop the month snapshots (core.movements) behind back-dated (rm_id, date) movements."""
+    from .movements import invalidate_from
+    earliest = {}
+    for rm_id, day in pairs:
+        if day is not None and (rm_id not in earliest or day < earliest[rm_id]):
+            earliest[rm_id] = day
+    for rm_id, day in earliest.items():
+        invalidate_from([rm_id], day)
+
+
+def apply_stock_deltas(deltas):
+    """
+    {raw_material_id: signed quantity} -> one UPDATE per material that
+    actually moves, then one invalidation of the low-stock set (core.reorder).
+    """
+    from .reorder import invalidate
+    moved = 0
+    for rm_id, delta in deltas.items():
+        if rm_id and delta:
+            RawMaterial.objects.filter(pk=rm_id).update(current_stock=F("current_stock") + delta)
+            moved += 1
+    if moved:
+        invalidate()
+    return moved
+
+
+@transaction.atomic
+def record(transactions, batch_size=500):
+    """bulk_create InventoryTransactions and move stock by their net effect per material."""
+    if not transactions:
+        return []
+    InventoryTransaction.objects.bulk_create(transactions, batch_size=batch_size)
+    deltas = defaultdict(Decimal)
+    for t in transactions:
+        deltas[t.raw_material_id] += signed_quantity(t.transaction_type, t.quantity)
+    apply_stock_deltas(deltas)
+    _invalidate_months((t.raw_material_id, t.date) for t in transactions)
+    logger.debug("%d inventory transactions, %d materials moved", len(transactions), len(deltas))
+    return transactions
+
+
+@transaction.atomic
+def unrecord(transaction_ids):
+    """Delete InventoryTransactions and take their effect back off current_stock."""
+    qs = InventoryTransaction.objects.filter(pk__in=[pk for pk in transaction_ids if pk])
+    deltas, dated = defaultdict(Decimal), []
+    for rm_id, ttype, qty, day in qs.values_list("raw_material_id", "transaction_type", "quantity", "date"):
+        deltas[rm_id] -= signed_quantity(ttype, qty)
+        dated.append((rm_id, day))
+    qs.delete()
+    apply_stock_deltas(deltas)
+    _invalidate_months(dated)
+
+
+def po_stock_moves(po, deltas, links=None, note=None):
+    """
+    One transaction per raw material whose quantity on `po` changed by a
+    non-zero `deltas[rm_id]`: 'in' for more stock, 'out' for a reversal.
+    `links` maps rm_id -> a PurchaseOrderItem to back-link the row to.
+    """
+    links = links or {}
+    rows = [
+        InventoryTransaction(
+            raw_material_id=rm_id,
+            transaction_type="in" if delta > 0 else "out",
+            quantity=abs(delta),
+            purchase_order_item=links.get(rm_id),
+            notes=note or f"PO #{po.pk}",
+            source=InventoryTransaction.PURCHASE,
+        )
+        for rm_id, delta in sorted(deltas.items())
+        if delta
+    ]
+    return record(rows)
+
+
+def _decimal(value):
+    return Decimal(str(value))
+
+
+@transaction.atomic
+def reconcile_po_lines(po, lines):
+    """
+    Make po.items match `lines` ([{raw_material_id, quantity, unit_price}],
+    as posted by the PO form) with the fewest writes:
+
+      * a stored line is matched to a posted one with the same raw material
+        and only updated when its quantity or price changed;
+      * unmatched posted lines are bulk-created, unmatched stored lines are
+        deleted in one query;
+      * stock moves by the net quantity change per raw material.
+
+    Returns the new subtotal.
+    """
+    existing = defaultdict(list)
+    old_qty = defaultdict(Decimal)
+    for item in po.items.order_by("id"):
+        existing[item.raw_material_id].append(item)
+        old_qty[item.raw_material_id] += item.quantity
+
+    new_qty = defaultdict(Decimal)
+    kept, to_create, to_update = [], [], []
+    subtotal = ZERO
+    for line in lines:
+        rm_id = int(line["raw_material_id"])
+        qty, price = _decimal(line["quantity"]), _decimal(line["unit_price"])
+        new_qty[rm_id] += qty
+        subtotal += qty * price
+        pool = existing.get(rm_id)
+        if pool:
+            item = pool.pop(0)
+            if item.quantity != qty or item.unit_price != price:
+                item.quantity, item.unit_price = qty, price
+                to_update.append(item)
+            kept.append(item)
+        else:
+            to_create.append(PurchaseOrderItem(purchase_order=po, raw_material_id=rm_id,
+                                               quantity=qty, unit_price=price))
+
+    stale = [item.pk for pool in existing.values() for item in pool]
+    if stale:
+        PurchaseOrderItem.objects.filter(pk__in=stale).delete()
+    if to_update:
+        PurchaseOrderItem.objects.bulk_update(to_update, ["quantity", "unit_price"])
+    if to_create:
+        PurchaseOrderItem.objects.bulk_create(to_create)
+
+    links = {}
+    for item in kept + to_create:
+        links.setdefault(item.raw_material_id, item)
+    deltas = {rm_id: new_qty[rm_id] - old_qty[rm_id] for rm_id in old_qty.keys() | new_qty.keys()}
+    po_stock_moves(po, deltas, links, note=f"PO #{po.pk}" if not old_qty else f"PO #{po.pk} (edited)")
+    logger.info("PO #%s lines: %d kept, %d updated, %d added, %d removed",
+                po.pk, len(kept) - len(to_update), len(to_update), len(to_create), len(stale))
+    return subtotal
+
+
+VOUCHER_FIELDS = ["raw_material", "transaction_type", "quantity", "date", "notes", "source"]
+
+
+@transaction.atomic
+def sync_voucher_transactions(voucher):
+    """
+    Make every item of `voucher` carry one matching InventoryTransaction
+    (issue -> 'out', return -> 'in'): missing ones are bulk-created and
+    linked, stale ones bulk-updated, matching ones left alone. Stock moves
+    by the net change per raw material. Returns (created, updated).
+    """
+    items = list(voucher.items.only("id", "raw_material_id", "quantity", "transaction_id"))
+    existing = InventoryTransaction.objects.in_bulk([it.transaction_id for it in items if it.transaction_id])
+    ttype = "out" if voucher.vtype == voucher.ISSUE else "in"
+    note = f"{voucher.get_vtype_display()} KV#{voucher.pk}"
+
+    kitchen = InventoryTransaction.KITCHEN
+    deltas, dated = defaultdict(Decimal), []
+    to_create, to_update = [], []
+    for it in items:
+        t = existing.get(it.transaction_id)
+        if t is None:
+            t = InventoryTransaction(raw_material_id=it.raw_material_id, transaction_type=ttype,
+                                     quantity=it.quantity, date=voucher.date, notes=note, source=kitchen)
+            to_create.append((it, t))
+        elif (t.raw_material_id, t.transaction_type, t.quantity, t.date, t.notes, t.source) != \
+                (it.raw_material_id, ttype, it.quantity, voucher.date, note, kitchen):
+            deltas[t.raw_material_id] -= signed_quantity(t.transaction_type, t.quantity)
+            dated.append((t.raw_material_id, t.date))
+            t.raw_material_id, t.transaction_type, t.quantity, t.date, t.notes, t.source = \
+                it.raw_material_id, ttype, it.quantity, voucher.date, note, kitchen
+            to_update.append(t)
+        else:
+            continue
+        deltas[it.raw_material_id] += signed_quantity(ttype, it.quantity)
+        dated.append((it.raw_material_id, voucher.date))
+
+    if to_create:
+        InventoryTransaction.objects.bulk_create([t for _, t in to_create])
+        for it, t in to_create:
+            it.transaction = t
+        KitchenVoucherItem.objects.bulk_update([it for it, _ in to_create], ["transaction"])
+    if to_update:
+        InventoryTransaction.objects.bulk_update(to_update, VOUCHER_FIELDS)
+    apply_stock_deltas(deltas)
+    _invalidate_months(dated)
+    logger.debug("KV#%s: %d transactions created, %d updated", voucher.pk, len(to_create), len(to_update))
+    return len(to_create), len(to_update)
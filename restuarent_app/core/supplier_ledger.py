@@ -0,0 +1,172 @@
+# core/supplier_ledger.py
+"""
+Supplier ledger engine.
+
+A supplier's ledger is the merge of three sources, ordered by
+(created_at, kind, id) -- for payments without a created_at, the start of
+their date:
+    purchase orders      -> CR  (we owe them)        kind 0
+    payments (Expense)   -> DR  (we paid them)       kind 1
+    refunds received     -> CR  (PaymentReceived)    kind 2
+
+Balances are never built by walking rows in Python: the balance up to any
+point is three SUM aggregates, and a page of entries is three keyset
+queries of at most `size + 1` rows each, merged in memory. PO line items
+are not loaded here at all; the ledger page fetches them on expand from
+`supplier_po_items_json`.
+"""
+from collections import namedtuple
+from decimal import Decimal
+from heapq import merge
+
+from django.db.models import DateTimeField, Q, Sum, Value, DecimalField
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import PurchaseOrder, Expense, PaymentReceived
+
+ZERO = Decimal("0.00")
+DEC = DecimalField(max_digits=14, decimal_places=2)
+
+# legacy POs were saved before net_total existed and carry 0 there
+PO_AMOUNT = Coalesce(NullIf("net_total", Value(0)), "total_cost", output_field=DEC)
+
+# legacy expenses have no created_at; they sit at the start of their date
+PAYMENT_DT = Coalesce("created_at", Cast("date", DateTimeField()), output_field=DateTimeField())
+
+PO, PAYMENT, REFUND = 0, 1, 2
+# ordering column per source (payments are annotated with ledger_dt)
+DT = {PO: "created_at", PAYMENT: "ledger_dt", REFUND: "created_at"}
+
+Key = namedtuple("Key", "dt kind id")
+
+
+def encode_key(key):
+    return f"{key.dt.isoformat()}_{key.kind}_{key.id}"
+
+
+def decode_key(raw):
+    from django.utils.dateparse import parse_datetime
+    try:
+        stamp, kind, pk = raw.rsplit("_", 2)
+        dt = parse_datetime(stamp)
+        return Key(dt, int(kind), int(pk)) if dt else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def _after(kind, key):
+    """Rows of source `kind` strictly after `key` in (dt, kind, id) order."""
+    dt = DT[kind]
+    if kind > key.kind:
+        return Q(**{f"{dt}__gte": key.dt})
+    if kind == key.kind:
+        return Q(**{f"{dt}__gt": key.dt}) | Q(**{dt: key.dt, "id__gt": key.id})
+    return Q(**{f"{dt}__gt": key.dt})
+
+
+def _through(kind, key):
+    """Rows of source `kind` at or before `key`."""
+    return ~_after(kind, key) & Q(**{f"{DT[kind]}__isnull": False})
+
+
+class SupplierLedger:
+    def __init__(self, supplier):
+        self.supplier = supplier
+
+    # ---- sources ----
+    def purchase_orders(self):
+        return PurchaseOrder.objects.filter(supplier=self.supplier)
+
+    def payments(self):
+        return (Expense.objects.filter(Q(supplier=self.supplier) | Q(purchase_order__supplier=self.supplier))
+                .annotate(ledger_dt=PAYMENT_DT))
+
+    def refunds(self):
+        return PaymentReceived.objects.filter(supplier=self.supplier, party_type="supplier")
+
+    # ---- balances ----
+    def balance_through(self, key=None):
+        """
+        Payable balance (CR - DR) over every entry at or before `key`
+        (the whole history when key is None). Three aggregate queries.
+        """
+        pos, pays, refs = self.purchase_orders(), self.payments(), self.refunds()
+        if key is not None:
+            pos = pos.filter(_through(PO, key))
+            pays = pays.filter(_through(PAYMENT, key))
+            refs = refs.filter(_through(REFUND, key))
+        cr = pos.aggregate(s=Coalesce(Sum(PO_AMOUNT), ZERO, output_field=DEC))["s"]
+        dr = pays.aggregate(s=Coalesce(Sum("amount"), ZERO, output_field=DEC))["s"]
+        ref = refs.aggregate(s=Coalesce(Sum("amount"), ZERO, output_field=DEC))["s"]
+        return cr + ref - dr
+
+    def balance_before(self, dt):
+        """Balance of everything created strictly before `dt` (window opening)."""
+        return self.balance_through(Key(dt, -1, 0))
+
+    # ---- entries ----
+    def page(self, start=None, end=None, after=None, size=50):
+        """
+        Up to `size` entries with start <= created_at < end, after the keyset
+        cursor `after`. Returns (entries, has_more); each entry is a dict with
+        dt/desc/dr/cr and `key`, plus `po_id` for purchase orders.
+        """
+        def window(qs, kind):
+            dt = DT[kind]
+            qs = qs.filter(**{f"{dt}__isnull": False})
+            if start is not None:
+                qs = qs.filter(**{f"{dt}__gte": start})
+            if end is not None:
+                qs = qs.filter(**{f"{dt}__lt": end})
+            if after is not None:
+                qs = qs.filter(_after(kind, after))
+            return qs.order_by(dt, "id")[:size + 1]
+
+        pos = (
+            {"key": Key(po.created_at, PO, po.id), "po_id": po.id,
+             "desc": f"PO #{po.id}", "dr": ZERO, "cr": po.amount}
+            for po in window(self.purchase_orders(), PO).annotate(amount=PO_AMOUNT)
+        )
+        pays = (
+            {"key": Key(e.ledger_dt, PAYMENT, e.id), "desc": self.payment_label(e),
+             "dr": Decimal(e.amount or 0), "cr": ZERO}
+            for e in window(self.payments(), PAYMENT)
+        )
+        refs = (
+            {"key": Key(r.created_at, REFUND, r.id), "desc": f"Refund Received: {r.description}",
+             "dr": ZERO, "cr": Decimal(r.amount)}
+            for r in window(self.refunds(), REFUND)
+        )
+
+        rows = []
+        for row in merge(pos, pays, refs, key=lambda r: r["key"]):
+            rows.append(row)
+            if len(rows) > size:
+                break
+        for row in rows:
+            row["dt"] = row["key"].dt
+            row["ref"] = row["key"].id
+        return rows[:size], len(rows) > size
+
+    @staticmethod
+    def payment_label(e):
+        label = f"Payment ({e.get_category_display()})"
+        if e.description:
+            label += f" - {e.description}"
+        if e.purchase_order_id:
+            label += f" [Ref PO #{e.purchase_order_id}]"
+        return label
+
+
+def po_items_payload(po):
+    """Line items for one PO, as sent to the ledger's expand row."""
+    return [
+        {
+            "raw_material": i.raw_material.name,
+            "unit": i.raw_material.unit,
+            "quantity": str(i.quantity),
+            "unit_price": str(i.unit_price),
+            "line_total": str(i.total_cost()),
+        }
+        for i in po.items.select_related("raw_material").order_by("id")
+    ]
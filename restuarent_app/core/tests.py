@@ -1,3 +1,1123 @@
-from django.test import TestCase
+import unittest
+import unittest.mock
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Max
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .models import (
+    User, Table, Customer, Supplier, Staff, BankAccount, RawMaterial, Category, MenuItem,
+    Order, OrderItem, InventoryTransaction, Expense, CashFlow, PaymentReceived,
+    Payment, CustomerLedgerEntry, PurchaseOrder, PurchaseOrderItem, PartyBalance,
+)
+from .utils import local_day_bounds
+
+
+def index_name(model, fields):
+    for idx in model._meta.indexes:
+        if list(idx.fields) == list(fields):
+            return idx.name
+    raise AssertionError(f"{model.__name__} has no index on {fields}")
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class HotQueryPlanTests(TestCase):
+    """
+    The order/report/ledger hot queries must be answered from an index,
+    not a full table scan. Seeds a small dataset and checks the plans.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='x')
+        cls.tables = Table.objects.bulk_create([Table(number=n) for n in range(1, 11)])
+        cls.customer = Customer.objects.create(name='Udhaar', phone='0300')
+        cls.supplier = Supplier.objects.create(name='Metro')
+        cls.staff = Staff.objects.create(full_name='Cook')
+        cls.bank = BankAccount.objects.create(name='HBL')
+        cls.rm = RawMaterial.objects.create(name='Rice', unit='kg', supplier=cls.supplier)
+
+        statuses = ['pending', 'paid', 'paid', 'served']
+        Order.objects.bulk_create([
+            Order(
+                number=f"ORD-PLAN-{i:05d}",
+                table=cls.tables[i % 10],
+                created_by=cls.user,
+                status=statuses[i % 4],
+                customer=cls.customer if i % 7 == 0 else None,
+                token_number=i,
+            )
+            for i in range(400)
+        ])
+        today = timezone.localdate()
+        InventoryTransaction.objects.bulk_create([
+            InventoryTransaction(raw_material=cls.rm, transaction_type='in',
+                                 quantity=Decimal('1'), date=today - timedelta(days=i % 30))
+            for i in range(200)
+        ])
+        Expense.objects.bulk_create([
+            Expense(date=today - timedelta(days=i % 30), category='purchase', amount=Decimal('10'),
+                    supplier=cls.supplier, staff=cls.staff, created_by=cls.user)
+            for i in range(200)
+        ])
+        CashFlow.objects.bulk_create([
+            CashFlow(date=today - timedelta(days=i % 30), flow_type=CashFlow.IN, amount=Decimal('5'),
+                     bank_account=cls.bank if i % 2 else None, created_by=cls.user)
+            for i in range(200)
+        ])
+        PaymentReceived.objects.bulk_create([
+            PaymentReceived(date=today - timedelta(days=i % 30), customer=cls.customer,
+                            amount=Decimal('5'), created_by=cls.user)
+            for i in range(200)
+        ])
+
+    def plan(self, qs):
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " | ".join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, qs, model, fields):
+        plan = self.plan(qs)
+        name = index_name(model, fields)
+        self.assertIn(name, plan, f"expected {name} in plan: {plan}")
+
+    def test_order_list_date_window(self):
+        start, end = local_day_bounds(timezone.localdate())
+        qs = Order.objects.filter(created_at__gte=start, created_at__lt=end).order_by('-created_at')
+        self.assertUsesIndex(qs, Order, ['created_at'])
+
+    def test_reports_paid_orders(self):
+        start, end = local_day_bounds(timezone.localdate() - timedelta(days=6), timezone.localdate())
+        qs = Order.objects.filter(status='paid', created_at__gte=start, created_at__lt=end)
+        self.assertUsesIndex(qs, Order, ['status', 'created_at'])
+
+    def test_pending_order_for_table(self):
+        qs = Order.objects.filter(table=self.tables[3], status='pending')
+        self.assertUsesIndex(qs, Order, ['table', 'status'])
+
+    def test_customer_ledger_orders(self):
+        start, _ = local_day_bounds(timezone.localdate())
+        qs = Order.objects.filter(customer=self.customer, created_at__lt=start)
+        self.assertUsesIndex(qs, Order, ['customer', 'created_at'])
+
+    def test_token_bootstrap(self):
+        start, end = local_day_bounds(timezone.localdate())
+        qs = (Order.objects
+              .filter(created_at__gte=start, created_at__lt=end, token_number__isnull=False)
+              .values('id').annotate(m=Max('token_number')))
+        self.assertUsesIndex(qs, Order, ['created_at'])
+
+    def test_date_and_fk_filters(self):
+        since = timezone.localdate() - timedelta(days=7)
+        self.assertUsesIndex(
+            InventoryTransaction.objects.filter(raw_material=self.rm, date__gte=since),
+            InventoryTransaction, ['raw_material', 'date'])
+        self.assertUsesIndex(
+            Expense.objects.filter(supplier=self.supplier, date__lt=since),
+            Expense, ['supplier', 'date'])
+        self.assertUsesIndex(
+            Expense.objects.filter(staff=self.staff, date__lt=since),
+            Expense, ['staff', 'date'])
+        self.assertUsesIndex(
+            CashFlow.objects.filter(bank_account=self.bank, date__lte=since),
+            CashFlow, ['bank_account', 'date'])
+        self.assertUsesIndex(
+            PaymentReceived.objects.filter(customer=self.customer, date__lt=since),
+            PaymentReceived, ['customer', 'date'])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        from .instrumentation import METRICS
+        METRICS.reset()
+        self.admin = User.objects.create_user('boss', password='x', role='admin')
+        self.cashier = User.objects.create_user('till', password='x', role='cashier')
+
+    def test_endpoint_is_admin_only_and_reports_views(self):
+        self.client.force_login(self.cashier)
+        self.client.get('/orders/')
+        self.assertEqual(self.client.get('/metrics/requests/').status_code, 403)
+
+        self.client.force_login(self.admin)
+        data = self.client.get('/metrics/requests/').json()
+        views = {v['view']: v for v in data['views']}
+        self.assertIn('order_list', views)
+        self.assertGreater(views['order_list']['avg_queries'], 0)
+
+
+
+class JsonLoggingTests(unittest.TestCase):
+    def test_record_goes_through_the_queue_as_json(self):
+        import json
+        import logging
+        import tempfile
+        from pathlib import Path
+
+        from .logconfig import QueueLogHandler
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'pos.log'
+            handler = QueueLogHandler(filename=str(path))
+            log = logging.getLogger('core.tests.json')
+            log.addHandler(handler)
+            log.propagate = False
+            try:
+                log.warning("Order %s printed", "A-1", extra={"order_id": 7})
+            finally:
+                log.removeHandler(handler)
+                handler.close()  # drains the queue
+                for target in handler.listener.handlers:
+                    target.close()
+            record = json.loads(path.read_text(encoding='utf-8').splitlines()[-1])
+
+        self.assertEqual(record['level'], 'WARNING')
+        self.assertEqual(record['logger'], 'core.tests.json')
+        self.assertEqual(record['msg'], 'Order A-1 printed')
+        self.assertEqual(record['order_id'], 7)
+
+
+class LicenseServiceTests(unittest.TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+
+        from .license_check import LicenseService
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.paths = [os.path.join(tmp.name, name) for name in ('license.json', 'license.sig', 'public_key.pem')]
+        for path in self.paths:
+            open(path, 'w').close()
+        self.service = LicenseService(self.paths, recheck_seconds=0)
+        patcher = unittest.mock.patch('core.license_check.load_and_verify_license', return_value={})
+        self.verify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_verifies_on_first_use_and_caches(self):
+        self.assertFalse(self.verify.called)
+        self.assertTrue(self.service.is_authorized())
+        self.assertTrue(self.service.is_authorized())
+        self.assertEqual(self.service.status(), (True, ''))
+        self.assertEqual(self.verify.call_count, 1)
+
+    def test_refresh_reverifies_only_when_a_file_changes(self):
+        import os
+
+        self.service.is_authorized()
+        self.service.refresh()
+        self.assertEqual(self.verify.call_count, 1)
+
+        stat = os.stat(self.paths[1])
+        os.utime(self.paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.verify.side_effect = RuntimeError("License signature verification failed.")
+        self.assertFalse(self.service.refresh())
+        self.assertEqual(self.verify.call_count, 2)
+        self.assertEqual(self.service.status(), (False, "License signature verification failed."))
+
+    def test_failure_is_cached_and_enforced(self):
+        from .license_check import enforce_authorization
+
+        self.verify.side_effect = RuntimeError("License file not found.")
+        self.assertEqual(self.service.status(), (False, "License file not found."))
+        self.assertIsNone(self.service.license)
+        with unittest.mock.patch('core.license_check.LICENSE', self.service):
+            with self.assertRaisesRegex(RuntimeError, "License file not found."):
+                enforce_authorization(None)
+        self.assertEqual(self.verify.call_count, 1)
+
+    def test_background_thread_starts_on_first_check_only(self):
+        from .license_check import LicenseService
+
+        service = LicenseService(self.paths, recheck_seconds=3600)
+        self.assertIsNone(service._thread)
+        service.is_authorized()
+        self.addCleanup(service.stop)
+        self.assertTrue(service._thread.is_alive())
+        thread = service._thread
+        service.start()
+        self.assertIs(service._thread, thread)
+
+class OrderTotalsTests(TestCase):
+    def test_refresh_totals_matches_bill_formula(self):
+        user = User.objects.create_user('till', password='x')
+        item = MenuItem.objects.create(category=Category.objects.create(name='Main'),
+                                       name='Karahi', price=Decimal('850'))
+        order = Order.objects.create(number='ORD-TOT-1', created_by=user, discount=Decimal('100'),
+                                     tax_percentage=Decimal('5'), service_charge=Decimal('50'))
+        OrderItem.objects.create(order=order, menu_item=item, quantity=3, unit_price=item.price)
+
+        order.refresh_totals()
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, Decimal('2550.00'))
+        self.assertEqual(order.tax_amount, Decimal('122.50'))     # 5% of 2450
+        self.assertEqual(order.grand_total, Decimal('2622.50'))   # 2450 + 122.50 + 50
+
+        order.discount = Decimal('5000')                          # discount never goes negative
+        order.set_totals(order.subtotal)
+        self.assertEqual(order.grand_total, Decimal('50.00'))
+
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Migrate back to `migrate_from`, seed with setUpBeforeMigration(apps),
+    then migrate to `migrate_to` (default: the latest migration, so the
+    test can go on with the live models and code).
+    """
+    migrate_from = migrate_to = None
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        latest = self.executor.loader.graph.leaf_nodes()
+        target = [('core', self.migrate_to)] if self.migrate_to else latest
+        self.addCleanup(self._migrate, latest)
+        self._migrate([('core', self.migrate_from)])
+        self.setUpBeforeMigration(self.executor.loader.project_state([('core', self.migrate_from)]).apps)
+        self._migrate(target)
+        self.apps = self.executor.loader.project_state(target).apps
+
+    def _migrate(self, targets):
+        self.executor.loader.build_graph()
+        self.executor.migrate(targets)
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+
+class OrderTotalsMigrationTests(MigrationTestCase):
+    migrate_from = '0043_hot_query_indexes'
+    migrate_to = '0044_order_totals'
+
+    def setUpBeforeMigration(self, apps):
+        user = apps.get_model('core', 'User').objects.create(username='legacy')
+        category = apps.get_model('core', 'Category').objects.create(name='Main')
+        item = apps.get_model('core', 'MenuItem').objects.create(category=category, name='Karahi', price=850)
+        order = apps.get_model('core', 'Order').objects.create(
+            number='ORD-OLD-1', created_by=user, discount=100, tax_percentage=5, service_charge=50)
+        apps.get_model('core', 'OrderItem').objects.create(order=order, menu_item=item, quantity=3, unit_price=850)
+
+    def test_existing_orders_get_their_totals(self):
+        order = self.apps.get_model('core', 'Order').objects.get(number='ORD-OLD-1')
+        self.assertEqual(order.subtotal, Decimal('2550.00'))
+        self.assertEqual(order.tax_amount, Decimal('122.50'))
+        self.assertEqual(order.grand_total, Decimal('2622.50'))
+
+class OrderListPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lister', password='x')
+        # bulk_create stamps every row with the same created_at: paging must tie-break on id
+        Order.objects.bulk_create([
+            Order(number=f"ORD-PAGE-{i:03d}", created_by=cls.user, status='paid',
+                  subtotal=Decimal('10'), grand_total=Decimal('10'))
+            for i in range(45)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_keyset_pages_cover_every_order_once(self):
+        seen, query = [], ''
+        while True:
+            ctx = self.client.get('/orders/?' + query).context
+            self.assertEqual(ctx['summary_total_orders'], 45)
+            self.assertEqual(ctx['summary_total_amount'], Decimal('450'))
+            seen += [o.number for o in ctx['orders']]
+            query = ctx.get('next_query')
+            if not query:
+                break
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+        back = self.client.get('/orders/?' + ctx['prev_query']).context
+        self.assertEqual(back['start_index'], 21)
+        self.assertEqual(len(back['orders']), 20)
+
+    def test_csv_export_streams_filtered_rows(self):
+        resp = self.client.get('/orders/export.csv', {'q': 'ORD-PAGE-00'})
+        lines = b''.join(resp.streaming_content).decode().strip().splitlines()
+        self.assertEqual(len(lines), 1 + 10)
+
+
+class CustomerLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('udhaar', password='x')
+        self.customer = Customer.objects.create(name='Bashir', phone='0301')
+        self.client.force_login(self.user)
+
+    def credit_order(self, number, total, counter_paid=Decimal('0'), days_ago=0):
+        from .customer_ledger import post_order
+        order = Order.objects.create(number=number, created_by=self.user, status='paid',
+                                     customer=self.customer)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        order.set_totals(total)
+        if counter_paid:
+            Payment.objects.create(order=order, amount=counter_paid, method='cash')
+        post_order(order, counter_paid)
+        return order
+
+    def receipt(self, amount, days_ago=0):
+        return PaymentReceived.objects.create(customer=self.customer, amount=Decimal(amount),
+                                              date=timezone.localdate() - timedelta(days=days_ago),
+                                              created_by=self.user)
+
+    def balances(self):
+        return list(CustomerLedgerEntry.objects.filter(customer=self.customer)
+                    .order_by('posted_at', 'id').values_list('balance', flat=True))
+
+    def test_backdated_postings_and_rebuild_agree(self):
+        from .customer_ledger import rebuild_customer_ledger
+        self.credit_order('ORD-CL-1', Decimal('1000'), days_ago=10)
+        self.credit_order('ORD-CL-2', Decimal('500'), counter_paid=Decimal('200'), days_ago=2)
+        late = self.receipt('300', days_ago=5)           # lands between the two orders
+        self.assertEqual(self.balances(), [Decimal('1000'), Decimal('700'), Decimal('1200'), Decimal('1000')])
+
+        late.amount = Decimal('400')
+        late.save()
+        self.assertEqual(self.balances()[-1], Decimal('900'))
+
+        live = self.balances()
+        rebuild_customer_ledger()
+        self.assertEqual(self.balances(), live)
+
+        late.delete()
+        self.assertEqual(self.balances(), [Decimal('1000'), Decimal('1500'), Decimal('1300')])
+
+    def test_view_reads_window_and_opening_snapshot(self):
+        self.credit_order('ORD-CL-3', Decimal('800'), days_ago=20)
+        self.receipt('250', days_ago=1)
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+        ctx = self.client.get(f'/ledger/customer/{self.customer.pk}/', {'from': since}).context
+        self.assertEqual(ctx['opening'], Decimal('800'))
+        self.assertEqual(len(ctx['entries']), 1)
+        self.assertEqual(ctx['closing'], Decimal('550'))
+
+
+class SupplierLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='x')
+        cls.supplier = Supplier.objects.create(name='Makro')
+        rm = RawMaterial.objects.create(name='Ghee', unit='kg', supplier=cls.supplier)
+        base = timezone.now() - timedelta(days=30)
+        for i in range(6):
+            po = PurchaseOrder.objects.create(supplier=cls.supplier, created_by=cls.user,
+                                              total_cost=Decimal('1000'), net_total=Decimal('1050'))
+            PurchaseOrder.objects.filter(pk=po.pk).update(created_at=base + timedelta(days=i * 5))
+            if i == 0:
+                cls.po = po
+                # legacy row: net_total never filled in
+                PurchaseOrder.objects.filter(pk=po.pk).update(net_total=0)
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(purchase_order=cls.po, raw_material=rm, quantity=Decimal('5'), unit_price=Decimal('200')),
+        ])
+        for i in range(3):
+            e = Expense.objects.create(date=timezone.localdate(), category='purchase', amount=Decimal('500'),
+                                       supplier=cls.supplier, created_by=cls.user)
+            Expense.objects.filter(pk=e.pk).update(created_at=base + timedelta(days=i * 5 + 1))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_paged_running_balance_matches_totals(self):
+        from .ledger import SupplierLedgerView
+        url = f'/ledger/supplier/{self.supplier.pk}/'
+        total = Decimal('1000') + 5 * Decimal('1050') - 3 * Decimal('500')
+        with unittest.mock.patch.object(SupplierLedgerView, 'page_size', 5):
+            ctx = self.client.get(url, {'from_start': '1'}).context
+            self.assertEqual(len(ctx['entries']), 5)
+            self.assertEqual(ctx['closing'], total)
+            self.assertEqual(ctx['entries'][0]['bal'], Decimal('1000'))
+            last_bal = ctx['entries'][-1]['bal']
+
+            ctx = self.client.get(url + '?' + ctx['next_query']).context
+            self.assertEqual(ctx['page_opening'], last_bal)
+            self.assertEqual(len(ctx['entries']), 4)
+            self.assertEqual(ctx['entries'][-1]['bal'], total)
+            self.assertNotIn('next_query', ctx)
+
+        since = (timezone.localdate() - timedelta(days=12)).isoformat()
+        ctx = self.client.get(url, {'from': since}).context
+        self.assertEqual(ctx['opening'] + sum(e['cr'] - e['dr'] for e in ctx['entries']), total)
+
+    def test_legacy_payment_without_created_at_is_kept(self):
+        from .supplier_ledger import SupplierLedger
+        ledger = SupplierLedger(self.supplier)
+        before = ledger.balance_through()
+        paid_on = timezone.localdate() - timedelta(days=3)
+        e = Expense.objects.create(date=paid_on, category='purchase', amount=Decimal('200'),
+                                   supplier=self.supplier, created_by=self.user)
+        Expense.objects.filter(pk=e.pk).update(created_at=None)
+
+        self.assertEqual(ledger.balance_through(), before - Decimal('200'))
+        entries, _ = ledger.page(start=local_day_bounds(paid_on)[0], size=50)
+        legacy = [row for row in entries if row['ref'] == e.pk and row['dr']]
+        self.assertEqual(len(legacy), 1)
+        self.assertEqual(timezone.localtime(legacy[0]['dt']).date(), paid_on)
+
+    def test_po_items_endpoint(self):
+        data = self.client.get(f'/ledger/supplier/po/{self.po.pk}/items/').json()
+        self.assertEqual(data['items'][0]['raw_material'], 'Ghee')
+        self.assertEqual(Decimal(data['items'][0]['line_total']), Decimal('1000'))
+
+
+class PayrollCacheTests(TestCase):
+    def setUp(self):
+        from .payroll import month_start
+        self.user = User.objects.create_user('payroll', password='x')
+        self.client.force_login(self.user)
+        today = timezone.localdate()
+        self.start = month_start(today - timedelta(days=130))       # ~5 months of accrual
+        self.staff = Staff.objects.create(full_name='Chef Aslam', monthly_salary=Decimal('30000'),
+                                          salary_start=self.start)
+
+    def pay(self, amount, day):
+        return Expense.objects.create(date=day, category='salary', amount=Decimal(amount),
+                                      staff=self.staff, created_by=self.user)
+
+    def months(self):
+        from .payroll import month_start
+        today, n, cur = timezone.localdate(), 0, self.start
+        while cur <= month_start(today):
+            n += 1
+            cur = (cur + timedelta(days=32)).replace(day=1)
+        return n
+
+    def test_home_balance_and_invalidation(self):
+        from .payroll import staff_with_balances
+        self.pay('30000', self.start + timedelta(days=3))
+        owed = self.months() * Decimal('30000') - Decimal('30000')
+        self.assertEqual(staff_with_balances().get(pk=self.staff.pk).balance, owed)
+        with self.assertNumQueries(2):      # freshness check + the list itself
+            list(staff_with_balances())
+
+        self.pay('5000', timezone.localdate())
+        self.assertEqual(staff_with_balances().get(pk=self.staff.pk).balance, owed - 5000)
+
+        self.staff.monthly_salary = Decimal('40000')
+        self.staff.save()
+        self.assertEqual(staff_with_balances().get(pk=self.staff.pk).balance,
+                         self.months() * Decimal('40000') - Decimal('35000'))
+
+    def test_ledger_opening_uses_cache(self):
+        first_pay = self.start + timedelta(days=3)
+        self.pay('10000', first_pay)
+        window_start = self.start + timedelta(days=40)              # second month, mid-month
+        self.pay('2000', window_start - timedelta(days=2))
+        ctx = self.client.get(f'/ledger/staff/{self.staff.pk}/', {'from': window_start.isoformat()}).context
+        # one month accrued before the window's month, less both payments
+        self.assertEqual(ctx['opening'], Decimal('30000') - Decimal('12000'))
+
+
+class PartyBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('khata', password='x')
+        self.client.force_login(self.user)
+        self.supplier = Supplier.objects.create(name='Al-Fatah')
+        self.customer = Customer.objects.create(name='Rafiq', phone='0333')
+
+    def row(self, obj):
+        from .party_balances import PARTY_TYPES
+        return PartyBalance.objects.get(party_type=PARTY_TYPES[type(obj)], party_id=obj.pk)
+
+    def test_incremental_updates_match_rebuild(self):
+        from .customer_ledger import post_order
+        from .party_balances import rebuild_party_balances
+        po = PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.user,
+                                          total_cost=Decimal('900'), net_total=Decimal('1000'))
+        pay = Expense.objects.create(category='purchase', amount=Decimal('400'), supplier=self.supplier,
+                                     created_by=self.user)
+        self.assertEqual(self.row(self.supplier).balance, Decimal('600'))
+
+        po.net_total = Decimal('1200')
+        po.save()
+        pay.delete()
+        self.assertEqual(self.row(self.supplier).balance, Decimal('1200'))
+
+        order = Order.objects.create(number='ORD-PB-1', created_by=self.user, status='paid', customer=self.customer)
+        order.set_totals(Decimal('750'))
+        post_order(order)
+        PaymentReceived.objects.create(customer=self.customer, amount=Decimal('250'), created_by=self.user)
+        self.assertEqual(self.row(self.customer).balance, Decimal('500'))
+        self.assertIsNotNone(self.row(self.customer).last_activity)
+
+        live = {(r.party_type, r.party_id): r.balance for r in PartyBalance.objects.all()}
+        rebuild_party_balances()
+        self.assertEqual({(r.party_type, r.party_id): r.balance for r in PartyBalance.objects.all()}, live)
+
+    def test_supplier_due_reads_the_index(self):
+        from .party_balances import verify_suppliers
+        po = PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.user, net_total=Decimal('1000'))
+        PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.user, net_total=Decimal('300'))
+        Expense.objects.create(category='purchase', amount=Decimal('100'), purchase_order=po, created_by=self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/supplier-balance/', {'supplier_id': self.supplier.pk}).json(),
+                             {'previous_due': 1200.0})
+        resp = self.client.get('/api/supplier-balance/', {'supplier_id': self.supplier.pk, 'exclude_po': po.pk})
+        self.assertEqual(resp.json(), {'previous_due': 300.0})
+
+        self.assertEqual(verify_suppliers(), [])
+        PartyBalance.objects.filter(party_type='supplier').update(balance=0)
+        self.assertEqual(verify_suppliers(fix=True), [(self.supplier.pk, 'Al-Fatah', Decimal('0'), Decimal('1200'))])
+        self.assertEqual(self.row(self.supplier).balance, Decimal('1200'))
+
+    def test_home_sorts_and_filters(self):
+        other = Supplier.objects.create(name='Metro')
+        PurchaseOrder.objects.create(supplier=other, created_by=self.user, net_total=Decimal('50'))
+        PurchaseOrder.objects.create(supplier=self.supplier, created_by=self.user, net_total=Decimal('500'))
+        ctx = self.client.get('/ledger/').context
+        self.assertEqual([r.name for r in ctx['suppliers']], ['Al-Fatah', 'Metro'])
+        ctx = self.client.get('/ledger/', {'sort': 'advance', 'q': 'e'}).context
+        self.assertEqual([r.name for r in ctx['suppliers']], ['Metro'])
+        ctx = self.client.get('/ledger/', {'q': '0333'}).context
+        self.assertEqual([r.party_id for r in ctx['customers']], [self.customer.pk])
+
+
+
+class PartyBalanceMigrationTests(MigrationTestCase):
+    migrate_from = '0047_staff_month_balances'
+
+    def setUpBeforeMigration(self, apps):
+        user = apps.get_model('core', 'User').objects.create(username='legacy')
+        supplier = apps.get_model('core', 'Supplier').objects.create(name='Legacy Mills')
+        apps.get_model('core', 'PurchaseOrder').objects.create(
+            supplier=supplier, created_by=user, total_cost=Decimal('500'), net_total=Decimal('500'))
+        apps.get_model('core', 'Expense').objects.create(
+            category='purchase', amount=Decimal('200'), supplier=supplier, created_by=user)
+        self.supplier_id, self.user_id = supplier.pk, user.pk
+
+    def test_upgrade_keeps_supplier_history(self):
+        from .party_balances import supplier_payable, verify_suppliers
+        self.assertEqual(supplier_payable(self.supplier_id), Decimal('300.00'))
+        PurchaseOrder.objects.create(supplier_id=self.supplier_id, created_by_id=self.user_id,
+                                     total_cost=Decimal('100'), net_total=Decimal('100'))
+        self.assertEqual(supplier_payable(self.supplier_id), Decimal('400.00'))
+        self.assertEqual(verify_suppliers(), [])
+
+class BankBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('banker', password='x')
+        self.hbl = BankAccount.objects.create(name='Current', bank_name='HBL', opening_balance=Decimal('1000'))
+        self.mcb = BankAccount.objects.create(name='Savings', bank_name='MCB')
+
+    def balance(self, acc):
+        return BankAccount.objects.get(pk=acc.pk).current_balance
+
+    def test_flows_keep_stored_balance_in_step(self):
+        day = timezone.localdate()
+        cf_in = CashFlow.objects.create(date=day, flow_type=CashFlow.IN, amount=Decimal('500'),
+                                        bank_account=self.hbl, created_by=self.user)
+        cf_out = CashFlow.objects.create(date=day, flow_type=CashFlow.OUT, amount=Decimal('200'),
+                                         bank_account=self.hbl, created_by=self.user)
+        self.assertEqual(self.balance(self.hbl), Decimal('1300'))
+
+        # a stale instance saved from a form must not clobber the stored balance
+        self.hbl.name = 'Current A/C'
+        self.hbl.save()
+        self.assertEqual(self.balance(self.hbl), Decimal('1300'))
+
+        cf_out.bank_account = self.mcb
+        cf_out.amount = Decimal('150')
+        cf_out.save()
+        cf_in.delete()
+        self.assertEqual(self.balance(self.hbl), Decimal('1000'))
+        self.assertEqual(self.balance(self.mcb), Decimal('-150'))
+        self.assertEqual(BankAccount.audit_balances(), [])
+
+        BankAccount.objects.filter(pk=self.mcb.pk).update(flow_balance=0)
+        self.assertEqual(len(BankAccount.audit_balances(fix=True)), 1)
+        self.assertEqual(self.balance(self.mcb), Decimal('-150'))
+
+
+class CashBookTests(TestCase):
+    def setUp(self):
+        from .utils import get_business_date
+        self.user = User.objects.create_user('cashier', password='x')
+        self.client.force_login(self.user)
+        self.bank = BankAccount.objects.create(name='Current', bank_name='HBL', opening_balance=Decimal('500'))
+        self.today = get_business_date()
+
+    def flow(self, days_ago, kind, amount, bank=None):
+        return CashFlow.objects.create(date=self.today - timedelta(days=days_ago), flow_type=kind,
+                                       amount=Decimal(amount), bank_account=bank, created_by=self.user)
+
+    def test_snapshots_follow_edits(self):
+        from . import cashbook
+        from .models import CashDaySnapshot
+        first = self.flow(3, CashFlow.IN, '1000')
+        self.flow(2, CashFlow.IN, '200', bank=self.bank)
+        self.flow(1, CashFlow.OUT, '300')
+        self.flow(0, CashFlow.IN, '50')
+
+        cash, bank = cashbook.positions(self.today - timedelta(days=1), self.today)[:2]
+        self.assertEqual((cash['opening'], cash['cash_in'], cash['cash_out'], cash['closing']),
+                         (Decimal('1000'), Decimal('50'), Decimal('300'), Decimal('750')))
+        self.assertEqual((bank['opening'], bank['closing']), (Decimal('700'), Decimal('700')))
+        self.assertEqual(CashDaySnapshot.objects.filter(bank_account__isnull=True).count(), 2)
+
+        first.amount = Decimal('1200')
+        first.save()
+        self.assertFalse(CashDaySnapshot.objects.filter(bank_account__isnull=True).exists())
+        rows = cashbook.daily(cashbook.CASH, self.today - timedelta(days=3), self.today)
+        self.assertEqual([r['closing'] for r in rows],
+                         [Decimal('1200'), Decimal('1200'), Decimal('900'), Decimal('950')])
+
+        self.assertEqual(self.client.get('/cash-book/', {'account': self.bank.pk}).status_code, 200)
+        self.assertContains(self.client.get('/cash-book/shift-close/'), 'Shift Close')
+        self.assertEqual(self.client.get('/cash-book/', {'to': '9999-12-31'}).status_code, 400)
+        self.assertEqual(self.client.get('/cash-book/', {'from': '2020-01-01', 'to': '2020-12-31'}).status_code, 400)
+        self.assertEqual(self.client.get('/cash-book/shift-close/', {'day': '9999-12-31'}).status_code, 400)
+        ahead = self.today + timedelta(days=30)   # open days stop at today
+        rows = self.client.get('/cash-book/', {'from': self.today, 'to': ahead}).context['rows']
+        self.assertEqual([r['day'] for r in rows], [self.today])
+
+    def test_live_entries_follow_start_of_day_cut(self):
+        from datetime import datetime, time
+        from .cashbook import business_day_of
+        night = timezone.make_aware(datetime.combine(self.today, time(1, 30)))
+        cf = CashFlow(date=self.today, created_at=night)
+        self.assertEqual(business_day_of(cf), self.today - timedelta(days=1))
+        cf.date = self.today - timedelta(days=5)
+        self.assertEqual(business_day_of(cf), cf.date)
+
+
+class BankImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('accounts', password='x')
+        self.client.force_login(self.user)
+        self.hbl = BankAccount.objects.create(name='Current', bank_name='HBL', account_number='0042')
+        self.mcb = BankAccount.objects.create(name='Savings', bank_name='MCB')
+
+    def test_import_pairs_cash_flows_and_reports_bad_lines(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import BankMovement
+        good = ("date,type,amount,from_bank,to_bank,reference_no\n"
+                "2024-01-02,deposit,1000,,0042,DEP1\n"
+                "03/01/2024,transfer,250,0042,savings,TRF1\n"
+                "2024-01-04,fee,15,0042,,\n")
+        bad = good + "2024-01-05,transfer,100,0042,0042,\n2024-13-01,deposit,5,,0042,\n"
+
+        resp = self.client.post('/bank-movements/import/', {'file': SimpleUploadedFile('s.csv', bad.encode())})
+        self.assertEqual([n for n, _ in resp.context['errors']], [5, 6])
+        self.assertFalse(BankMovement.objects.exists())
+
+        resp = self.client.post('/bank-movements/import/', {'file': SimpleUploadedFile('s.csv', good.encode())})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(BankMovement.objects.count(), 3)
+        self.assertEqual(CashFlow.objects.count(), 5)
+        self.assertEqual(BankMovement.objects.get(reference_no='TRF1').cashflow_in.bank_account, self.mcb)
+        self.assertEqual(BankAccount.objects.get(pk=self.hbl.pk).current_balance, Decimal('735'))
+        self.assertEqual(BankAccount.audit_balances(), [])
+
+
+class CustomerBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('counter', password='x')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(name='Nadeem', phone='0321', current_balance=Decimal('100'))
+
+    def stored(self):
+        return Customer.objects.get(pk=self.customer.pk).current_balance
+
+    def test_balance_follows_journal(self):
+        from .customer_ledger import post_order, recalculate_balances, verify_balances
+        self.assertEqual(self.stored(), Decimal('100'))
+        self.assertEqual(CustomerLedgerEntry.objects.get(customer=self.customer).kind, CustomerLedgerEntry.ADJUSTMENT)
+
+        stale = Customer.objects.get(pk=self.customer.pk)
+        PaymentReceived.objects.create(customer=self.customer, amount=Decimal('30'), created_by=self.user)
+        stale.name = 'Nadeem Bhai'
+        stale.save()
+        self.assertEqual(self.stored(), Decimal('70'))
+
+        order = Order.objects.create(number='ORD-CB-1', created_by=self.user, status='paid', customer=self.customer)
+        order.set_totals(Decimal('500'))
+        post_order(order, Decimal('200'))
+        post_order(order, Decimal('200'))   # re-posting an edited order replaces, never adds twice
+        self.assertEqual(self.stored(), Decimal('370'))
+
+        self.client.post(f'/customers/{self.customer.pk}/edit/',
+                         {'name': 'Nadeem Bhai', 'phone': '0321', 'current_balance': '400'})
+        self.assertEqual(self.stored(), Decimal('400'))
+        self.assertFalse(verify_balances().exists())
+
+        Customer.objects.filter(pk=self.customer.pk).update(current_balance=0)
+        self.assertEqual(list(verify_balances()), [self.customer])
+        recalculate_balances()
+        self.assertEqual(self.stored(), Decimal('400'))
+
+
+
+class CustomerBalanceMigrationTests(MigrationTestCase):
+    migrate_from = '0042_paymentreceived'
+
+    def setUpBeforeMigration(self, apps):
+        Customer = apps.get_model('core', 'Customer')
+        user = apps.get_model('core', 'User').objects.create(username='legacy')
+        category = apps.get_model('core', 'Category').objects.create(name='Main')
+        item = apps.get_model('core', 'MenuItem').objects.create(category=category, name='Karahi', price=100)
+
+        def credit_order(number, customer, quantity):
+            order = apps.get_model('core', 'Order').objects.create(
+                number=number, created_by=user, status='paid', customer=customer)
+            apps.get_model('core', 'OrderItem').objects.create(
+                order=order, menu_item=item, quantity=quantity, unit_price=100)
+
+        # balance fully explained by one credit order
+        self.explained = Customer.objects.create(name='Asif', phone='0301', current_balance=Decimal('1000'))
+        credit_order('ORD-OLD-1', self.explained, 10)
+        # 200 from an order, 300 typed into the balance by hand
+        self.legacy = Customer.objects.create(name='Bilal', phone='0302', current_balance=Decimal('500'))
+        credit_order('ORD-OLD-2', self.legacy, 2)
+
+    def balances(self):
+        from .customer_ledger import verify_balances
+        self.assertFalse(verify_balances().exists())
+        return {c.pk: c.current_balance for c in Customer.objects.all()}
+
+    def test_migrate_then_rebuild_counts_legacy_balances_once(self):
+        from .customer_ledger import rebuild_customer_ledger
+        expected = {self.explained.pk: Decimal('1000'), self.legacy.pk: Decimal('500')}
+        self.assertEqual(self.balances(), expected)
+        carried = CustomerLedgerEntry.objects.get(kind=CustomerLedgerEntry.OPENING)
+        self.assertEqual((carried.customer_id, carried.debit), (self.legacy.pk, Decimal('300')))
+
+        rebuild_customer_ledger()
+        self.assertEqual(self.balances(), expected)
+        rebuild_customer_ledger()
+        self.assertEqual(self.balances(), expected)
+        self.assertEqual(PartyBalance.objects.get(party_type='customer', party_id=self.legacy.pk).balance,
+                         Decimal('500'))
+
+class PurchaseOrderLineTests(TestCase):
+    def setUp(self):
+        import json
+        self.json = json.dumps
+        self.user = User.objects.create_user('store', password='x')
+        self.client.force_login(self.user)
+        self.supplier = Supplier.objects.create(name='Mandi')
+        self.rice, self.oil, self.salt = (
+            RawMaterial.objects.create(name=n, unit='kg', supplier=self.supplier) for n in ('Rice', 'Oil', 'Salt'))
+
+    def stock(self):
+        return {rm.name: rm.current_stock for rm in RawMaterial.objects.all()}
+
+    def post(self, url, lines):
+        return self.client.post(url, {'supplier': self.supplier.pk, 'po_items_json': self.json([
+            {'raw_material_id': rm.pk, 'quantity': q, 'unit_price': p} for rm, q, p in lines])})
+
+    def test_edit_moves_only_net_stock(self):
+        self.post('/purchase-orders/create/', [(self.rice, 10, 200), (self.oil, 5, 500)])
+        po = PurchaseOrder.objects.get()
+        self.assertEqual(self.stock(), {'Rice': 10, 'Oil': 5, 'Salt': 0})
+        rice_line = po.items.get(raw_material=self.rice).pk
+
+        txns = InventoryTransaction.objects.count()
+        self.post(f'/purchase-orders/{po.pk}/edit/', [(self.rice, 10, 210), (self.salt, 2, 50)])
+        self.assertEqual(self.stock(), {'Rice': 10, 'Oil': 0, 'Salt': 2})
+        self.assertEqual(po.items.get(raw_material=self.rice).pk, rice_line)   # updated in place
+        self.assertEqual(InventoryTransaction.objects.count(), txns + 2)      # oil out, salt in
+        self.assertEqual(PurchaseOrder.objects.get().total_cost, Decimal('2200'))
+
+        self.client.post(f'/purchase-orders/{po.pk}/delete/')
+        self.assertEqual(self.stock(), {'Rice': 0, 'Oil': 0, 'Salt': 0})
+
+    def test_bad_lines_write_nothing_and_import_shares_the_path(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        resp = self.post('/purchase-orders/create/', [(self.rice, 10, 200), (self.oil, 0, 500)])
+        self.assertEqual(resp.status_code, 200)   # form re-rendered with the line error
+        self.assertFalse(PurchaseOrder.objects.exists())
+        self.assertEqual(self.stock(), {'Rice': 0, 'Oil': 0, 'Salt': 0})
+
+        sheet = b"raw_material,quantity,unit_price\nrice,4,250\n\nOil,2,500\n"
+        self.client.post('/purchase-orders/import/', {
+            'supplier': self.supplier.pk, 'tax_percent': '10',
+            'file': SimpleUploadedFile('po.csv', sheet)})
+        po = PurchaseOrder.objects.get()
+        self.assertEqual((po.total_cost, po.net_total), (Decimal('2000'), Decimal('2200')))
+        self.assertEqual(self.stock(), {'Rice': 4, 'Oil': 2, 'Salt': 0})
+
+        resp = self.client.post('/purchase-orders/import/', {
+            'supplier': self.supplier.pk, 'file': SimpleUploadedFile('po.csv', b"raw_material,quantity,unit_price\nGhee,1,1\n")})
+        self.assertEqual(list(resp.context['errors']), [(2, "Unknown raw material 'Ghee'.")])
+        self.assertEqual(PurchaseOrder.objects.count(), 1)
+
+
+class RecipeEditorTests(TestCase):
+    def setUp(self):
+        import json
+        from .models import Recipe, Unit
+        self.json = json.dumps
+        self.client.force_login(User.objects.create_user('chef', password='x'))
+        cat = Category.objects.create(name='Kitchen')
+        self.gram = Unit.objects.create(name='Gram', symbol='g', unit_type='mass')
+        supplier = Supplier.objects.create(name='Mandi')
+        self.rice, self.oil = (RawMaterial.objects.create(name=n, unit='g', supplier=supplier) for n in ('Rice', 'Oil'))
+        self.biryani, self.masala, self.gravy = (
+            Recipe.objects.create(menu_item=MenuItem.objects.create(category=cat, name=n, price=Decimal('1')))
+            for n in ('Biryani', 'Masala', 'Gravy'))
+
+    def save(self, recipe, raw=(), sub=()):
+        return self.client.post(f'/recipes/{recipe.pk}/edit/', {
+            'menu_item': recipe.menu_item_id, 'name': '',
+            'raw_json': self.json([{'raw_material_id': rm.pk, 'quantity': q, 'unit_id': self.gram.pk} for rm, q in raw]),
+            'sub_json': self.json([{'sub_recipe_id': r.pk, 'quantity': q, 'unit_id': self.gram.pk} for r, q in sub]),
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_lines_are_diffed_and_cycles_refused(self):
+        self.save(self.biryani, raw=[(self.rice, 200), (self.oil, 20)], sub=[(self.masala, 30)])
+        rice_line = self.biryani.raw_ingredients.get(raw_material=self.rice).pk
+        self.save(self.biryani, raw=[(self.rice, 250)], sub=[(self.masala, 30)])
+        self.assertEqual(list(self.biryani.raw_ingredients.values_list('pk', 'quantity')), [(rice_line, Decimal('250'))])
+
+        self.save(self.masala, sub=[(self.gravy, 10)])
+        resp = self.save(self.gravy, raw=[(self.oil, 5)], sub=[(self.biryani, 50)])
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('Gravy → Biryani → Masala → Gravy', resp.json()['__all__'][0])
+        self.assertFalse(self.gravy.raw_ingredients.exists())
+
+        resp = self.save(self.gravy, raw=[(self.oil, 0)])
+        self.assertEqual(resp.json(), {'__all__': ['Ingredient line 1: Quantity must be greater than zero.']})
+
+        ctx = self.client.get(f'/recipes/{self.gravy.pk}/edit/').context
+        self.assertEqual(ctx['recipes_json'], '[{"pk": %d, "name": "Biryani"}, {"pk": %d, "name": "Masala"}]'
+                         % (self.biryani.pk, self.masala.pk))   # every recipe but this one
+
+
+class BomTests(TestCase):
+    def setUp(self):
+        from .models import Deal, DealItem, Recipe, RecipeRawMaterial, RecipeSubRecipe, Unit
+        self.user = User.objects.create_user('bom', password='x')
+        g = Unit.objects.create(name='Gram', symbol='g', unit_type='mass')
+        supplier = Supplier.objects.create(name='Mandi')
+        self.chicken, self.oil, self.salt = (RawMaterial.objects.create(name=n, unit='g', supplier=supplier)
+                                             for n in ('Chicken', 'Oil', 'Salt'))
+        cat = Category.objects.create(name='Main')
+        self.karahi = MenuItem.objects.create(category=cat, name='Karahi', price=Decimal('1500'))
+        sauce = Recipe.objects.create(menu_item=MenuItem.objects.create(category=cat, name='Sauce', price=1))
+        self.sauce_oil = RecipeRawMaterial.objects.create(recipe=sauce, raw_material=self.oil, quantity=100, unit=g)
+        RecipeRawMaterial.objects.create(recipe=sauce, raw_material=self.salt, quantity=10, unit=g)
+        karahi = Recipe.objects.create(menu_item=self.karahi)
+        RecipeRawMaterial.objects.create(recipe=karahi, raw_material=self.chicken, quantity=500, unit=g)
+        RecipeSubRecipe.objects.create(recipe=karahi, sub_recipe=sauce, quantity=55, unit=g)
+        self.deal = Deal.objects.create(name='Family', price=Decimal('2800'))
+        DealItem.objects.create(deal=self.deal, menu_item=self.karahi, quantity=2)
+
+    def bom(self, **owner):
+        from .bom import lines_for
+        return {RawMaterial.objects.get(pk=rm).name: q.normalize() for rm, q in lines_for(**owner).items()}
+
+    def test_sub_recipes_flatten_and_follow_edits(self):
+        self.assertEqual(self.bom(menu_item_id=self.karahi.pk), {'Chicken': 500, 'Oil': 50, 'Salt': 5})
+        self.assertEqual(self.bom(deal_id=self.deal.pk), {'Chicken': 1000, 'Oil': 100, 'Salt': 10})
+
+        self.sauce_oil.quantity = 45   # sauce is now 45 oil : 10 salt
+        self.sauce_oil.save()
+        self.assertEqual(self.bom(deal_id=self.deal.pk), {'Chicken': 1000, 'Oil': 90, 'Salt': 20})
+
+    def test_order_lines_take_only_the_difference(self):
+        order = Order.objects.create(number='ORD-BOM-1', created_by=self.user)
+        line = OrderItem.objects.create(order=order, deal=self.deal, quantity=1, unit_price=Decimal('2800'))
+        stock = lambda: {rm.name: rm.current_stock for rm in RawMaterial.objects.all()}
+        self.assertEqual(stock(), {'Chicken': -1000, 'Oil': -100, 'Salt': -10})
+
+        line.quantity = 2
+        line.save()
+        line.save()
+        self.assertEqual(stock(), {'Chicken': -2000, 'Oil': -200, 'Salt': -20})
+        self.assertEqual(InventoryTransaction.objects.filter(order_item=line).count(), 6)
+
+    def test_theoretical_usage_by_business_day(self):
+        from datetime import date, datetime
+        from django.utils import timezone
+        from .consumption import as_json, theoretical_usage
+
+        for n, (when, kw) in enumerate([
+            (datetime(2025, 3, 1, 20, 0), {'menu_item': self.karahi}),
+            (datetime(2025, 3, 2, 1, 30), {'deal': self.deal}),   # before 06:00 -> 1 March
+            (datetime(2025, 3, 2, 13, 0), {'menu_item': self.karahi}),
+        ]):
+            order = Order.objects.create(number=f'ORD-USE-{n}', created_by=self.user)
+            OrderItem.objects.create(order=order, quantity=1, unit_price=1, **kw)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(when))
+
+        data = as_json(theoretical_usage(date(2025, 3, 1), date(2025, 3, 2)))
+        self.assertEqual(data['days'], ['2025-03-01', '2025-03-02'])
+        self.assertEqual({m['name']: m['daily'] for m in data['materials']},
+                         {'Chicken': [1500, 500], 'Oil': [150, 50], 'Salt': [15, 5]})
+
+    def test_consumption_range_is_capped(self):
+        self.client.force_login(self.user)
+        ok = {'from': '2025-01-01', 'to': '2025-04-02'}   # 92 days
+        self.assertEqual(self.client.get('/api/consumption/', ok).status_code, 200)
+        too_long = {'from': '2024-01-01', 'to': '2025-04-02'}
+        resp = self.client.get('/api/consumption/', too_long)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('error', resp.json())
+        self.assertEqual(self.client.get('/reports/consumption/', too_long).status_code, 400)
+        far = {'from': '9999-12-25', 'to': '9999-12-31'}
+        self.assertEqual(self.client.get('/api/consumption/', far).status_code, 400)
+
+    def test_variance_flags_and_follows_voucher_edits(self):
+        from datetime import datetime, time
+        from .models import KitchenVoucher, KitchenVoucherItem, VarianceDay
+        from .utils import get_business_date
+        from . import variance
+
+        day = get_business_date() - timedelta(days=2)
+        order = Order.objects.create(number='ORD-VAR-1', created_by=self.user)
+        OrderItem.objects.create(order=order, menu_item=self.karahi, quantity=1, unit_price=1)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.combine(day, time(13))))
+        voucher = KitchenVoucher.objects.create(date=day, created_by=self.user)
+        issue = KitchenVoucherItem.objects.create(voucher=voucher, raw_material=self.chicken, quantity=1200)
+
+        chicken = lambda: next(r for r in variance.daily(day, day) if r['name'] == 'Chicken')
+        row = chicken()
+        self.assertEqual((row['net_issued'], row['theoretical'], row['variance_pct'], row['flagged']),
+                         (1200, 500, Decimal('140.0'), True))
+        self.assertTrue(VarianceDay.objects.filter(day=day).exists())
+
+        issue.quantity = 550
+        issue.save()
+        self.assertFalse(VarianceDay.objects.filter(day=day).exists())
+        self.assertEqual((chicken()['variance'], chicken()['flagged']), (50, False))
+
+        self.client.force_login(self.user)
+        for bad in ('nan', 'inf', '-Infinity'):
+            resp = self.client.get('/kitchen/variance/', {'from': day, 'to': day, 'threshold': bad})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.context['threshold'], variance.DEFAULT_THRESHOLD)
+        resp = self.client.get('/kitchen/variance/', {'from': '2000-01-01', 'to': day})
+        self.assertEqual(resp.status_code, 400)
+
+
+class KitchenVoucherSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('store', password='x')
+        self.client.force_login(self.user)
+        supplier = Supplier.objects.create(name='Mandi')
+        self.rice, self.oil = (RawMaterial.objects.create(name=n, unit='kg', supplier=supplier)
+                               for n in ('Rice', 'Oil'))
+
+    def stock(self):
+        return {rm.name: rm.current_stock for rm in RawMaterial.objects.all()}
+
+    def post(self, url, vtype, lines, existing=()):
+        data = {'date': '2025-03-01', 'vtype': vtype, 'items-TOTAL_FORMS': len(lines),
+                'items-INITIAL_FORMS': len(existing), 'items-MIN_NUM_FORMS': 1, 'items-MAX_NUM_FORMS': 1000}
+        for n, (rm, qty) in enumerate(lines):
+            data.update({f'items-{n}-raw_material': rm.pk, f'items-{n}-quantity': qty})
+            if n < len(existing):
+                data[f'items-{n}-id'] = existing[n]
+        return self.client.post(url, data)
+
+    def test_saves_sync_once_and_move_net_stock(self):
+        from .models import KitchenVoucher
+        self.post('/kitchen/vouchers/new/', 'issue', [(self.rice, 10), (self.oil, 4)])
+        voucher = KitchenVoucher.objects.get()
+        self.assertEqual(self.stock(), {'Rice': -10, 'Oil': -4})
+        self.assertEqual(InventoryTransaction.objects.count(), 2)
+        self.assertEqual(voucher.sync_transactions(), (0, 0))   # nothing stale
+
+        items = list(voucher.items.order_by('id').values_list('id', flat=True))
+        self.post(f'/kitchen/vouchers/{voucher.pk}/edit/', 'return', [(self.rice, 3), (self.oil, 4)], items)
+        self.assertEqual(self.stock(), {'Rice': 3, 'Oil': 4})
+        self.assertEqual(InventoryTransaction.objects.count(), 2)
+
+        voucher.delete()
+        self.assertEqual(self.stock(), {'Rice': 0, 'Oil': 0})
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+
+class StockMovementTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('store', password='x')
+        self.client.force_login(self.user)
+        self.rice = RawMaterial.objects.create(name='Rice', unit='kg', supplier=Supplier.objects.create(name='Mandi'))
+
+    def move(self, ttype, qty, source, day):
+        return InventoryTransaction.objects.create(raw_material=self.rice, transaction_type=ttype,
+                                                   quantity=qty, source=source, date=day)
+
+    def test_month_snapshot_opening_and_backdated_edit(self):
+        from .models import StockMonthSnapshot
+        from .movements import month_start, totals
+
+        this_month = month_start(timezone.localdate())
+        old = this_month - timedelta(days=40)
+        receipt = self.move('in', 100, 'purchase', old)
+        self.move('out', 30, 'kitchen', old + timedelta(days=1))
+        self.move('out', 5, 'sale', timezone.localdate())
+
+        t = totals()[self.rice.pk]
+        self.assertEqual((t['purchased'], t['issued'], t['sold']), (100, 30, 5))
+        self.assertTrue(StockMonthSnapshot.objects.filter(raw_material=self.rice, month=month_start(old)).exists())
+
+        url = f'/ledger/raw-material/{self.rice.pk}/?from={this_month:%Y-%m-%d}'
+        store = self.client.get(url).context
+        self.assertEqual((store['opening'], store['closing'], len(store['entries'])), (70, 70, 0))
+        every = self.client.get(url + '&scope=all').context
+        self.assertEqual((every['opening'], every['closing'], len(every['entries'])), (70, 65, 1))
+
+        receipt.quantity = 120
+        receipt.save()
+        self.assertFalse(StockMonthSnapshot.objects.filter(raw_material=self.rice).exists())
+        self.assertEqual(totals()[self.rice.pk]['purchased'], 120)
+        self.assertEqual(RawMaterial.objects.get().current_stock, 85)
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='x')
+        self.client.force_login(self.user)
+        self.mandi, self.dairy = Supplier.objects.create(name='Mandi'), Supplier.objects.create(name='Dairy')
+        self.rice = RawMaterial.objects.create(name='Rice', unit='kg', supplier=self.mandi,
+                                               current_stock=50, reorder_level=20)
+        self.milk = RawMaterial.objects.create(name='Milk', unit='l', supplier=self.dairy,
+                                               current_stock=30, reorder_level=10)
+
+    def test_rolled_back_batch_leaves_no_alert(self):
+        from django.core.cache import cache
+        from django.db import transaction
+        from . import reorder
+        from .stock import apply_stock_deltas
+
+        cache.set(reorder.CACHE_KEY, frozenset())
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                apply_stock_deltas({self.rice.pk: Decimal('-45')})
+                self.assertEqual(reorder.below_ids(), {self.rice.pk})
+                raise RuntimeError("rolled back")
+        self.assertIsNone(cache.get(reorder.CACHE_KEY))
+        self.assertEqual(callbacks, [])
+        self.assertEqual(reorder.below_ids(), frozenset())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            apply_stock_deltas({self.rice.pk: Decimal('-45')})
+        self.assertEqual(callbacks, [reorder.refresh])
+
+    def test_stock_batches_refresh_alerts_and_prefill_po(self):
+        from . import reorder
+        self.assertEqual(reorder.below_ids(), frozenset())
+
+        # 42 kg issued over the last fortnight: 3 kg/day, 8 kg left
+        InventoryTransaction.objects.create(raw_material=self.rice, transaction_type='out', quantity=42,
+                                            source='kitchen', date=timezone.localdate() - timedelta(days=3))
+        self.assertEqual(reorder.below_ids(), {self.rice.pk})
+
+        [row] = reorder.alerts()
+        self.assertEqual((row['velocity'], row['days_cover'], row['suggested']), (3, Decimal('2.7'), 33))
+
+        ctx = self.client.get(f'/purchase-orders/create/?reorder={self.mandi.pk}').context
+        self.assertEqual(ctx['form'].initial['supplier'], self.mandi.pk)
+        self.assertIn('"quantity": 33.0', ctx['initial_po_items_json'])
+        self.assertEqual(self.client.get(f'/purchase-orders/create/?reorder={self.dairy.pk}')
+                         .context['initial_po_items_json'], '[]')
@@ -10,7 +10,7 @@ from .views import (
     CategoryUpdateView, CategoryDeleteView,
     MenuItemListView, MenuItemCreateView, MenuItemDetailView,
     MenuItemUpdateView, MenuItemDeleteView,
-    OrderListView, OrderDetailView, OrderCreateView, OrderUpdateView, OrderDeleteView,
+    OrderListView, OrderExportCSVView, OrderDetailView, OrderCreateView, OrderUpdateView, OrderDeleteView,
     DealListView, DealCreateView, DealDetailView, DealUpdateView, DealDeleteView
 )
 
@@ -60,6 +60,7 @@ urlpatterns = [
 
     # ======== Orders & Printing ========
     path('orders/', OrderListView.as_view(), name='order_list'),
+    path('orders/export.csv', OrderExportCSVView.as_view(), name='order_export_csv'),
     path('orders/create/', OrderCreateView.as_view(), name='order_create'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order_detail'),
     path('orders/<int:pk>/edit/', OrderUpdateView.as_view(), name='order_edit'),
@@ -123,12 +124,14 @@ from .views import (
     PurchaseOrderUpdateView,
     PurchaseOrderDeleteView,
     purchase_order_receive,
+    PurchaseOrderImportView,
 )
 
 urlpatterns += [
     # Purchase Orders CRUD
     path('purchase-orders/', PurchaseOrderListView.as_view(), name='purchase_order_list'),
     path('purchase-orders/create/', PurchaseOrderCreateView.as_view(), name='purchase_order_create'),
+    path('purchase-orders/import/', PurchaseOrderImportView.as_view(), name='purchase_order_import'),
     path('purchase-orders/<int:pk>/', PurchaseOrderDetailView.as_view(), name='purchase_order_detail'),
     path('purchase-orders/<int:pk>/edit/', PurchaseOrderUpdateView.as_view(), name='purchase_order_edit'),
     path('purchase-orders/<int:pk>/delete/', PurchaseOrderDeleteView.as_view(), name='purchase_order_delete'),
@@ -196,6 +199,7 @@ urlpatterns += [
 from .bank_account import (
     BankAccountListView, BankAccountCreateView, BankAccountUpdateView, BankAccountDeleteView,
     BankMovementListView, BankMovementCreateView, BankMovementUpdateView, BankMovementDeleteView,
+    CashBookView, ShiftCloseView, BankMovementImportView,
 )
 
 urlpatterns += [
@@ -208,8 +212,13 @@ urlpatterns += [
     # Bank Movements
     path('bank-movements/', BankMovementListView.as_view(), name='bankmovement_list'),
     path('bank-movements/create/', BankMovementCreateView.as_view(), name='bankmovement_create'),
+    path('bank-movements/import/', BankMovementImportView.as_view(), name='bankmovement_import'),
     path('bank-movements/<int:pk>/edit/', BankMovementUpdateView.as_view(), name='bankmovement_update'),
     path('bank-movements/<int:pk>/delete/', BankMovementDeleteView.as_view(), name='bankmovement_delete'),
+
+    # Cash Book
+    path('cash-book/', CashBookView.as_view(), name='cash_book'),
+    path('cash-book/shift-close/', ShiftCloseView.as_view(), name='shift_close'),
 ]
 
 # urls.py
@@ -251,19 +260,21 @@ from .ledger import (
     SupplierLedgerView,
     StaffLedgerView,
     RawMaterialLedgerView,
-    CustomerLedgerView
+    CustomerLedgerView,
+    supplier_po_items_json,
 )
 
 urlpatterns += [
     path('ledger/', LedgerHomeView.as_view(), name='ledger_home'),
     path('ledger/supplier/<int:pk>/', SupplierLedgerView.as_view(), name='ledger_supplier'),
+    path('ledger/supplier/po/<int:pk>/items/', supplier_po_items_json, name='ledger_supplier_po_items'),
     path('ledger/staff/<int:pk>/', StaffLedgerView.as_view(), name='ledger_staff'),
     path('ledger/customer/<int:pk>/', CustomerLedgerView.as_view(), name='ledger_customer'),
 ]
 
 from core.kitchen import (
     KitchenVoucherListView, KitchenVoucherCreateView, KitchenVoucherUpdateView, KitchenVoucherDeleteView,
-    KitchenStockSummaryView
+    KitchenStockSummaryView, KitchenVarianceView
 )
 
 urlpatterns += [
@@ -273,6 +284,7 @@ urlpatterns += [
     path('kitchen/vouchers/<int:pk>/delete/', KitchenVoucherDeleteView.as_view(), name='kitchen_voucher_delete'),
 
     path('kitchen/stock/', KitchenStockSummaryView.as_view(), name='kitchen_stock_summary'),
+    path('kitchen/variance/', KitchenVarianceView.as_view(), name='kitchen_variance'),
 ]
 
 
@@ -280,11 +292,13 @@ urlpatterns += [
     path('ledger/raw-material/<int:pk>/', RawMaterialLedgerView.as_view(), name='raw_material_ledger'),
 ]
 
-from core.reports import ReportsOverviewView, api_sales_report
+from core.reports import ReportsOverviewView, api_sales_report, ConsumptionReportView, api_consumption
 
 urlpatterns += [
     path('reports/', ReportsOverviewView.as_view(), name='reports'),
     path('api/sales-report/', api_sales_report, name='api_sales_report'),
+    path('reports/consumption/', ConsumptionReportView.as_view(), name='consumption_report'),
+    path('api/consumption/', api_consumption, name='api_consumption'),
 ]
 
 from .views import (
@@ -328,8 +342,14 @@ urlpatterns += [
     path('payments-in/<int:pk>/delete/', PaymentReceivedDeleteView.as_view(), name='payment_received_delete'),
 ]
 
-from .views import MarketListView
+from .views import MarketListView, ReorderAlertsView
 
 urlpatterns += [
     path('kitchen/market-list/', MarketListView.as_view(), name='market_list_print'),
-]
\ No newline at end of file
+    path('inventory/reorder/', ReorderAlertsView.as_view(), name='reorder_alerts'),
+]
+from .instrumentation import request_metrics_json
+
+urlpatterns += [
+    path('metrics/requests/', request_metrics_json, name='request_metrics'),
+]
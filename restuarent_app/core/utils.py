@@ -1,6 +1,5 @@
 # core/utils.py
 from decimal import Decimal, getcontext
-from .models import RawMaterialUnitConversion, PurchaseOrderItem
 
 # bump precision to avoid rounding errors
 getcontext().prec = 28
@@ -11,54 +10,11 @@ def recipe_cost_and_weight(recipe):
       ( total_cost_for_this_recipe_definition,
         total_base_qty_produced_by_this_recipe  )
     where base_qty is in the recipe's base unit (e.g. grams or ml).
+    Read from the menu item's flattened BOM (core.bom): sub-recipes count
+    as weight portions of their own cost per base unit.
     """
-    # preload conversion factors: (raw_material_id, unit_symbol) → to_base_factor
-    convs = {
-        (c.raw_material_id, c.unit.symbol): Decimal(c.to_base_factor)
-        for c in RawMaterialUnitConversion.objects.select_related('unit').all()
-    }
-
-    # helper: avg cost **per base unit** for a raw material
-    _cache = {}
-    def avg_cost_per_base(rm):
-        if rm.id in _cache:
-            return _cache[rm.id]
-        pois = PurchaseOrderItem.objects.filter(raw_material=rm)
-        total_cost = Decimal('0')
-        total_base = Decimal('0')
-        for poi in pois:
-            q = Decimal(poi.quantity)
-            p = Decimal(poi.unit_price)
-            factor = convs.get((rm.id, rm.unit), Decimal('1'))
-            total_base += q * factor
-            total_cost += q * p
-        avg = (total_cost / total_base) if total_base else Decimal('0')
-        _cache[rm.id] = avg
-        return avg
-
-    # 1) sum raw-material lines
-    total_cost = Decimal('0')
-    total_base = Decimal('0')
-    for ri in recipe.raw_ingredients.select_related('raw_material','unit'):
-        rm     = ri.raw_material
-        qty    = Decimal(ri.quantity)         # e.g. 150
-        symbol = ri.unit.symbol               # e.g. 'g'
-        factor = convs.get((rm.id, symbol), Decimal('1'))
-        base   = qty * factor                 # e.g. 150g→150
-        total_base += base
-        total_cost += base * avg_cost_per_base(rm)
-
-    # 2) recurse into sub-recipes as **weight** portions
-    for sub in recipe.subrecipes.select_related('sub_recipe'):
-        sub_recipe = sub.sub_recipe
-        sub_cost, sub_base = recipe_cost_and_weight(sub_recipe)
-        # cost per base-unit (e.g. per gram) of the FULL sub-recipe
-        cpb = (sub_cost / sub_base) if sub_base else Decimal('0')
-        req = Decimal(sub.quantity)  # NOW interpreted as grams
-        total_base += req
-        total_cost += cpb * req
-
-    return total_cost.quantize(Decimal('0.01')), total_base
+    from .bom import item_cost_and_weight
+    return item_cost_and_weight(recipe.menu_item_id)
 
 def compute_recipe_cost(recipe):
     """Back-compat: returns just the cost for the full recipe definition."""
@@ -132,21 +88,25 @@ from django.utils import timezone
 from django.db import transaction
 import datetime
 
+def start_of_day_time():
+    """POSSettings.start_of_day_time, or 06:00 AM when unset."""
+    from .models import POSSettings  # delayed import to avoid circular dep
+
+    # Get setting or default to 06:00 AM
+    try:
+        settings_obj = POSSettings.objects.first()
+        return settings_obj.start_of_day_time if settings_obj else datetime.time(6, 0)
+    except:
+        return datetime.time(6, 0)
+
+
 def get_business_date(dt=None):
     """
     Calculates the 'Business Date' based on POSSettings.start_of_day_time.
     If current time < start_time, it belongs to the previous calendar day.
     """
-    from .models import POSSettings  # delayed import to avoid circular dep
-    
     ref = dt or timezone.localtime(timezone.now())
-    
-    # Get setting or default to 06:00 AM
-    try:
-        settings_obj = POSSettings.objects.first()
-        start_time = settings_obj.start_of_day_time if settings_obj else datetime.time(6, 0)
-    except:
-        start_time = datetime.time(6, 0)
+    start_time = start_of_day_time()
 
     # Create a timestamp for Today at Start Time
     today_start = ref.replace(hour=start_time.hour, minute=start_time.minute, second=0, microsecond=0)
@@ -181,4 +141,81 @@ def get_next_token_number(station=None):
         )
         row.last += 1
         row.save(update_fields=['last'])
-        return row.last
\ No newline at end of file
+        return row.last
+
+def local_day_bounds(start_day, end_day=None):
+    """
+    [start, end) aware datetimes covering the local calendar days
+    start_day..end_day. Filtering created_at on this range keeps the
+    query on the created_at indexes; created_at__date wraps the column
+    in a function and forces a full scan.
+    """
+    end_day = end_day or start_day
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.datetime.combine(start_day, datetime.time.min), tz)
+    end = timezone.make_aware(datetime.datetime.combine(end_day + datetime.timedelta(days=1), datetime.time.min), tz)
+    return start, end
+
+
+def business_day_bounds(start_day, end_day=None):
+    """
+    [start, end) aware datetimes covering business days start_day..end_day,
+    each cut at POSSettings.start_of_day_time (see get_business_date).
+    """
+    end_day = end_day or start_day
+    tz = timezone.get_current_timezone()
+    cut = start_of_day_time()
+    start = timezone.make_aware(datetime.datetime.combine(start_day, cut), tz)
+    end = timezone.make_aware(datetime.datetime.combine(end_day + datetime.timedelta(days=1), cut), tz)
+    return start, end
+
+
+# ---------- ?from= / ?to= day ranges ----------
+
+# longest span a day-by-day report (consumption, variance, cash book) will build
+MAX_RANGE_DAYS = 92
+# how far into the future a report date may point
+MAX_DAYS_AHEAD = 366
+EARLIEST_DAY = datetime.date(1970, 1, 1)
+
+
+def parse_day(value):
+    """YYYY-MM-DD -> date, or None when missing / malformed."""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def request_day(request, name, default=None):
+    """
+    GET ?<name>=YYYY-MM-DD, else `default` (the current business date).
+    Raises BadRequest (400) for days outside EARLIEST_DAY .. today +
+    MAX_DAYS_AHEAD, so callers can step a day either way without overflowing.
+    """
+    from django.core.exceptions import BadRequest
+
+    day = parse_day(request.GET.get(name)) or default or get_business_date()
+    latest = get_business_date() + datetime.timedelta(days=MAX_DAYS_AHEAD)
+    if not EARLIEST_DAY <= day <= latest:
+        raise BadRequest(f"Pick a date between {EARLIEST_DAY} and {latest}.")
+    return day
+
+
+def request_day_range(request, default_days=7, max_days=MAX_RANGE_DAYS):
+    """
+    GET ?from=YYYY-MM-DD&to=YYYY-MM-DD -> (start, end); the last
+    `default_days` business days by default, swapped when reversed.
+    Raises BadRequest (400) for spans over `max_days` and for days outside
+    the range request_day() accepts.
+    """
+    from django.core.exceptions import BadRequest
+
+    end = request_day(request, "to")
+    start = request_day(request, "from", default=max(end - datetime.timedelta(days=default_days - 1), EARLIEST_DAY))
+    if start > end:
+        start, end = end, start
+    if (end - start).days + 1 > max_days:
+        raise BadRequest(f"Pick at most {max_days} days.")
+    return start, end
+
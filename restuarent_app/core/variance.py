@@ -0,0 +1,226 @@
+# core/variance.py
+"""
+Kitchen variance: what left the store against what sales should have used.
+
+Per raw material and business day:
+
+    net issued   = kitchen voucher issues - returns (KitchenVoucher.date)
+    theoretical  = recipe usage of everything sold (core.consumption)
+    variance     = net issued - theoretical
+
+A positive variance is stock the sales do not explain (shrinkage, waste,
+over-portioning); a negative one means the kitchen used stock it was never
+issued. All figures are in the material's own (stock) unit, the unit
+vouchers are entered in; theoretical base quantities are converted with
+the material's conversion factor (core.bom.stock_unit_factors).
+
+Closed business days are cached in VarianceDay / VarianceLine, so a month
+is one read plus a live computation of the open day. The receivers below
+drop a day when one of its vouchers or order items changes. A closed day
+keeps the BOM it was computed with; `manage.py rebuild_bom` clears the
+cache along with the BOM.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Sum, When
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from .models import (
+    BomLine, KitchenVoucher, KitchenVoucherItem, Order, OrderItem, RawMaterial,
+    VarianceDay, VarianceLine,
+)
+from .utils import get_business_date
+
+ZERO = Decimal("0")
+PLACES = Decimal("0.001")
+DEFAULT_THRESHOLD = Decimal("10")  # percent of theoretical
+DEC = DecimalField(max_digits=14, decimal_places=3)
+
+
+def last_closed_day():
+    return get_business_date() - timedelta(days=1)
+
+
+# ---------- computation ----------
+
+def _voucher_totals(start, end):
+    """{(day, rm_id): (issued, returned)} -- one grouped query."""
+    qs = (
+        KitchenVoucherItem.objects
+        .filter(voucher__date__gte=start, voucher__date__lte=end)
+        .values("voucher__date", "raw_material_id")
+        .annotate(
+            issued=Sum(Case(When(voucher__vtype=KitchenVoucher.ISSUE, then=F("quantity")), default=ZERO,
+                            output_field=DEC)),
+            returned=Sum(Case(When(voucher__vtype=KitchenVoucher.RETURN, then=F("quantity")), default=ZERO,
+                              output_field=DEC)),
+        )
+        .values_list("voucher__date", "raw_material_id", "issued", "returned")
+    )
+    return {(day, rm): (issued or ZERO, returned or ZERO) for day, rm, issued, returned in qs}
+
+
+def compute(start, end):
+    """
+    {(day, rm_id): [issued, returned, theoretical]} for business days
+    start..end, straight from vouchers and sales.
+    """
+    from .bom import stock_unit_factors
+    from .consumption import theoretical_usage
+
+    out = {key: [issued, returned, ZERO] for key, (issued, returned) in _voucher_totals(start, end).items()}
+    days, materials, usage = theoretical_usage(start, end)
+    factors = stock_unit_factors([pk for pk, _, _ in materials])
+    for (rm, _, _), row in zip(materials, usage):
+        factor = float(factors.get(rm) or 1)
+        for day, base in zip(days, row):
+            if base:
+                theoretical = Decimal(str(base / factor)).quantize(PLACES)
+                out.setdefault((day, rm), [ZERO, ZERO, ZERO])[2] = theoretical
+    return out
+
+
+# ---------- cache ----------
+
+def invalidate(days):
+    days = {d for d in days if d is not None}
+    if days:
+        VarianceDay.objects.filter(day__in=days).delete()
+
+
+def clear_snapshots():
+    VarianceDay.objects.all().delete()
+
+
+def build_snapshots(start, end):
+    """Cache every closed business day in start..end that is not cached yet. Returns days written."""
+    end = min(end, last_closed_day())
+    if start > end:
+        return 0
+    cached = set(VarianceDay.objects.filter(day__gte=start, day__lte=end).values_list("day", flat=True))
+    missing = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    missing = [d for d in missing if d not in cached]
+    if not missing:
+        return 0
+
+    values = compute(missing[0], missing[-1])
+    VarianceDay.objects.bulk_create([VarianceDay(day=d) for d in missing], ignore_conflicts=True)
+    day_ids = dict(VarianceDay.objects.filter(day__in=missing).values_list("day", "pk"))
+    VarianceLine.objects.bulk_create(
+        [
+            VarianceLine(variance_day_id=day_ids[day], raw_material_id=rm,
+                         issued=issued, returned=returned, theoretical=theoretical)
+            for (day, rm), (issued, returned, theoretical) in values.items()
+            if day in day_ids and day not in cached
+        ],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    return len(missing)
+
+
+# ---------- reads ----------
+
+def _flag(row, threshold, tracked):
+    net = row["issued"] - row["returned"]
+    theoretical = row["theoretical"]
+    variance = net - theoretical
+    pct = (variance / theoretical * 100).quantize(Decimal("0.1")) if theoretical else None
+    if pct is not None:
+        flagged = abs(pct) > threshold
+    else:
+        # issued without any sale using it -- only meaningful for recipe materials
+        flagged = row["raw_material_id"] in tracked and net > 0
+    row.update(net_issued=net, variance=variance, variance_pct=pct, flagged=flagged)
+    return row
+
+
+def daily(start, end, threshold=DEFAULT_THRESHOLD):
+    """
+    [{day, raw_material_id, name, unit, issued, returned, net_issued,
+    theoretical, variance, variance_pct, flagged}] for business days
+    start..end: closed days from the cache, the open day(s) computed live.
+    """
+    build_snapshots(start, end)
+    values = {
+        (day, rm): (issued, returned, theoretical)
+        for day, rm, issued, returned, theoretical in (
+            VarianceLine.objects.filter(variance_day__day__gte=start, variance_day__day__lte=end)
+            .values_list("variance_day__day", "raw_material_id", "issued", "returned", "theoretical")
+        )
+    }
+    first_open = last_closed_day() + timedelta(days=1)
+    if end >= first_open:
+        values.update(compute(max(start, first_open), end))
+
+    names = {pk: (name, unit) for pk, name, unit in
+             RawMaterial.objects.filter(pk__in={rm for _, rm in values}).values_list("pk", "name", "unit")}
+    tracked = set(BomLine.objects.values_list("raw_material_id", flat=True).distinct())
+    rows = []
+    for (day, rm), (issued, returned, theoretical) in values.items():
+        name, unit = names.get(rm, (f"#{rm}", ""))
+        rows.append(_flag({"day": day, "raw_material_id": rm, "name": name, "unit": unit,
+                           "issued": issued, "returned": returned, "theoretical": theoretical},
+                          threshold, tracked))
+    rows.sort(key=lambda r: (r["day"], r["name"]))
+    return rows
+
+
+def summary(rows, threshold=DEFAULT_THRESHOLD):
+    """daily() rows added up per raw material over the whole range, largest variance first."""
+    # materials issued on a day nothing sold used them keep their flag
+    tracked = {r["raw_material_id"] for r in rows if r["flagged"] and not r["theoretical"]}
+    totals = {}
+    for r in rows:
+        t = totals.setdefault(r["raw_material_id"], {
+            "raw_material_id": r["raw_material_id"], "name": r["name"], "unit": r["unit"],
+            "issued": ZERO, "returned": ZERO, "theoretical": ZERO, "flagged_days": 0,
+        })
+        t["issued"] += r["issued"]
+        t["returned"] += r["returned"]
+        t["theoretical"] += r["theoretical"]
+        t["flagged_days"] += r["flagged"]
+    out = [_flag(t, threshold, tracked) for t in totals.values()]
+    return sorted(out, key=lambda t: (-abs(t["variance"]), t["name"]))
+
+
+# ---------- invalidation receivers ----------
+
+def _voucher_before(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._variance_old_date = (KitchenVoucher.objects.filter(pk=instance.pk)
+                                       .values_list("date", flat=True).first())
+
+
+def _voucher_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate({instance.date, getattr(instance, "_variance_old_date", None)})
+
+
+def _voucher_item_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    voucher = instance._state.fields_cache.get("voucher")
+    if voucher is not None:
+        invalidate({voucher.date})
+    else:
+        invalidate({KitchenVoucher.objects.filter(pk=instance.voucher_id).values_list("date", flat=True).first()})
+
+
+def _order_item_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    order = instance._state.fields_cache.get("order")
+    created = (order.created_at if order is not None else
+               Order.objects.filter(pk=instance.order_id).values_list("created_at", flat=True).first())
+    if created is not None:
+        invalidate({get_business_date(timezone.localtime(created))})
+
+
+pre_save.connect(_voucher_before, sender=KitchenVoucher, dispatch_uid="variance_voucher_before")
+post_save.connect(_voucher_changed, sender=KitchenVoucher, dispatch_uid="variance_voucher")
+post_delete.connect(_voucher_changed, sender=KitchenVoucher, dispatch_uid="variance_voucher_gone")
+for _signal, _name in ((post_save, "item"), (post_delete, "item_gone")):
+    _signal.connect(_voucher_item_changed, sender=KitchenVoucherItem, dispatch_uid=f"variance_voucher_{_name}")
+    _signal.connect(_order_item_changed, sender=OrderItem, dispatch_uid=f"variance_order_{_name}")
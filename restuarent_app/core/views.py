@@ -12,6 +12,7 @@ from .printing import send_to_printer
 from .utils import recipe_cost_and_weight
 from django.db import transaction
 import json
+import logging
 from decimal import Decimal
 from django.db.models import Sum, F
 from django.views.generic import TemplateView
@@ -33,6 +34,12 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.http import JsonResponse 
 from .models import Customer
 
+token_logger = logging.getLogger("core.tokens")
+order_logger = logging.getLogger("core.orders")
+inventory_logger = logging.getLogger("core.inventory")
+printing_logger = logging.getLogger("core.printing")
+license_logger = logging.getLogger("core.license")
+
 # Mixin to return JSON for AJAX forms
 class AjaxableResponseMixin:
     def is_ajax(self):
@@ -94,6 +101,15 @@ class CustomerUpdateView(LoginRequiredMixin, AjaxableResponseMixin, UpdateView):
         ctx['title'] = f"Edit {self.object.name}"
         return ctx
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        # Customer.save() leaves the balance alone; a typed-in balance is
+        # posted to the ledger as an adjustment
+        if 'current_balance' in form.changed_data:
+            from .customer_ledger import set_balance
+            set_balance(self.object, form.cleaned_data['current_balance'])
+        return response
+
 class CustomerDeleteView(LoginRequiredMixin, DeleteView):
     model = Customer
     success_url = reverse_lazy('customer_list')
@@ -114,7 +130,7 @@ class LoginView(View):
         try:
             enforce_authorization(request)
         except RuntimeError as e: 
-            print(f"message: {str(e)}")
+            license_logger.warning("Login blocked: %s", e)
             return render(request, "error_not_authorized.html", {"message": str(e)})
         
         username = request.POST.get('username')
@@ -140,7 +156,8 @@ class DashboardView(View):
         except RuntimeError as e:
             return render(request, "error_not_authorized.html", {"message": str(e)})
 
-        return render(request, 'dashboard.html')
+        from .reorder import below_ids
+        return render(request, 'dashboard.html', {'low_stock_count': len(below_ids())})
     
 
 from django.urls import reverse_lazy
@@ -363,84 +380,137 @@ from decimal import Decimal
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
+import csv
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Count, Q
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from django.views.generic import ListView
 from .models import Order, Payment, Customer
+from .customer_ledger import post_order
+from .purchasing import clean_po_lines, post_po_lines
+
+def filter_orders(qs, params):
+    """Search / status / datetime-range filters shared by the list and the CSV export."""
+    q         = params.get('q')
+    status    = params.get('status')
+    date_from = params.get('date_from')
+    date_to   = params.get('date_to')
+
+    if q:
+        qs = qs.filter(number__icontains=q)
+    if status:
+        qs = qs.filter(status=status)
+
+    if date_from:
+        dt = parse_datetime(date_from)
+        if dt:
+            qs = qs.filter(created_at__gte=timezone.make_aware(dt))
+    if date_to:
+        dt = parse_datetime(date_to)
+        if dt:
+            qs = qs.filter(created_at__lte=timezone.make_aware(dt))
+    return qs
+
+
+def _encode_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.pk}"
+
+
+def _decode_cursor(raw):
+    """'<iso created_at>_<id>' -> (datetime, id), or None if malformed."""
+    try:
+        stamp, pk = raw.rsplit('_', 1)
+        dt = parse_datetime(stamp)
+        return (dt, int(pk)) if dt else None
+    except (AttributeError, ValueError):
+        return None
+
 
 class OrderListView(LoginRequiredMixin, ListView):
+    """
+    Newest-first order list with keyset pagination on (created_at, id):
+    every page is an index range scan, however far back it is, and paging
+    stays on when a date range is filtered. ?after=<cursor> pages back in
+    time, ?before=<cursor> forward. The summary cards come from one
+    aggregate over the filtered set; large ranges go to the CSV export.
+    """
     model = Order
     template_name = 'orders/order_list.html'
     context_object_name = 'orders'
-    paginate_by = 20
-
-    def get_paginate_by(self, queryset):
-        # Turn off pagination if either date filter is present
-        if self.request.GET.get('date_from') or self.request.GET.get('date_to'):
-            return None
-        return super().get_paginate_by(queryset)
+    page_size = 20
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related('table', 'created_by').order_by('-created_at')
-
-        q         = self.request.GET.get('q')
-        status    = self.request.GET.get('status')
-        date_from = self.request.GET.get('date_from')
-        date_to   = self.request.GET.get('date_to')
-
-        if q:
-            qs = qs.filter(number__icontains=q)
-        if status:
-            qs = qs.filter(status=status)
-
-        if date_from:
-            dt = parse_datetime(date_from)
-            if dt:
-                qs = qs.filter(created_at__gte=timezone.make_aware(dt))
-        if date_to:
-            dt = parse_datetime(date_to)
-            if dt:
-                qs = qs.filter(created_at__lte=timezone.make_aware(dt))
-
-        line_total = ExpressionWrapper(
-            F('items__quantity') * F('items__unit_price'),
-            output_field=DecimalField(max_digits=12, decimal_places=2)
-        )
-        qs = qs.annotate(subtotal=Sum(line_total))
-        qs = qs.annotate(
-            total_amount=ExpressionWrapper(
-                (F('subtotal') - F('discount'))
-                + (F('subtotal') * F('tax_percentage') / 100)
-                + F('service_charge'),
-                output_field=DecimalField(max_digits=12, decimal_places=2)
+        return filter_orders(super().get_queryset(), self.request.GET)
+
+    def get_page(self, qs):
+        n = self.page_size
+        after = _decode_cursor(self.request.GET.get('after'))
+        before = _decode_cursor(self.request.GET.get('before'))
+        rows = qs.select_related('table', 'waiter')
+
+        if before:
+            dt, pk = before
+            rows = list(
+                rows.filter(Q(created_at__gt=dt) | Q(created_at=dt, id__gt=pk))
+                .order_by('created_at', 'id')[:n + 1]
             )
-        )
-        return qs
+            has_prev = len(rows) > n
+            rows = rows[:n][::-1]
+            return rows, has_prev, True
+
+        rows = rows.order_by('-created_at', '-id')
+        if after:
+            dt, pk = after
+            rows = rows.filter(Q(created_at__lt=dt) | Q(created_at=dt, id__lt=pk))
+        rows = list(rows[:n + 1])
+        return rows[:n], bool(after), len(rows) > n
 
     def get_context_data(self, **kwargs):
-        ctx = super().get_context_data(**kwargs)
-        orders_list = ctx['orders']  # page or full list
+        qs = self.object_list
+        orders_list, has_prev, has_next = self.get_page(qs)
+        ctx = super().get_context_data(object_list=orders_list, **kwargs)
 
-        # serial numbering
-        if ctx.get('is_paginated'):
-            ctx['start_index'] = ctx['page_obj'].start_index()
-        else:
-            ctx['start_index'] = 1
+        # serial numbering: the first row's position is carried in ?start=
+        try:
+            start = max(int(self.request.GET.get('start', 1)), 1)
+        except ValueError:
+            start = 1
+        ctx['start_index'] = start
+        ctx['end_index']   = start + len(orders_list) - 1
 
-        # per‐page (or overall) total
+        # per-page total
         ctx['page_total'] = sum(
-            (o.total_amount or Decimal('0')) for o in orders_list
+            (o.grand_total or Decimal('0')) for o in orders_list
         )
 
-        # summary for the entire filtered set
-        full_qs = self.get_queryset()
-        ctx['summary_total_orders']  = full_qs.count()
-        ctx['summary_total_amount']  = full_qs.aggregate(
-            total=Sum(F('items__quantity') * F('items__unit_price'))
-        )['total'] or Decimal('0')
-        ctx['summary_received']      = Payment.objects.filter(
-            order__in=full_qs
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-        ctx['summary_remaining']     = ctx['summary_total_amount'] - ctx['summary_received']
+        # summary for the entire filtered set: one query (Payment is one-to-one)
+        summary = qs.aggregate(
+            n=Count('id'),
+            total=Coalesce(Sum('grand_total'), Decimal('0')),
+            received=Coalesce(Sum('payment__amount'), Decimal('0')),
+        )
+        ctx['summary_total_orders']  = summary['n']
+        ctx['summary_total_amount']  = summary['total']
+        ctx['summary_received']      = summary['received']
+        ctx['summary_remaining']     = summary['total'] - summary['received']
+
+        # prev / next links keep the filters
+        params = self.request.GET.copy()
+        for key in ('after', 'before', 'start', 'page'):
+            params.pop(key, None)
+        if orders_list and has_next:
+            nxt = params.copy()
+            nxt['after'] = _encode_cursor(orders_list[-1])
+            nxt['start'] = start + len(orders_list)
+            ctx['next_query'] = nxt.urlencode()
+        if orders_list and has_prev:
+            prv = params.copy()
+            prv['before'] = _encode_cursor(orders_list[0])
+            prv['start'] = max(start - self.page_size, 1)
+            ctx['prev_query'] = prv.urlencode()
+        ctx['is_paginated'] = bool(ctx.get('next_query') or ctx.get('prev_query'))
+        ctx['filter_query'] = params.urlencode()
 
         # keep the filters in the form
         ctx['date_from'] = self.request.GET.get('date_from', '')
@@ -448,6 +518,43 @@ class OrderListView(LoginRequiredMixin, ListView):
 
         return ctx
 
+
+class _Echo:
+    """File-like object whose write() just hands the line back (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+class OrderExportCSVView(LoginRequiredMixin, View):
+    """Streams the filtered order list as CSV, one row at a time."""
+
+    HEADER = ['Order', 'Created At', 'Table', 'Status', 'Token', 'Waiter/Rider', 'Customer',
+              'Subtotal', 'Discount', 'Tax', 'Service', 'Grand Total', 'Received', 'Payment Method']
+
+    def get(self, request):
+        qs = (
+            filter_orders(Order.objects.all(), request.GET)
+            .order_by('-created_at', '-id')
+            .values_list('number', 'created_at', 'table__number', 'status', 'token_number',
+                         'waiter__name', 'customer__name', 'subtotal', 'discount', 'tax_amount',
+                         'service_charge', 'grand_total', 'payment__amount', 'payment__method')
+        )
+        writer = csv.writer(_Echo())
+        tz = timezone.get_current_timezone()
+
+        def rows():
+            yield writer.writerow(self.HEADER)
+            for row in qs.iterator(chunk_size=2000):
+                row = list(row)
+                row[1] = timezone.localtime(row[1], tz).strftime('%Y-%m-%d %H:%M')
+                yield writer.writerow(['' if v is None else v for v in row])
+
+        stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+        response = StreamingHttpResponse(rows(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="orders-{stamp}.csv"'
+        return response
+
 import json
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseServerError
@@ -746,17 +853,17 @@ class OrderCreateView(LoginRequiredMixin, View):
             
             order_items_to_create.append(order_item)
 
-        if order_items_to_create:
-            OrderItem.objects.bulk_create(order_items_to_create)
+        with transaction.atomic():
+            if order_items_to_create:
+                OrderItem.objects.bulk_create(order_items_to_create)
+            # Persist subtotal / tax / grand total alongside the items
+            order.set_totals(total_price)
 
         # === 3. PAYMENT LOGIC (UPDATED FOR CREDIT) ===
         
-        # Calculate Grand Total for accurate Credit/Ledger math
+        # Grand Total for accurate Credit/Ledger math
         # Formula: (Subtotal - Discount) + Tax + Service
-        after_discount = total_price - discount
-        if after_discount < 0: after_discount = Decimal('0')
-        tax_amount = (after_discount * tax_percentage) / Decimal('100')
-        grand_total = after_discount + tax_amount + service_charge
+        grand_total = order.grand_total
 
         if status_value == 'paid':
             if payment_method == 'credit' and customer_obj:
@@ -764,9 +871,7 @@ class OrderCreateView(LoginRequiredMixin, View):
                 # 1. Calculate how much goes to Udhaar
                 udhaar_amount = grand_total - received_amount
                 
-                # 2. Update Customer Balance (Increase receivable)
-                customer_obj.current_balance += udhaar_amount
-                customer_obj.save()
+                # 2. Customer Balance (Increase receivable): moved by post_order below
 
                 # 3. If they paid anything partially, record that payment
                 if received_amount > 0:
@@ -777,6 +882,9 @@ class OrderCreateView(LoginRequiredMixin, View):
                         details=f"Partial payment for Credit Order. Remaining: {udhaar_amount}"
                     )
                 # Note: If received_amount is 0, no Payment record is created (pure credit).
+
+                # 4. Customer ledger entries (sale + counter payment)
+                post_order(order, received_amount)
                 
             else:
                 # --- B. Standard Payment (Cash/Card/etc) ---
@@ -840,7 +948,8 @@ class OrderCreateView(LoginRequiredMixin, View):
                     # send_to_printer(bill_data_office, printer_name=bill_printer)
 
             except Exception as e:
-                print(f"Printing Error: {e}")
+                order_logger.exception(
+                    "Printing failed for order %s", order.number, extra={"order_id": order.id})
                 return JsonResponse({
                     "message": "Order Created (Printing Failed)", 
                     "order_id": order.id,
@@ -1010,49 +1119,45 @@ class OrderUpdateView(LoginRequiredMixin, View):
 
         # 3) Diff algorithm for OrderItems (unchanged logic)
         incoming = data.get("items", [])
-        existing_map = {(oi.menu_item_id, oi.deal_id): oi for oi in order.items.all()}
+        with transaction.atomic():
+            existing_map = {(oi.menu_item_id, oi.deal_id): oi for oi in order.items.all()}
 
-        for it in incoming:
-            if it.get("type") == "menu":
-                key = (it["menu_item_id"], None)
-                m_id, d_id = it["menu_item_id"], None
-            else:
-                key = (None, it["deal_id"])
-                m_id, d_id = None, it["deal_id"]
-
-            if key in existing_map:
-                oi = existing_map.pop(key)
-                oi.quantity    = it["quantity"]
-                oi.unit_price = Decimal(str(it["unit_price"]))
-                oi.save() 
-            else:
-                OrderItem.objects.create(
-                    order=order, menu_item_id=m_id, deal_id=d_id,
-                    quantity=it["quantity"], unit_price=Decimal(str(it["unit_price"]))
-                )
+            for it in incoming:
+                if it.get("type") == "menu":
+                    key = (it["menu_item_id"], None)
+                    m_id, d_id = it["menu_item_id"], None
+                else:
+                    key = (None, it["deal_id"])
+                    m_id, d_id = None, it["deal_id"]
+
+                if key in existing_map:
+                    oi = existing_map.pop(key)
+                    oi.quantity    = it["quantity"]
+                    oi.unit_price = Decimal(str(it["unit_price"]))
+                    oi.save() 
+                else:
+                    OrderItem.objects.create(
+                        order=order, menu_item_id=m_id, deal_id=d_id,
+                        quantity=it["quantity"], unit_price=Decimal(str(it["unit_price"]))
+                    )
+
+            for oi in existing_map.values():
+                oi.delete()
 
-        for oi in existing_map.values():
-            oi.delete()
+            # Items and/or charges changed: refresh the stored totals
+            order.refresh_totals()
 
         # 4) If marking paid, Handle Payment & Printing
         if order.status == "paid":
             
-            # --- Recalculate Totals (Items might have changed) ---
-            from decimal import Decimal
-            subtotal = sum(item.quantity * item.unit_price for item in order.items.all())
-            after_disc = subtotal - order.discount
-            if after_disc < 0: after_disc = Decimal('0')
-            tax_amt = (after_disc * order.tax_percentage) / Decimal('100')
-            grand_total = after_disc + tax_amt + order.service_charge
+            grand_total = order.grand_total
 
             # --- Handle Credit / Payment Logic ---
             if payment_method == 'credit' and customer_obj:
                 # 1. Calculate Udhaar
                 udhaar_amount = grand_total - received_amount
                 
-                # 2. Update Customer Balance
-                customer_obj.current_balance += udhaar_amount
-                customer_obj.save()
+                # 2. Customer Balance: moved by post_order below
 
                 # 3. Record Partial Payment (if any)
                 if received_amount > 0:
@@ -1062,6 +1167,9 @@ class OrderUpdateView(LoginRequiredMixin, View):
                         method="cash", 
                         details=f"Partial payment for Credit Order. Remaining: {udhaar_amount}"
                     )
+
+                # 4. Customer ledger entries (sale + counter payment)
+                post_order(order, received_amount)
             else:
                 # Standard Payment
                 # Check if payment already exists (since this is update view), if not create
@@ -1122,27 +1230,11 @@ class OrderDetailView(LoginRequiredMixin, DetailView):
         ctx = super().get_context_data(**kwargs)
         order = self.object
 
-        # 1) Compute subtotal as a Decimal
-        subtotal = sum(
-            oi.quantity * oi.unit_price
-            for oi in order.items.all()
-        ) or Decimal('0')
-
-        # 2) Pull discounts, tax%, service as Decimals
-        discount       = order.discount       or Decimal('0')
-        tax_percentage = order.tax_percentage or Decimal('0')
-        service_charge = order.service_charge or Decimal('0')
-
-        # 3) Compute tax on (subtotal – discount)
-        tax_amount = (subtotal - discount) * tax_percentage / Decimal('100')
-
-        # 4) Grand total
-        grand_total = subtotal - discount + tax_amount + service_charge
-
+        # stored on the order (see Order.set_totals)
         ctx.update({
-            'subtotal':   subtotal,
-            'tax_amount': tax_amount,
-            'grand_total': grand_total,
+            'subtotal':   order.subtotal,
+            'tax_amount': order.tax_amount,
+            'grand_total': order.grand_total,
         })
         return ctx
 
@@ -1262,7 +1354,7 @@ def build_bill_bytes(order, is_food_panda = "walk_in", copy = ""):
     try:
         table_number = str(order.table.number).encode("ascii")
     except:
-        print('')
+        pass
     if table_number:
         lines.append(b"Table #: "+ table_number + b"\n")
     else:
@@ -1319,20 +1411,13 @@ def build_bill_bytes(order, is_food_panda = "walk_in", copy = ""):
 
     lines.append(b"-" * 40 + b"\n\n")
 
-    # ─── Totals section ───────────────────────────────────────────────────
-    discount_f = float(order.discount)
-    tax_perc_f = float(order.tax_percentage)
-    service_f = float(order.service_charge)
-    after_disc = subtotal - discount_f
-    tax_amt_f = after_disc * (tax_perc_f / 100.0)
-    grand_f = after_disc + tax_amt_f + service_f
-
-    lines.append(b"Subtotal : " + f"{subtotal:.2f}".encode("ascii") + b"\n")
-    lines.append(b"Discount : " + f"{discount_f:.2f}".encode("ascii") + b"\n")
-    lines.append(b"Tax (" + f"{tax_perc_f:.0f}".encode("ascii") + b"%) : " + f"{tax_amt_f:.2f}".encode("ascii") + b"\n")
-    lines.append(b"Service : " + f"{service_f:.2f}".encode("ascii") + b"\n")
+    # ─── Totals section (stored on the order, exact decimals) ─────────────
+    lines.append(b"Subtotal : " + f"{order.subtotal:.2f}".encode("ascii") + b"\n")
+    lines.append(b"Discount : " + f"{order.discount:.2f}".encode("ascii") + b"\n")
+    lines.append(b"Tax (" + f"{order.tax_percentage:.0f}".encode("ascii") + b"%) : " + f"{order.tax_amount:.2f}".encode("ascii") + b"\n")
+    lines.append(b"Service : " + f"{order.service_charge:.2f}".encode("ascii") + b"\n")
     lines.append(esc + b"\x21" + b"\x20")   # ESC ! 0x20 → double‐width
-    lines.append(b"Grand Total: " + f"{grand_f:.2f}".encode("ascii") + b"\n\n")
+    lines.append(b"Grand Total: " + f"{order.grand_total:.2f}".encode("ascii") + b"\n\n")
     lines.append(esc + b"\x45" + b"\x00")   # bold off
 
     # ─── Footer / Branding (professional signature) ───────────────────────
@@ -1427,11 +1512,13 @@ def reports_view(request):
     if end_date < start_date:
         end_date = start_date
 
-    # 2) Paid orders in the custom range
+    # 2) Paid orders in the custom range (plain range -> status/created_at index)
+    from .utils import local_day_bounds
+    range_start, range_end = local_day_bounds(start_date, end_date)
     paid_orders_in_range = Order.objects.filter(
-        created_at__date__gte=start_date,
-        created_at__date__lte=end_date,
-        status='paid'
+        status='paid',
+        created_at__gte=range_start,
+        created_at__lt=range_end,
     )
 
     # 3) Total orders in that range
@@ -1469,10 +1556,12 @@ def reports_view(request):
         d = today - timedelta(days=i)
         daily_labels.append(d.strftime("%Y-%m-%d"))
 
+        day_start, day_end = local_day_bounds(d)
         day_sum_agg = (
             OrderItem.objects
             .filter(
-                order__created_at__date=d,
+                order__created_at__gte=day_start,
+                order__created_at__lt=day_end,
                 order__status='paid'
             )
             .aggregate(day_sum=Sum(F('quantity') * F('unit_price')))
@@ -1482,10 +1571,12 @@ def reports_view(request):
         daily_data.append(float(day_sum_agg))
 
     # 7) Today's total revenue (cast to float)
+    today_start, today_end = local_day_bounds(today)
     today_revenue_agg = (
         OrderItem.objects
         .filter(
-            order__created_at__date=today,
+            order__created_at__gte=today_start,
+            order__created_at__lt=today_end,
             order__status='paid'
         )
         .aggregate(sum=Sum(F('quantity') * F('unit_price')))
@@ -1494,11 +1585,12 @@ def reports_view(request):
 
     # 8) This month's total revenue (cast to float)
     first_of_month = today.replace(day=1)
+    month_start, month_end = local_day_bounds(first_of_month, today)
     month_revenue_agg = (
         OrderItem.objects
         .filter(
-            order__created_at__date__gte=first_of_month,
-            order__created_at__date__lte=today,
+            order__created_at__gte=month_start,
+            order__created_at__lt=month_end,
             order__status='paid'
         )
         .aggregate(sum=Sum(F('quantity') * F('unit_price')))
@@ -1566,7 +1658,6 @@ def sales_report(request):
         # convert to localtime and format
         last_sold_dt = timezone.localtime(entry['last_sold'])
         formatted = last_sold_dt.strftime("%Y-%m-%d")
-        print(f"Date formate: {formatted}")
         data.append({
             'name':      entry['menu_item__name'],
             'total_qty': entry['total_qty'],
@@ -1872,27 +1963,19 @@ from django.db.models import Sum
 from .models import RawMaterial, PurchaseOrder, PurchaseOrderItem, InventoryTransaction, Expense, BankAccount, Supplier
 from .views import AjaxableResponseMixin
 
-# ----- helper: compute supplier due (across all POs) -----
+# ----- helper: supplier due (maintained payable balance, see core.party_balances) -----
 def supplier_due(supplier_id, exclude_po_id=None):
-    po_qs = PurchaseOrder.objects.filter(supplier_id=supplier_id)
-    if exclude_po_id:
-        po_qs = po_qs.exclude(pk=exclude_po_id)
-    gross = po_qs.aggregate(s=Sum('net_total'))['s'] or Decimal('0')
-
-    exp_qs = Expense.objects.filter(category='purchase', supplier_id=supplier_id)
-    if exclude_po_id:
-        exp_qs = exp_qs.exclude(purchase_order_id=exclude_po_id)
-    paid = exp_qs.aggregate(s=Sum('amount'))['s'] or Decimal('0')
-
-    return (gross - paid).quantize(Decimal('0.01'))
+    from .party_balances import supplier_payable
+    return supplier_payable(supplier_id, exclude_po_id=exclude_po_id)
 
 @require_GET
 def supplier_balance_json(request):
     try:
         supplier_id = int(request.GET.get('supplier_id', '0'))
+        exclude_po_id = int(request.GET.get('exclude_po') or 0) or None
     except ValueError:
         return HttpResponseBadRequest("Invalid supplier_id")
-    prev_due = supplier_due(supplier_id)
+    prev_due = supplier_due(supplier_id, exclude_po_id=exclude_po_id)
     return JsonResponse({'previous_due': float(prev_due)})
 
 # ----- List -----
@@ -1910,17 +1993,47 @@ class PurchaseOrderListView(LoginRequiredMixin, ListView):
         return qs
 
 # ----- Create -----
+def _posted_po_lines(request, form):
+    """Validated po_items_json lines, or None with the errors added to `form`."""
+    try:
+        data = json.loads(request.POST.get('po_items_json') or '[]')
+    except ValueError:
+        form.add_error(None, "Line items could not be read.")
+        return None
+    if not isinstance(data, list):
+        form.add_error(None, "Line items could not be read.")
+        return None
+    lines, errors = clean_po_lines(data)
+    for line_no, msg in errors:
+        form.add_error(None, f"Line {line_no}: {msg}")
+    return None if errors else lines
+
+
 class PurchaseOrderCreateView(LoginRequiredMixin, AjaxableResponseMixin, CreateView):
     model = PurchaseOrder
     fields = ['supplier']  # keep simple; we set tax/discount etc. from POST
     template_name = 'purchase_orders/purchaseorder_form.html'
     success_url = reverse_lazy('purchase_order_list')
 
+    def _reorder_supplier(self):
+        """?reorder=<supplier id>: draft the PO from that supplier's low-stock suggestions."""
+        raw = self.request.GET.get('reorder') or ''
+        return int(raw) if raw.isdigit() else None
+
+    def get_initial(self):
+        initial = super().get_initial()
+        if self._reorder_supplier():
+            initial['supplier'] = self._reorder_supplier()
+        return initial
+
     def get_context_data(self, **kwargs):
+        from .reorder import po_lines
+
         ctx = super().get_context_data(**kwargs)
         rms = RawMaterial.objects.select_related('supplier').order_by('name')
         ctx['raw_materials_json'] = json.dumps([{'pk': rm.pk, 'name': rm.name, 'unit': rm.unit} for rm in rms])
-        ctx['initial_po_items_json'] = json.dumps([])
+        supplier_id = self._reorder_supplier() if self.request.method == 'GET' else None
+        ctx['initial_po_items_json'] = json.dumps(po_lines(supplier_id) if supplier_id else [])
         ctx['bank_accounts'] = BankAccount.objects.all()
         return ctx
 
@@ -1930,29 +2043,15 @@ class PurchaseOrderCreateView(LoginRequiredMixin, AjaxableResponseMixin, CreateV
         tax_percent = Decimal(self.request.POST.get('tax_percent') or '0')
         disc_percent = Decimal(self.request.POST.get('discount_percent') or '0')
 
-        resp = super().form_valid(form)
+        # Line items: validate all of them before anything is written
+        lines = _posted_po_lines(self.request, form)
+        if lines is None:
+            return self.form_invalid(form)
 
-        # Line items
-        data = json.loads(self.request.POST.get('po_items_json', '[]'))
-        subtotal = Decimal('0')
-        for it in data:
-            qty = Decimal(str(it['quantity']))
-            up  = Decimal(str(it['unit_price']))
-            PurchaseOrderItem.objects.create(
-                purchase_order=self.object,
-                raw_material_id=int(it['raw_material_id']),
-                quantity=qty,
-                unit_price=up
-            )
-            subtotal += (qty * up)
-
-        # totals
-        self.object.tax_percent = tax_percent
-        self.object.discount_percent = disc_percent
-        self.object.recompute_totals()   # sets total_cost (subtotal) and net_total
-        # overwrite subtotal with computed one to be safe
-        self.object.total_cost = subtotal
-        self.object.save(update_fields=['total_cost', 'tax_percent', 'discount_percent', 'net_total'])
+        with transaction.atomic():
+            resp = super().form_valid(form)
+            # bulk insert + one stock-in per raw material; totals from the posted lines
+            post_po_lines(self.object, lines, tax_percent, disc_percent)
 
         # Payment (optional)
         paid_amount = Decimal(self.request.POST.get('paid_amount') or '0')
@@ -1996,27 +2095,10 @@ class PurchaseOrderUpdateView(LoginRequiredMixin, AjaxableResponseMixin, UpdateV
     # ---------- helpers ----------
     def _previous_due_with_fallback(self, supplier_id: int, exclude_po_id: int | None) -> Decimal:
         """
-        Sum all earlier POs for this supplier (excluding the one we're editing).
-        Use net_total if present; otherwise fall back to total_cost (old records).
-        Then subtract any 'purchase' expenses linked to those POs.
+        Supplier balance without the PO we're editing (and its payments).
+        Legacy POs count their total_cost when net_total was never set.
         """
-        qs = PurchaseOrder.objects.filter(supplier_id=supplier_id)
-        if exclude_po_id:
-            qs = qs.exclude(pk=exclude_po_id)
-
-        total_charges = Decimal('0')
-        for row in qs.values('id', 'net_total', 'total_cost'):
-            nt = row.get('net_total') or Decimal('0')
-            tc = row.get('total_cost') or Decimal('0')
-            total_charges += (nt if nt > 0 else tc)
-
-        po_ids = list(qs.values_list('id', flat=True))
-        paid_sum = Expense.objects.filter(
-            category='purchase',
-            purchase_order_id__in=po_ids
-        ).aggregate(s=Sum('amount'))['s'] or Decimal('0')
-
-        return total_charges - paid_sum
+        return supplier_due(supplier_id, exclude_po_id=exclude_po_id)
 
     # ---------- context ----------
     def get_context_data(self, **kwargs):
@@ -2064,48 +2146,22 @@ class PurchaseOrderUpdateView(LoginRequiredMixin, AjaxableResponseMixin, UpdateV
     def form_valid(self, form):
         """
         Keep your existing logic:
-          - Replace line items from posted JSON
+          - Reconcile line items with the posted JSON (only changed lines are
+            written; stock moves by the net change per raw material)
           - Recalculate subtotal (total_cost) on the server
         We do NOT mix in previous_due here (net_total remains pure item/tax/discount math).
         """
-        # wipe old items before saving so we re-build cleanly
-        PurchaseOrderItem.objects.filter(purchase_order=self.object).delete()
-
-        response = super().form_valid(form)
+        lines = _posted_po_lines(self.request, form)
+        if lines is None:
+            return self.form_invalid(form)
 
-        data = json.loads(self.request.POST.get('po_items_json', '[]'))
-        total = Decimal('0')
-        for it in data:
-            qty = Decimal(str(it['quantity']))
-            up = Decimal(str(it['unit_price']))
-            PurchaseOrderItem.objects.create(
-                purchase_order=self.object,
-                raw_material_id=it['raw_material_id'],
-                quantity=qty,
-                unit_price=up
-            )
-            total += qty * up
-
-        # Subtotal only (server will keep any tax/discount/net_total logic you already have elsewhere)
-        self.object.total_cost = total
-
-        # If you’re already computing net_total (tax/discount) elsewhere, keep that as-is.
-        # We intentionally do NOT add previous_due into net_total.
-        # Example (only if your model has these fields and the client posts them):
         tax_percent = Decimal(str(self.request.POST.get('tax_percent', '0') or '0'))
         discount_percent = Decimal(str(self.request.POST.get('discount_percent', '0') or '0'))
 
-        # Safe compute if those fields exist on your model; otherwise this is a no-op
-        if hasattr(self.object, 'tax_percent'):
-            self.object.tax_percent = tax_percent
-        if hasattr(self.object, 'discount_percent'):
-            self.object.discount_percent = discount_percent
-        if hasattr(self.object, 'net_total'):
-            tax_amt = (total * tax_percent) / Decimal('100')
-            disc_amt = (total * discount_percent) / Decimal('100')
-            self.object.net_total = (total + tax_amt - disc_amt)
-
-        self.object.save()
+        with transaction.atomic():
+            response = super().form_valid(form)
+            # We intentionally do NOT add previous_due into net_total.
+            post_po_lines(self.object, lines, tax_percent, discount_percent)
         return response
 
 from decimal import Decimal
@@ -2168,6 +2224,51 @@ def purchase_order_receive(request, pk):
     return JsonResponse({'status':'success'})
 
 
+class PurchaseOrderImportView(LoginRequiredMixin, TemplateView):
+    """Create a PO from a CSV / Excel sheet of lines; see core.purchasing for the columns."""
+    template_name = 'purchase_orders/purchaseorder_import.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['suppliers'] = Supplier.objects.order_by('name')
+        return ctx
+
+    def post(self, request, *args, **kwargs):
+        import csv
+        from zipfile import BadZipFile
+        from django.contrib import messages
+        from .purchasing import import_purchase_order
+
+        upload = request.FILES.get('file')
+        supplier = Supplier.objects.filter(pk=request.POST.get('supplier') or None).first()
+        if not upload or supplier is None:
+            messages.error(request, "Choose a supplier and a CSV / Excel file to import.")
+            return self.get(request, *args, **kwargs)
+        try:
+            tax_percent = Decimal(request.POST.get('tax_percent') or '0')
+            discount_percent = Decimal(request.POST.get('discount_percent') or '0')
+        except ArithmeticError:
+            messages.error(request, "Tax and discount must be numbers.")
+            return self.get(request, *args, **kwargs)
+
+        try:
+            result = import_purchase_order(upload.file, upload.name, supplier, request.user,
+                                           tax_percent, discount_percent)
+        except UnicodeDecodeError:
+            messages.error(request, "The file is not UTF-8 encoded CSV.")
+            return self.get(request, *args, **kwargs)
+        except (csv.Error, BadZipFile, ValueError):
+            inventory_logger.warning("PO import could not read %s", upload.name)
+            messages.error(request, "The file could not be read as CSV or Excel (.xlsx).")
+            return self.get(request, *args, **kwargs)
+
+        if result.errors:
+            return self.render_to_response(self.get_context_data(errors=result.errors))
+        po = result.purchase_order
+        messages.success(request, f"PO #{po.pk} created with {po.items.count()} line(s), total {po.net_total}.")
+        return redirect('purchase_order_detail', pk=po.pk)
+
+
 
 from decimal import Decimal
 from datetime import date
@@ -2191,37 +2292,37 @@ class CostReportView(LoginRequiredMixin, TemplateView):
         ctx = super().get_context_data(**kwargs)
         today = date.today()
 
-        # reuse compute_recipe_cost for menu items
-        # now uses the new weight-aware logic
+        # unit costs from the flattened BOMs (core.bom), sales in two grouped queries
+        from .bom import unit_costs
+        from .utils import local_day_bounds
+        item_costs, deal_costs = unit_costs()
+        day_start, day_end = local_day_bounds(today)
+        sold = OrderItem.objects.filter(order__created_at__gte=day_start, order__created_at__lt=day_end)
+        item_sold = dict(sold.filter(menu_item__isnull=False).values('menu_item')
+                         .annotate(q=Sum('quantity')).values_list('menu_item', 'q'))
+        deal_sold = dict(sold.filter(deal__isnull=False).values('deal')
+                         .annotate(q=Sum('quantity')).values_list('deal', 'q'))
+
         item_rows = []
-        for mi in MenuItem.objects.prefetch_related(
-                 'recipe__raw_ingredients', 'recipe__subrecipes__sub_recipe'):
-            if hasattr(mi, 'recipe'):
-                 cost = compute_recipe_cost(mi.recipe)
-            else:
-                 cost = Decimal('0')
-            sold = OrderItem.objects.filter(menu_item=mi,
-                                            order__created_at__date=today)\
-                                     .aggregate(q=Sum('quantity'))['q'] or 0
+        for pk, name in MenuItem.objects.values_list('pk', 'name'):
+            cost = item_costs.get(pk, Decimal('0')).quantize(Decimal('0.01'))
+            qty = item_sold.get(pk, 0)
             item_rows.append({
-                'name': mi.name,
+                'name': name,
                 'avg_cost_price': cost,
-                'sold_qty_today': sold,
-                'total_cost_today': cost * sold,
+                'sold_qty_today': qty,
+                'total_cost_today': cost * qty,
             })
 
         deal_rows = []
-        for dl in Deal.objects.prefetch_related('deal_items__menu_item'):
-            dcost = sum((next((r['avg_cost_price'] for r in item_rows if r['name']==di.menu_item.name), Decimal('0')) * di.quantity)
-                        for di in dl.deal_items.all())
-            sold = OrderItem.objects.filter(deal=dl,
-                                            order__created_at__date=today)\
-                                     .aggregate(q=Sum('quantity'))['q'] or 0
+        for pk, name in Deal.objects.values_list('pk', 'name'):
+            dcost = deal_costs.get(pk, Decimal('0')).quantize(Decimal('0.01'))
+            qty = deal_sold.get(pk, 0)
             deal_rows.append({
-                'name': dl.name,
+                'name': name,
                 'avg_cost_price': dcost,
-                'sold_qty_today': sold,
-                'total_cost_today': dcost * sold,
+                'sold_qty_today': qty,
+                'total_cost_today': dcost * qty,
             })
 
         ctx.update({
@@ -2251,7 +2352,52 @@ class RecipeDetailView(LoginRequiredMixin, DetailView):
 
 
 # --- Create & Update ---
-class RecipeCreateView(LoginRequiredMixin, AjaxableResponseMixin, CreateView):
+class RecipeEditorMixin:
+    """Shared by the recipe create / update views: lookup payload and line saving."""
+
+    def get_context_data(self, **kwargs):
+        from .recipes import editor_payload
+        data = super().get_context_data(**kwargs)
+        payload = editor_payload(exclude_recipe_id=getattr(self.object, 'pk', None))
+        data['raw_materials_json'] = json.dumps(payload['raw_materials'])
+        data['units_json'] = json.dumps(payload['units'])
+        # existing recipes for nesting (not this one)
+        data['recipes_json'] = json.dumps(payload['recipes'])
+        return data
+
+    def form_valid(self, form):
+        from django.core.exceptions import ValidationError
+        from .recipes import clean_lines, save_recipe_lines
+        try:
+            raw_data = json.loads(self.request.POST.get('raw_json') or '[]')
+            sub_data = json.loads(self.request.POST.get('sub_json') or '[]')
+        except ValueError:
+            form.add_error(None, "Recipe lines could not be read.")
+            return self.form_invalid(form)
+        raw_lines, sub_lines, errors = clean_lines(raw_data, sub_data)
+        for msg in errors:
+            form.add_error(None, msg)
+        if errors:
+            return self.form_invalid(form)
+
+        try:
+            with transaction.atomic():
+                response = super().form_valid(form)
+                recipe = self.object
+                save_recipe_lines(recipe, raw_lines, sub_lines)
+
+                # update menu_item.cost_price
+                mi = recipe.menu_item
+                mi.cost_price = compute_recipe_cost(recipe)
+                mi.save(update_fields=['cost_price'])
+        except ValidationError as e:
+            for msg in e.messages:
+                form.add_error(None, msg)
+            return self.form_invalid(form)
+        return response
+
+
+class RecipeCreateView(LoginRequiredMixin, RecipeEditorMixin, AjaxableResponseMixin, CreateView):
     model = Recipe
     fields = ['menu_item', 'name']
     template_name = 'recipes/recipe_form.html'
@@ -2259,61 +2405,12 @@ class RecipeCreateView(LoginRequiredMixin, AjaxableResponseMixin, CreateView):
 
     def get_context_data(self, **ctx):
         data = super().get_context_data(**ctx)
-        # raw materials
-        rms = RawMaterial.objects.order_by('name')
-        data['raw_materials_json'] = json.dumps([
-            {'pk': rm.pk, 'name': rm.name, 'unit': rm.unit}
-            for rm in rms
-        ])
-        # units
-        from .models import Unit
-        units = Unit.objects.all()
-        data['units_json'] = json.dumps([
-            {'pk': u.pk, 'symbol': u.symbol} for u in units
-        ])
-        # existing recipes for nesting
-        recs = Recipe.objects.all()
-        data['recipes_json'] = json.dumps([
-            {'pk': r.pk, 'name': r.menu_item.name} for r in recs
-        ])
         data['initial_raw'] = []
         data['initial_sub'] = []
         return data
 
-    def form_valid(self, form):
-        resp = super().form_valid(form)
-        recipe = self.object
-        # clear old if any (should be none)
-        RecipeRawMaterial.objects.filter(recipe=recipe).delete()
-        RecipeSubRecipe.objects.filter(recipe=recipe).delete()
-
-        raw_data = json.loads(self.request.POST.get('raw_json','[]'))
-        for it in raw_data:
-            RecipeRawMaterial.objects.create(
-                recipe=recipe,
-                raw_material_id=it['raw_material_id'],
-                quantity=Decimal(str(it['quantity'])),
-                unit_id=it['unit_id']
-            )
-
-        sub_data = json.loads(self.request.POST.get('sub_json','[]'))
-        for it in sub_data:
-            RecipeSubRecipe.objects.create(
-                recipe=recipe,
-                sub_recipe_id=it['sub_recipe_id'],
-                quantity=Decimal(str(it['quantity'])),
-                unit_id=it['unit_id']
-            )
-
-        # update menu_item.cost_price
-        cost = compute_recipe_cost(recipe)
-        mi = recipe.menu_item
-        mi.cost_price = cost
-        mi.save(update_fields=['cost_price'])
 
-        return resp
-
-class RecipeUpdateView(LoginRequiredMixin, AjaxableResponseMixin, UpdateView):
+class RecipeUpdateView(LoginRequiredMixin, RecipeEditorMixin, AjaxableResponseMixin, UpdateView):
     model = Recipe
     fields = ['menu_item', 'name']
     template_name = 'recipes/recipe_form.html'
@@ -2322,86 +2419,21 @@ class RecipeUpdateView(LoginRequiredMixin, AjaxableResponseMixin, UpdateView):
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
 
-        # 1) All raw materials
-        rms = RawMaterial.objects.order_by('name')
-        data['raw_materials_json'] = json.dumps([
-            {'pk': rm.pk, 'name': rm.name, 'unit': rm.unit}
-            for rm in rms
-        ])
-
-        # 2) All units
-        units = Unit.objects.all()
-        data['units_json'] = json.dumps([
-            {'pk': u.pk, 'symbol': u.symbol}
-            for u in units
+        # Existing raw‑ingredient lines, as JSON
+        data['initial_raw_json'] = json.dumps([
+            {'raw_material_id': rm_id, 'quantity': float(qty), 'unit_id': unit_id}
+            for rm_id, qty, unit_id in self.object.raw_ingredients.order_by('id')
+                                                 .values_list('raw_material_id', 'quantity', 'unit_id')
         ])
 
-        # 3) All other recipes (for nesting), excluding this one
-        recs = Recipe.objects.exclude(pk=self.object.pk)
-        data['recipes_json'] = json.dumps([
-            {'pk': r.pk, 'name': r.menu_item.name}
-            for r in recs
+        # Existing sub‑recipe lines, as JSON
+        data['initial_sub_json'] = json.dumps([
+            {'sub_recipe_id': sub_id, 'quantity': float(qty), 'unit_id': unit_id}
+            for sub_id, qty, unit_id in self.object.subrecipes.order_by('id')
+                                                .values_list('sub_recipe_id', 'quantity', 'unit_id')
         ])
-
-        # 4) Existing raw‑ingredient lines, as JSON
-        initial_raw = [
-            {
-                'raw_material_id': ri.raw_material_id,
-                'quantity': float(ri.quantity),
-                'unit_id': ri.unit_id
-            }
-            for ri in self.object.raw_ingredients.all()
-        ]
-        data['initial_raw_json'] = json.dumps(initial_raw)
-
-        # 5) Existing sub‑recipe lines, as JSON
-        initial_sub = [
-            {
-                'sub_recipe_id': sr.sub_recipe_id,
-                'quantity': float(sr.quantity),
-                'unit_id': sr.unit_id
-            }
-            for sr in self.object.subrecipes.all()
-        ]
-        data['initial_sub_json'] = json.dumps(initial_sub)
-
         return data
 
-    def form_valid(self, form):
-        # 1) Save the Recipe core fields
-        response = super().form_valid(form)
-        recipe = self.object
-
-        # 2) Wipe & recreate all raw‑material links
-        RecipeRawMaterial.objects.filter(recipe=recipe).delete()
-        raw_data = json.loads(self.request.POST.get('raw_json', '[]'))
-        for it in raw_data:
-            RecipeRawMaterial.objects.create(
-                recipe=recipe,
-                raw_material_id=it['raw_material_id'],
-                quantity=Decimal(str(it['quantity'])),
-                unit_id=it['unit_id']
-            )
-
-        # 3) Wipe & recreate all sub‑recipe links
-        RecipeSubRecipe.objects.filter(recipe=recipe).delete()
-        sub_data = json.loads(self.request.POST.get('sub_json', '[]'))
-        for it in sub_data:
-            RecipeSubRecipe.objects.create(
-                recipe=recipe,
-                sub_recipe_id=it['sub_recipe_id'],
-                quantity=Decimal(str(it['quantity'])),
-                unit_id=it['unit_id']
-            )
-
-        # 4) Recompute & store the MenuItem's cost_price
-        cost = compute_recipe_cost(recipe)
-        mi = recipe.menu_item
-        mi.cost_price = cost
-        mi.save(update_fields=['cost_price'])
-
-        return response
-
 class RecipeDeleteView(LoginRequiredMixin, AjaxableResponseMixin, DeleteView):
     model = Recipe
     success_url = reverse_lazy('recipe_list')
@@ -2472,102 +2504,43 @@ from .models import MenuItem, RawMaterialUnitConversion, PurchaseOrderItem
 getcontext().prec = 28
 
 def debug_costs(request):
-    # 1) Build conversion map: (raw_material_id, unit_symbol) -> to_base_factor
-    convs = {
-        (c.raw_material_id, c.unit.symbol): Decimal(c.to_base_factor)
-        for c in RawMaterialUnitConversion.objects.select_related('unit').all()
+    """Per menu item: its flattened BOM (core.bom) priced at the average purchase cost per base unit."""
+    from collections import defaultdict
+    from .bom import cost_per_base
+    from .models import BomLine
+
+    # average cost per **base** unit (g, ml, pcs), with the purchase totals behind it
+    prices = cost_per_base()
+    bought = {
+        rm: {'po_qty': q, 'po_line_cost': c}
+        for rm, q, c in PurchaseOrderItem.objects.values('raw_material')
+        .annotate(q=Sum('quantity'), c=Sum(F('quantity') * F('unit_price')))
+        .values_list('raw_material', 'q', 'c')
     }
 
-    # 2) Helper: average cost per **base** unit (g, ml, pcs) for a raw material
-    _cache = {}
-    def cost_per_base(rm_id):
-        if rm_id in _cache:
-            return _cache[rm_id]
-        pois = PurchaseOrderItem.objects.filter(raw_material_id=rm_id)
-        total_cost = Decimal('0')
-        total_base = Decimal('0')
-        for poi in pois:
-            q      = Decimal(poi.quantity)
-            p      = Decimal(poi.unit_price)
-            symbol = poi.raw_material.unit             # e.g. 'kg' or 'pcs'
-            factor = convs.get((rm_id, symbol), Decimal('1'))
-            total_base += q * factor
-            total_cost += q * p
-        avg = (total_cost / total_base) if total_base else Decimal('0')
-        _cache[rm_id] = avg
-        return avg
-
-    # 3) Recursive breakdown of a recipe
-    def breakdown_recipe(recipe):
-        raw_lines = []
-        for ingr in recipe.raw_ingredients.select_related('raw_material','unit').all():
-            rm        = ingr.raw_material
-            qty       = Decimal(ingr.quantity)
-            symbol    = ingr.unit.symbol
-            factor    = convs.get((rm.id, symbol), Decimal('1'))
-            base_qty  = qty * factor
-            avg_cost  = cost_per_base(rm.id)
-            line_cost = base_qty * avg_cost
-
-            # collect PO‐lines for inspection
-            po_lines = []
-            for poi in PurchaseOrderItem.objects.filter(raw_material_id=rm.id):
-                pq     = Decimal(poi.quantity)
-                pp     = Decimal(poi.unit_price)
-                pf     = convs.get((rm.id, rm.unit), Decimal('1'))
-                po_lines.append({
-                    'po_qty':            pq,
-                    'po_unit_price':     pp,
-                    'po_to_base_factor': pf,
-                    'po_base_qty':       pq * pf,
-                    'po_line_cost':      pq * pp,
-                })
-
-            raw_lines.append({
-                'name':       rm.name,
-                'unit':       symbol,
-                'recipe_qty': qty,
-                'to_base':    factor,
-                'base_qty':   base_qty,
-                'avg_cost':   avg_cost,
-                'line_cost':  line_cost,
-                'po_lines':   po_lines,
-            })
-
-        subrecipes = []
-        for sub in recipe.subrecipes.select_related('sub_recipe').all():
-            sr = sub.sub_recipe
-            detail = breakdown_recipe(sr)
-            # cost of the FULL sub‐recipe definition
-            sub_full_cost = sum(r['line_cost'] for r in detail['raw_lines'])
-            # now scale per‐gram
-            req = Decimal(sub.quantity)  # interpreted as grams
-            per_g = (sub_full_cost / sum(r['base_qty'] for r in detail['raw_lines'])
-                     ) if detail['raw_lines'] else Decimal('0')
-            subrecipes.append({
-                'name':     sr.menu_item.name,
-                'qty':      req,
-                'detail':   detail,
-                'sub_cost': (per_g * req).quantize(Decimal('0.01')),
-            })
-
-        total = sum(r['line_cost'] for r in raw_lines) \
-              + sum(s['sub_cost']    for s in subrecipes)
-        return {
-            'raw_lines':  raw_lines,
-            'subrecipes': subrecipes,
-            'total':      total.quantize(Decimal('0.01')),
-        }
+    lines = defaultdict(list)
+    for bl in (BomLine.objects.filter(menu_item__isnull=False)
+               .select_related('raw_material').order_by('raw_material__name')):
+        rm = bl.raw_material
+        avg = prices.get(rm.pk, Decimal('0'))
+        lines[bl.menu_item_id].append({
+            'name':      rm.name,
+            'unit':      rm.unit,
+            'base_qty':  bl.base_quantity,
+            'avg_cost':  avg,
+            'line_cost': bl.base_quantity * avg,
+            'bought':    bought.get(rm.pk),
+        })
 
-    # 4) Assemble per‐MenuItem
     items_debug = []
-    for mi in MenuItem.objects.select_related('recipe').all():
-        if not hasattr(mi, 'recipe'):
-            continue
-        detail = breakdown_recipe(mi.recipe)
+    for mi in MenuItem.objects.filter(recipe__isnull=False).order_by('name'):
+        raw_lines = lines.get(mi.pk, [])
         items_debug.append({
             'menu_item': mi,
-            'detail':    detail,
+            'detail': {
+                'raw_lines': raw_lines,
+                'total': sum((r['line_cost'] for r in raw_lines), Decimal('0')).quantize(Decimal('0.01')),
+            },
         })
 
     return render(request, 'debug_cost.html', {
@@ -3187,11 +3160,12 @@ class TablePrintTokenView(View):
             )
             
             # Send to printer
-            print(f"Printing {header_label} with Token {token_num}")
+            token_logger.info("Printing %s with token %s", header_label, token_num,
+                              extra={"table_id": table_id, "token": token_num})
             try:
                 send_to_printer(payload)
             except Exception as e:
-                print(f"Printer Error for {header_label}: {e}")
+                token_logger.error("Printer error for %s: %s", header_label, e)
 
         # 5. Update printed quantities for all items processed
         for ti, _ in items_with_delta:
@@ -3405,18 +3379,41 @@ class PaymentReceivedDeleteView(LoginRequiredMixin, DeleteView):
 # core/views.py
 from .printing import build_market_list_bytes
 
+class ReorderAlertsView(LoginRequiredMixin, TemplateView):
+    """Materials at or below their reorder level, grouped by supplier (core.reorder)."""
+    template_name = 'inventory/reorder_alerts.html'
+
+    def get_context_data(self, **kwargs):
+        from .reorder import COVER_DAYS, VELOCITY_DAYS, alerts, by_supplier
+
+        ctx = super().get_context_data(**kwargs)
+        ctx.update({
+            'groups': by_supplier(alerts()),
+            'velocity_days': VELOCITY_DAYS,
+            'cover_days': COVER_DAYS,
+        })
+        return ctx
+
+
 class MarketListView(LoginRequiredMixin, View):
     template_name = 'inventory/market_list.html'
 
     def get(self, request):
+        from .reorder import alerts
+
         # Fetch all raw materials to populate the search dropdown
         raw_materials = RawMaterial.objects.all().values('id', 'name', 'unit').order_by('name')
         
         # Serialize to JSON for the frontend JS
         raw_materials_json = json.dumps(list(raw_materials))
 
+        # below-reorder materials with their suggested quantities, to pre-fill the list
+        low_stock = [{'name': r['name'], 'unit': r['unit'], 'qty': float(r['suggested'])}
+                     for r in alerts() if r['suggested'] > 0]
+
         return render(request, self.template_name, {
-            'raw_materials_json': raw_materials_json
+            'raw_materials_json': raw_materials_json,
+            'low_stock_json': json.dumps(low_stock),
         })
 
     def post(self, request):
@@ -3437,5 +3434,5 @@ class MarketListView(LoginRequiredMixin, View):
             return JsonResponse({'status': 'success'})
             
         except Exception as e:
-            print(f"Market Print Error: {e}")
+            printing_logger.exception("Market list print failed")
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,4 +92,51 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
-LOGOUT_REDIRECT_URL = '/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/login/'
+
+# Request instrumentation (core.instrumentation)
+REQUEST_METRICS_BUFFER = 500   # recent requests kept in memory
+SLOW_REQUEST_MS = 1000         # log SQL of requests slower than this
+
+
+# Logging: JSON lines written by a background queue listener (core.logconfig).
+# Per-subsystem levels can be overridden with POS_LOG_<NAME>, e.g.
+# POS_LOG_PRINTING=DEBUG.
+LOG_LEVELS = {
+    name: os.environ.get(f"POS_LOG_{name.upper()}", default)
+    for name, default in {
+        'printing': 'INFO',
+        'orders': 'INFO',
+        'tokens': 'INFO',
+        'inventory': 'INFO',
+        'ledger': 'INFO',
+        'license': 'WARNING',
+        'slow_requests': 'WARNING',
+    }.items()
+}
+
+# `manage.py test` must not write to the shop's logs/pos.log
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {'class': 'logging.NullHandler'} if TESTING else {
+            'class': 'core.logconfig.QueueLogHandler',
+            'filename': str(BASE_DIR / 'logs' / 'pos.log'),
+            'console': os.environ.get('POS_LOG_CONSOLE') == '1',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['queue'],
+            'level': os.environ.get('POS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        **{f'core.{name}': {'level': level} for name, level in LOG_LEVELS.items()},
+    },
+}
+
+# Background license re-check interval (core.license_check.LicenseService)
+LICENSE_RECHECK_SECONDS = 300